@@ -1,80 +1,620 @@
-import urllib.request
 import json
 import csv
 import io
 import os
+import queue
+import sys
+import threading
 import time
+import urllib.error
+from datetime import datetime, timezone
 
-def db2_request(url, method, headers, payload=None):
+# ローカルストア (log_store, sqlite3) と並列取得のスレッドプールは、
+# sync / parallel を指定したときだけ読み込みます (コールドスタートを短くするため)
+from test_automation import http_pool, log_formats
+
+def db2_request(url, method, headers, payload=None, reauth=True):
     data = json.dumps(payload).encode('utf-8') if payload else None
     headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    with urllib.request.urlopen(req) as response:
-        return json.loads(response.read().decode('utf-8'))
-
-def main(args):
-    # 環境変数の取得
-    hostname = os.getenv("DB2_HOSTNAME")
-    userid = os.getenv("DB2_USERID")
-    password = (os.getenv("DB2_PASSWORD") or os.getenv("PASSWORD"))
-    deployment_id = os.getenv("DB2_DEPLOYMENT_ID")
-    
-    base_url = f"https://{hostname}/dbapi/v4"
+    # Keep-Alive 接続を再利用する (トークン取得・ジョブ投入・ポーリングで同じ接続を使う)
+    try:
+        with http_pool.get_pool().request(method, url, body=data, headers=headers) as response:
+            return response.json()
+    except urllib.error.HTTPError as e:
+        # ウォーム起動で再利用したトークンが失効していた場合は、取り直して1回だけ再送する。
+        # headers はページ・区間をまたいで共有しているため、以降のリクエストも新しいトークンを使う。
+        # /auth/tokens 自体の失敗 (reauth=False) では取り直さない
+        if e.code != 401 or not reauth:
+            raise
+        credentials = _token_credentials(headers.get("Authorization"))
+        if credentials is None:
+            raise
+        headers["Authorization"] = f"Bearer {get_db2_token(*credentials, refresh=True)}"
+    with http_pool.get_pool().request(method, url, body=data, headers=headers) as response:
+        return response.json()
+
+
+# DB2 の認証トークンを再利用する秒数。/auth/tokens の応答に有効期限がないため、
+# サーバー側の期限 (1時間) より短くし、期限前に 401 を受けた場合は db2_request で取り直す
+DB2_TOKEN_TTL = 1800
+
+_db2_tokens = {}
+_db2_tokens_lock = threading.Lock()
+
+
+def get_db2_token(base_url, deployment_id, userid, password, refresh=False):
+    """
+    DB2 の認証トークンを返します。接続先・ユーザーごとにモジュールレベルでキャッシュするため、
+    ウォーム起動時は /auth/tokens への問い合わせを省略します。refresh=True で取り直します。
+    """
+    key = (base_url, deployment_id, userid, password)
+    with _db2_tokens_lock:
+        cached = _db2_tokens.get(key)
+    if cached and not refresh and time.monotonic() < cached[1]:
+        return cached[0]
+    # 問い合わせはロックの外で行う (失敗時に db2_request がキャッシュを参照してもデッドロックしない)
+    auth_headers = {"Content-Type": "application/json", "x-deployment-id": deployment_id}
+    auth_payload = {"userid": userid, "password": password}
+    token = db2_request(f"{base_url}/auth/tokens", "POST", auth_headers, auth_payload, reauth=False).get("token")
+    with _db2_tokens_lock:
+        if not token:
+            _db2_tokens.pop(key, None)
+            raise RuntimeError("DB2 authentication returned no token")
+        _db2_tokens[key] = (token, time.monotonic() + DB2_TOKEN_TTL)
+    return token
+
+
+def _token_credentials(authorization):
+    # Authorization ヘッダーのトークンをキャッシュから発行した場合、その接続先・資格情報を返す
+    token = (authorization or "").removeprefix("Bearer ")
+    with _db2_tokens_lock:
+        return next((key for key, (cached, _) in _db2_tokens.items() if token and cached == token), None)
+
+
+_config = None
+
+
+def get_config():
+    """
+    環境変数の接続設定 (base_url / deployment_id / userid / password) を dict で返します。
+    ウォーム起動時は解釈済みの dict を再利用し、環境変数が変わった場合だけ読み直します。
+    """
+    global _config
+    environ = (os.getenv("DB2_HOSTNAME"), os.getenv("DB2_USERID"),
+               os.getenv("DB2_PASSWORD") or os.getenv("PASSWORD"), os.getenv("DB2_DEPLOYMENT_ID"))
+    if _config is None or _config["environ"] != environ:
+        hostname, userid, password, deployment_id = environ
+        # スキーム付き (例: ローカルのスタンドイン http://127.0.0.1:8080) の場合はそのまま使う
+        base_url = hostname if "://" in (hostname or "") else f"https://{hostname}"
+        _config = {
+            "environ": environ,
+            "base_url": f"{base_url}/dbapi/v4",
+            "deployment_id": deployment_id,
+            "userid": userid,
+            "password": password
+        }
+    return _config
+
+# WXO_LOG の列 (INSERT と同じ順)。キーセットページングで timestamp / id の位置を使う
+LOG_TABLE = '"CLD47628"."WXO_LOG"'
+LOG_COLUMNS = ["id", "garoonId", "name", "timestamp", "question", "answer", "isPositive", "categories", "text"]
+TIMESTAMP_INDEX = LOG_COLUMNS.index("timestamp")
+ID_INDEX = LOG_COLUMNS.index("id")
+
+PAGE_SIZE = 5000        # 1ジョブで取得する最大行数
+DEADLINE = 50           # 全体の待機上限 (秒)。Code Engine のタイムアウトより短くする
+POLL_INITIAL = 0.1      # ポーリング間隔の初期値 (秒)
+POLL_MAX = 2.0          # ポーリング間隔の上限 (秒)
+PREFETCH_BATCHES = 4    # 並列取得時に区間ごとに先読みするポーリング結果の数
+
+
+def sql_literal(value):
+    """
+    SQL の文字列リテラルを作ります (シングルクォートをエスケープ)。
+    """
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# ----------------------------------------------------------------------
+# 絞り込み条件と列の指定 (DB2 に渡して、必要な行・列だけを読ませる)
+# ----------------------------------------------------------------------
+
+FILTER_MAX_VALUES = 100     # garoonId / categories に指定できる値の数の上限
+FILTER_MAX_LENGTH = 256     # 値1つの最大文字数
+LIKE_ESCAPE = "'\\'"      # LIKE のパターンで % _ \ をエスケープする文字
+
+_BOOLEANS = {"1": 1, "true": 1, "yes": 1, "0": 0, "false": 0, "no": 0}
+
 
+def _values(value, name):
+    # "a,b" / ["a", "b"] のどちらでも受け取り、空でない値のリスト (重複なし) にする
+    if value is None:
+        return []
+    items = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    values = []
+    for item in items:
+        if isinstance(item, bool) or not isinstance(item, (str, int)):
+            raise ValueError(f"{name} must be a string or a list of strings")
+        text = str(item).strip()
+        if not text:
+            continue
+        # 改行・制御文字を含む値や長すぎる値は受け付けない (クォートは sql_literal でエスケープする)
+        if len(text) > FILTER_MAX_LENGTH or not text.isprintable():
+            raise ValueError(f"{name} has an invalid value")
+        values.append(text)
+    if len(values) > FILTER_MAX_VALUES:
+        raise ValueError(f"{name} accepts at most {FILTER_MAX_VALUES} values")
+    return list(dict.fromkeys(values))
+
+
+def _parse_timestamp(value, name):
     try:
-        # 1. 認証トークンの取得
-        auth_headers = {"Content-Type": "application/json", "x-deployment-id": deployment_id}
-        auth_payload = {"userid": userid, "password": password}
-        token_data = db2_request(f"{base_url}/auth/tokens", "POST", auth_headers, auth_payload)
-        token = token_data.get("token")
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or timestamp") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _timestamp_literal(parsed):
+    # 解釈し直した日時から作るため、入力の文字列は SQL に入らない
+    text = parsed.strftime("%Y-%m-%d %H:%M:%S.%f")
+    # ミリ秒までの値は WXO_LOG と同じ桁数にする (文字列で比較するローカルストアでも同じ結果になる)
+    return sql_literal(text[:-3] if text.endswith("000") else text)
+
+
+def _category_condition(category):
+    # categories は "正しくない, 未完了" のように ", " 区切りで保存されているため、要素として一致させる
+    escaped = category.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    patterns = [f"{escaped}, %", f"%, {escaped}", f"%, {escaped}, %"]
+    return "(" + " OR ".join([f'"categories" = {sql_literal(category)}']
+                             + [f'"categories" LIKE {sql_literal(pattern)} ESCAPE {LIKE_ESCAPE}'
+                                for pattern in patterns]) + ")"
+
+
+def parse_query(args):
+    """
+    args の絞り込み条件と列の指定を検証し、(列名のリスト, WHERE 条件のリスト) を返します。
+    値はすべて検証してから sql_literal でエスケープし、列名は LOG_COLUMNS の中からだけ選ぶため、
+    入力がそのまま SQL になることはありません。不正な値は ValueError を送出します。
+
+        - start / end: "timestamp" の範囲 (start 以上 end 未満, ISO 8601 の日付または日時)
+        - garoonId: いずれかに一致する行 (カンマ区切りまたは配列)
+        - categories: いずれかのカテゴリを含む行 (カンマ区切りまたは配列)
+        - isPositive: true / false
+        - columns: 返す列 (カンマ区切りまたは配列, デフォルト: 全列)
+    """
+    conditions = []
+    start = _parse_timestamp(args["start"], "start") if args.get("start") else None
+    end = _parse_timestamp(args["end"], "end") if args.get("end") else None
+    if start and end and start >= end:
+        raise ValueError("start must be earlier than end")
+    if start:
+        conditions.append(f'"timestamp" >= {_timestamp_literal(start)}')
+    if end:
+        conditions.append(f'"timestamp" < {_timestamp_literal(end)}')
+
+    garoon_ids = _values(args.get("garoonId"), "garoonId")
+    if garoon_ids:
+        conditions.append(f'"garoonId" IN ({", ".join(sql_literal(value) for value in garoon_ids)})')
+    categories = _values(args.get("categories"), "categories")
+    if categories:
+        conditions.append("(" + " OR ".join(_category_condition(category) for category in categories) + ")")
+
+    positive = args.get("isPositive")
+    if positive is not None and str(positive).strip() != "":
+        flag = _BOOLEANS.get(str(positive).strip().lower())
+        if flag is None:
+            raise ValueError("isPositive must be true or false")
+        # ローカルストアには DB2 の応答のまま (数値または文字列) 保存されるため両方と比べる
+        conditions.append(f'"isPositive" IN ({flag}, {sql_literal(flag)})')
+
+    names = {name.lower(): name for name in LOG_COLUMNS}
+    columns = []
+    for value in _values(args.get("columns"), "columns"):
+        if value.lower() not in names:
+            raise ValueError(f"unknown column '{value}' (choose from {', '.join(LOG_COLUMNS)})")
+        columns.append(names[value.lower()])
+    return list(dict.fromkeys(columns)) or list(LOG_COLUMNS), conditions
+
+
+class ExportState:
+    """
+    取得の進捗。行を返すジェネレーターが更新します。
+    """
+
+    def __init__(self):
+        self.column_names = []
+        self.complete = True
+        self.row_count = 0
+
+    def merge(self, other):
+        self.column_names = self.column_names or other.column_names
+        self.complete = self.complete and other.complete
+        self.row_count += other.row_count
+
+
+def iter_sql_job(base_url, headers, sql, limit, deadline, state):
+    """
+    SQL ジョブを投入し、完了まで指数バックオフでポーリングします。
+    ポーリングで届いた行をそのつどリストで返します (届いた分だけ保持するため、
+    結果全体をメモリに載せません)。deadline (time.monotonic の値) を過ぎた場合は
+    state.complete を False にして終了します。
+    """
+    sql_payload = {
+        "commands": sql,
+        "limit": limit,
+        "separator": ";",
+        "stop_on_error": "yes"
+    }
+    job_submit = db2_request(f"{base_url}/sql_jobs", "POST", headers, sql_payload)
+    job_id = job_submit.get("id")
+
+    delay = POLL_INITIAL
+    while True:
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        job_status = db2_request(f"{base_url}/sql_jobs/{job_id}", "GET", headers)
+        new_results = job_status.get("results", [])
+        for res in new_results:
+            if res.get("error"): raise RuntimeError(f"SQL error: {res['error']}")
+            if "columnNames" in res and not state.column_names: state.column_names = res["columnNames"]
+            if res.get("rows"): yield res["rows"]
+
+        status = job_status.get("status")
+        if status == "completed":
+            return
+        if status == "failed":
+            raise RuntimeError(f"SQL job {job_id} failed: {job_status}")
+        if time.monotonic() >= deadline:
+            state.complete = False
+            return
+        # 結果が届いている間はすぐに次を取りに行き、待ちのときだけ間隔を伸ばす
+        delay = POLL_INITIAL if new_results else min(delay * 2, POLL_MAX)
+
+
+def run_sql_job(base_url, headers, sql, limit, deadline):
+    """
+    iter_sql_job() の結果をまとめて (rows, column_names, completed) で返します。
+    """
+    state = ExportState()
+    rows = [row for batch in iter_sql_job(base_url, headers, sql, limit, deadline, state) for row in batch]
+    return rows, state.column_names, state.complete
+
 
-        # 2. SQLジョブの投入
+def _page_condition(last_row, timestamp_index=TIMESTAMP_INDEX, id_index=ID_INDEX):
+    timestamp, row_id = last_row[timestamp_index], last_row[id_index]
+    if timestamp is None:
+        return f'("timestamp" IS NULL AND "id" < {sql_literal(row_id)}) OR "timestamp" IS NOT NULL'
+    return (f'"timestamp" < {sql_literal(timestamp)}'
+            f' OR ("timestamp" = {sql_literal(timestamp)} AND "id" < {sql_literal(row_id)})')
+
+
+def iter_range(base_url, headers, page_size, deadline, state, lower=None, upper=None, upper_inclusive=True,
+               columns=LOG_COLUMNS, conditions=()):
+    """
+    "timestamp" の範囲 [lower, upper] を新しい順にキーセットページングで取得し、
+    届いた行をリスト単位で返します。1ページ = 1ジョブ (page_size 行まで) で、
+    前ページ最後の (timestamp, id) の続きから取得します。
+    columns の列だけを返し、conditions (parse_query の WHERE 条件) に合う行だけを DB2 で選びます。
+    """
+    bounds = list(conditions)
+    if lower is not None:
+        bounds.append(f'"timestamp" >= {sql_literal(lower)}')
+    if upper is not None:
+        bounds.append(f'"timestamp" {"<=" if upper_inclusive else "<"} {sql_literal(upper)}')
+
+    # ページングに使う timestamp / id は、指定されていなくても末尾に付けて取得し、返す前に外す
+    selected = list(columns) + [name for name in ("timestamp", "id") if name not in columns]
+    width = len(columns)
+    timestamp_index, id_index = selected.index("timestamp"), selected.index("id")
+    state.column_names = state.column_names or list(columns)
+    select = ", ".join(f'"{name}"' for name in selected)
+    last_row = None
+    while True:
+        page = list(bounds)
+        if last_row is not None:
+            page.append(f"({_page_condition(last_row, timestamp_index, id_index)})")
+        where = f" WHERE {' AND '.join(page)}" if page else ""
+        sql = (f'SELECT {select} FROM {LOG_TABLE}{where}'
+               f' ORDER BY "timestamp" DESC, "id" DESC FETCH FIRST {page_size} ROWS ONLY')
+        page_rows = 0
+        for batch in iter_sql_job(base_url, headers, sql, page_size, deadline, state):
+            page_rows += len(batch)
+            state.row_count += len(batch)
+            last_row = batch[-1]
+            yield batch if width == len(selected) else [row[:width] for row in batch]
+        if not state.complete or page_rows < page_size:
+            return
+        if time.monotonic() >= deadline:
+            state.complete = False
+            return
+
+
+def _time_slices(base_url, headers, parallel, deadline, conditions=()):
+    """
+    "timestamp" の最小値〜最大値 (conditions に合う行の範囲) を parallel 個の区間に分けます
+    (新しい区間から順)。
+    """
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f'SELECT MIN("timestamp"), MAX("timestamp") FROM {LOG_TABLE}{where}'
+    rows, _, _ = run_sql_job(base_url, headers, sql, 1, deadline)
+    try:
+        lowest = datetime.fromisoformat(rows[0][0])
+        highest = datetime.fromisoformat(rows[0][1])
+    except (IndexError, TypeError, ValueError):
+        # 空のテーブルや解釈できない形式の場合は分割しない
+        return [(None, None, True)]
+    step = (highest - lowest) / parallel
+    edges = [(lowest + step * i).strftime("%Y-%m-%d %H:%M:%S.%f") for i in range(1, parallel)]
+    # 両端は境界を付けず、最小値・最大値の行が丸め誤差で漏れないようにする
+    edges = [None] + edges + [None]
+    slices = [(edges[i], edges[i + 1], False) for i in range(parallel)]
+    return list(reversed(slices))
+
+
+_END = object()
+
+
+def _fill_queue(batches, out, stop):
+    # 区間の取得結果を上限付きキューに流す。読み手が止まった (stop) 場合は取得を打ち切る
+    try:
+        for batch in batches:
+            while not stop.is_set():
+                try:
+                    out.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+        item = _END
+    except Exception as e:
+        item = e
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def iter_log(base_url, headers, state, page_size=PAGE_SIZE, deadline_sec=DEADLINE, parallel=1,
+             columns=LOG_COLUMNS, conditions=()):
+    """
+    WXO_LOG 全体 (conditions を指定した場合はそれに合う行の columns の列) を
+    新しい順に取得し、届いた行をリスト単位で返します。
+    parallel > 1 の場合は期間を分割して各区間を並列に取得します。新しい区間から順に
+    返すため、後ろの区間は PREFETCH_BATCHES 件まで先読みして待機します
+    (保持する行数は parallel * PREFETCH_BATCHES 回分のポーリング結果までです)。
+    """
+    deadline = time.monotonic() + deadline_sec
+    if parallel <= 1:
+        yield from iter_range(base_url, headers, page_size, deadline, state, columns=columns, conditions=conditions)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+
+    slices = _time_slices(base_url, headers, parallel, deadline, conditions)
+    states = [ExportState() for _ in slices]
+    queues = [queue.Queue(maxsize=PREFETCH_BATCHES) for _ in slices]
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        try:
+            for (lower, upper, inclusive), slice_state, out in zip(slices, states, queues):
+                batches = iter_range(base_url, headers, page_size, deadline, slice_state, lower, upper, inclusive,
+                                     columns, conditions)
+                executor.submit(_fill_queue, batches, out, stop)
+            for slice_state, out in zip(states, queues):
+                while True:
+                    item = out.get()
+                    if item is _END:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+                state.merge(slice_state)
+        finally:
+            stop.set()
+
+
+def iter_csv(batches, state, header=True):
+    """
+    行のリストを受け取るたびに CSV 文字列に変換して返します。先頭に BOM を付けます。
+    header=False の場合は見出し行を書きません (Office Script が見出しを自分で付けるため)。
+    """
+    # Excelで開いた際の文字化けを防ぐため BOM (\ufeff) を付与
+    yield "\ufeff"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+    header_written = not header
+    for batch in batches:
+        if not header_written:
+            if state.column_names: writer.writerow(state.column_names)
+            header_written = True
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if not header_written and state.column_names:
+        writer.writerow(state.column_names)
+        yield buffer.getvalue()
+
+
+_log_store = None
+_sync_lock = threading.Lock()
+
+
+def get_log_store():
+    """
+    差分同期用のローカルストアを開きます。ウォーム起動時は同じ接続を再利用します。
+    """
+    global _log_store
+    if _log_store is None:
+        from test_automation import log_store
+        _log_store = log_store.open_store()
+    return _log_store
+
+
+def sync_log(base_url, headers, page_size=PAGE_SIZE, deadline_sec=DEADLINE, parallel=1, full=False):
+    """
+    ウォーターマーク以降の行だけを DB2 から取得してローカルストアに取り込みます。
+    取得結果は ExportState で返します。complete が False の場合は取り込んだ行は
+    保存しますが、ウォーターマークは進めません (次回取り直します)。
+    """
+    from test_automation import log_store
+    store = get_log_store()
+    state = ExportState()
+    with _sync_lock:
+        if full:
+            store.reset()
+        lower = store.fetch_from(float(os.getenv("WXO_LOG_LOOKBACK", log_store.DEFAULT_LOOKBACK)))
+        if lower is None:
+            # 初回は全件取得 (期間分割の並列取得を使う)
+            batches = iter_log(base_url, headers, state, page_size, deadline_sec, parallel)
+        else:
+            deadline = time.monotonic() + deadline_sec
+            batches = iter_range(base_url, headers, page_size, deadline, state, lower=lower)
+        # 届いた分ずつ取り込み、ウォーターマーク候補として各回の先頭 (最新) の行だけを残す
+        newest = []
+        for batch in batches:
+            store.upsert(batch)
+            newest.append(batch[0])
+        if state.complete:
+            store.advance_watermark(newest)
+    return state
+
+
+def _count_rows(batches, state):
+    for batch in batches:
+        state.row_count += len(batch)
+        yield batch
+
+
+def _is_true(value):
+    return str(value or "").lower() in ("1", "true", "yes")
+
+
+def main(args, out=None):
+    """
+    Code Engine Function のエントリーポイント。WXO_LOG を CSV で返します。
+
+    任意パラメータ:
+        - page_size: 1ジョブで取得する行数 (デフォルト: 5000)
+        - timeout: 全体の待機上限秒数 (デフォルト: 50)
+        - parallel: 期間を分割して並列に取得する数 (デフォルト: 1)
+        - sync: true の場合、前回以降の差分だけを取得してローカルストアに取り込み、
+          CSV はストアから返す (ストアのパスは環境変数 WXO_LOG_STORE)
+        - full: sync と併用し、ストアを空にして全件を取り直す
+        - start / end: "timestamp" の範囲 (start 以上 end 未満, ISO 8601 の日付または日時)
+        - garoonId / categories: いずれかに一致する / いずれかを含む行 (カンマ区切りまたは配列)
+        - isPositive: true / false
+        - columns: 返す列 (カンマ区切りまたは配列, デフォルト: 全列)
+          (絞り込みと列の指定は DB2 の SQL に入れるため、読み取り・転送量は選んだ行・列の分だけ。
+          sync の場合は DB2 からの差分取得は全件のまま、ストアから返す行・列に適用する)
+        - format: csv / jsonl / parquet / arrow (Accept ヘッダーでも指定可)。
+          形式を指定した場合は Accept-Encoding に応じて gzip / deflate で圧縮し、
+          バイナリの body は base64 で返す。指定しない場合は従来どおりの BOM 付き CSV
+          (columns も指定しない場合は見出し行なし。office_script.js が見出しを付ける)
+
+    レスポンスヘッダー X-Result-Complete が false の場合、待機上限に達したため
+    結果は途中までです。
+
+    CSV は取得したページごとに変換するため、保持する行は取得中のページ分だけです。
+    out (テキストファイル) を渡すと、形式の指定がない場合の CSV を body に載せずに
+    out へ順に書き込みます。
+    """
+    # 環境変数の取得 (ウォーム起動時は解釈済みの設定を再利用)
+    config = get_config()
+    base_url, deployment_id = config["base_url"], config["deployment_id"]
+    pool_before = http_pool.get_pool().snapshot()
+
+    try:
+        page_size = int(args.get("page_size", PAGE_SIZE))
+        deadline_sec = float(args.get("timeout", DEADLINE))
+        parallel = int(args.get("parallel", 1))
+        sync = _is_true(args.get("sync"))
+        full = _is_true(args.get("full"))
+        if page_size < 1 or deadline_sec <= 0 or parallel < 1:
+            raise ValueError
+    except (TypeError, ValueError):
+        return {"statusCode": 400, "body": "Invalid parameter: page_size / timeout / parallel must be positive numbers"}
+    try:
+        columns, conditions = parse_query(args)
+    except ValueError as e:
+        return {"statusCode": 400, "body": f"Invalid parameter: {e}"}
+    try:
+        fmt = log_formats.negotiate_format(args)
+        log_formats.check_available(fmt)
+    except log_formats.FormatError as e:
+        return {"statusCode": 406, "body": str(e)}
+    encoding = log_formats.negotiate_encoding(args) if fmt else None
+
+    try:
+        # 1. 認証トークンの取得 (ウォーム起動時はキャッシュ済みのトークンを再利用)
+        token = get_db2_token(base_url, deployment_id, config["userid"], config["password"])
+
+        # 2. SQLジョブの投入と完了待機 (ページ単位、指数バックオフでポーリング)
         common_headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json",
             "x-deployment-id": deployment_id
         }
-        sql_payload = {
-            "commands": 'SELECT * FROM "CLD47628"."WXO_LOG" ORDER BY "timestamp" DESC',
-            "limit": 5000,
-            "separator": ";",
-            "stop_on_error": "yes"
-        }
-        job_submit = db2_request(f"{base_url}/sql_jobs", "POST", common_headers, sql_payload)
-        job_id = job_submit.get("id")
-
-        # 3. ジョブ完了の待機 (ポーリング)
-        rows = []
-        column_names = []
-        for _ in range(10): # 最大10秒待機
-            time.sleep(1)
-            job_status = db2_request(f"{base_url}/sql_jobs/{job_id}", "GET", common_headers)
-            new_results = job_status.get("results", [])
-            for res in new_results:
-                if "rows" in res: rows.extend(res["rows"])
-                if "columnNames" in res and not column_names: column_names = res["columnNames"]
-            
-            if job_status.get("status") == "completed": break
-
-        # 4. CSV変換 (BOM付きUTF-8)
-        output = io.StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
-        if column_names: writer.writerow(column_names)
-        writer.writerows(rows)
-        
-        # Excelで開いた際の文字化けを防ぐため BOM (\ufeff) を付与
-        csv_body = "\ufeff" + output.getvalue()
-
-        return {
-            "statusCode": 200,
-            "headers": {
-                "Content-Type": "text/csv; charset=utf-8",
-                "Access-Control-Allow-Origin": "*",  # ← すべてのドメインからのアクセスを許可
-                "Content-Disposition": "attachment; filename=wxo_logs.csv"
-            },
-            "body": csv_body
+        fetched = None
+        if sync:
+            sync_state = sync_log(base_url, common_headers, page_size, deadline_sec, parallel, full)
+            fetched = sync_state.row_count
+            state = ExportState()
+            state.column_names = columns
+            state.complete = sync_state.complete
+            batches = _count_rows(get_log_store().iter_rows(columns=columns, conditions=conditions), state)
+        else:
+            state = ExportState()
+            state.column_names = columns
+            batches = iter_log(base_url, common_headers, state, page_size, deadline_sec, parallel, columns, conditions)
+
+        # 3. 変換 (デフォルトは BOM付きUTF-8 の CSV)。届いたページから順に変換する
+        if fmt == "jsonl":
+            chunks = log_formats.iter_jsonl(batches, columns)
+        elif fmt in log_formats.BINARY_FORMATS:
+            chunks = log_formats.iter_columnar(batches, columns, fmt)
+        else:
+            # 形式も列も指定しない場合は従来どおり見出し行なし (office_script.js が見出しを挿入する)
+            chunks = iter_csv(batches, state, header=bool(fmt) or args.get("columns") is not None)
+
+        is_base64 = bool(encoding) or fmt in log_formats.BINARY_FORMATS
+        if is_base64:
+            body = log_formats.to_base64(log_formats.encode_chunks(chunks, encoding))
+        elif out is None or fmt:
+            body = "".join(chunks)
+        else:
+            for chunk in chunks:
+                out.write(chunk)
+            body = ""
+        reuse = http_pool.reuse_summary(pool_before, http_pool.get_pool().snapshot())
+
+        filename = f"wxo_logs.{log_formats.EXTENSIONS[fmt or 'csv']}"
+        response_headers = {
+            "Content-Type": log_formats.FORMATS[fmt or "csv"],
+            "Access-Control-Allow-Origin": "*",  # ← すべてのドメインからのアクセスを許可
+            "Access-Control-Expose-Headers": "X-Result-Complete, X-Row-Count, X-Sync-Fetched",
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Vary": "Accept, Accept-Encoding",
+            "X-Result-Complete": "true" if state.complete else "false",
+            "X-Row-Count": str(state.row_count),
+            "X-Pool-Requests": str(reuse["requests"]),
+            "X-Pool-Reused": str(reuse["reused"])
         }
+        if fetched is not None:
+            response_headers["X-Sync-Fetched"] = str(fetched)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        response = {"statusCode": 200, "headers": response_headers, "body": body}
+        if is_base64:
+            response["isBase64Encoded"] = True
+        return response
 
+    except log_formats.FormatError as e:
+        return {"statusCode": 406, "body": str(e)}
     except Exception as e:
         return {"statusCode": 500, "body": str(e)}
 
@@ -82,15 +622,28 @@ def main(args):
 
 if __name__ == "__main__":
     print("17件のデータ取得を開始します...")
-    # Code Engine 用の関数を空の引数 {} で実行
-    result = main({})
-    
+    # Code Engine 用の関数を実行 (--sync でローカルストアへの差分同期、--full で全件取り直し)
+    # CSV (BOM 付き) は取得しながら同じディレクトリの一時ファイルに書き込み、成功した場合だけ
+    # log_output.csv に置き換える (失敗時は前回の log_output.csv を残す)
+    import tempfile
+    fd, temp_path = tempfile.mkstemp(prefix=".log_output.", suffix=".csv.tmp", dir=".")
+    try:
+        with open(fd, "w", encoding="utf-8", newline="") as f:
+            result = main({"sync": "--sync" in sys.argv, "full": "--full" in sys.argv}, out=f)
+        if result["statusCode"] == 200:
+            os.replace(temp_path, "log_output.csv")
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
     if result["statusCode"] == 200:
-        # 取得した CSV 文字列 (result["body"]) をファイルに保存
-        with open("log_output.csv", "w", encoding="utf-8-sig", newline="") as f:
-            f.write(result["body"])
         print("--- 成功！ ---")
-        print("ファイル 'log_output.csv' が作成されました。")
+        print(f"ファイル 'log_output.csv' が作成されました。({result['headers']['X-Row-Count']} 件)")
+        if result["headers"]["X-Result-Complete"] != "true":
+            print("注意: 待機上限に達したため、取得結果は途中までです。")
+        print(f"接続の再利用: {result['headers']['X-Pool-Reused']}/{result['headers']['X-Pool-Requests']}")
+        if "X-Sync-Fetched" in result["headers"]:
+            print(f"差分同期で取得した行: {result['headers']['X-Sync-Fetched']} 件")
     else:
         print(f"--- 失敗 (Status: {result['statusCode']}) ---")
         print(f"エラー内容: {result['body']}")
\ No newline at end of file
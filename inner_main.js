@@ -25,7 +25,8 @@ async function main(params) {
         return { statusCode: 500, body: { error: "Missing environment variables" } };
     }
 
-    const baseUrl = `https://${HOSTNAME}/dbapi/v4`;
+    // スキーム付き (例: ローカルのスタンドイン http://127.0.0.1:8080) の場合はそのまま使う
+    const baseUrl = `${String(HOSTNAME).includes("://") ? HOSTNAME : `https://${HOSTNAME}`}/dbapi/v4`;
 
     try {
         console.log("1. トークンを取得中...");
@@ -15,7 +15,8 @@ async function main(params) {
     const PASSWORD = process.env.DB2_PASSWORD;
     const DEPLOYMENT_ID = process.env.DB2_DEPLOYMENT_ID;
 
-    const baseUrl = `https://${HOSTNAME}/dbapi/v4`;
+    // スキーム付き (例: ローカルのスタンドイン http://127.0.0.1:8080) の場合はそのまま使う
+    const baseUrl = `${String(HOSTNAME).includes("://") ? HOSTNAME : `https://${HOSTNAME}`}/dbapi/v4`;
 
     try {
         // 3. DB2 アクセストークンの取得
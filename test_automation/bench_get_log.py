@@ -0,0 +1,106 @@
+"""
+WXO Test Automation - get_log_from_db2 Memory Benchmark
+
+ローカルのスタンドインサーバー (mock_server.py) に指定行数の WXO_LOG を用意し、
+get_log_from_db2.main のピークメモリ (tracemalloc) と所要時間を行数ごとに計測して
+JSON で出力します。
+
+    - body: Code Engine と同じく CSV 全体を body 文字列として返す場合
+    - stream: CSV をファイル (out) に順に書き込む場合 (行数によらずほぼ一定になるはず)
+
+Usage:
+    python3 bench_get_log.py --rows 1000,10000,50000
+    python3 bench_get_log.py --rows 20000 --page-size 2000 --parallel 4 --output bench_get_log.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from mock_server import env_for, start_mock_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import get_log_from_db2  # noqa: E402
+
+
+def measure(args, out=None):
+    """
+    main() を1回実行し、(ピークメモリ, 所要時間, レスポンス) を返します。
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = get_log_from_db2.main(args, out=out)
+    finally:
+        elapsed = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak_memory, elapsed, result
+
+
+def run_benchmark(row_counts, page_size, parallel, page_rows):
+    """
+    行数ごとに body / stream の両方を計測し、結果の dict のリストを返します。
+    """
+    reports = []
+    for rows in row_counts:
+        server, base_url = start_mock_server([
+            "--db2-rows", str(rows), "--db2-page-rows", str(page_rows),
+            "--db2-job-time", "fixed:0", "--db2-latency", "fixed:0"
+        ])
+        os.environ.update(env_for(base_url))
+        args = {"page_size": page_size, "parallel": parallel, "timeout": 600}
+        try:
+            body_peak, body_time, result = measure(args)
+            body_bytes = len(result.get("body", "").encode("utf-8"))
+            with open(os.devnull, "w", encoding="utf-8") as devnull:
+                stream_peak, stream_time, stream_result = measure(args, out=devnull)
+        finally:
+            server.shutdown()
+            server.server_close()
+        reports.append({
+            "rows": rows,
+            "row_count": int(stream_result["headers"]["X-Row-Count"]) if stream_result["statusCode"] == 200 else None,
+            "csv_bytes": body_bytes,
+            "body_peak_memory_bytes": body_peak,
+            "body_time_sec": round(body_time, 3),
+            "stream_peak_memory_bytes": stream_peak,
+            "stream_time_sec": round(stream_time, 3)
+        })
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get_log_from_db2 memory benchmark")
+    parser.add_argument("--rows", default="1000,10000,50000",
+                        help="comma separated WXO_LOG row counts (default: 1000,10000,50000)")
+    parser.add_argument("--page-size", type=int, default=5000, help="rows per SQL job (default: 5000)")
+    parser.add_argument("--parallel", type=int, default=1, help="time slices fetched in parallel (default: 1)")
+    parser.add_argument("--page-rows", type=int, default=1000,
+                        help="rows the stand-in returns per job poll (default: 1000)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    os.environ.update({"DB2_USERID": "stub-user", "DB2_PASSWORD": "stub-password", "DB2_DEPLOYMENT_ID": "stub"})
+    row_counts = [int(value) for value in args.rows.split(",") if value.strip()]
+    report = {
+        "page_size": args.page_size,
+        "parallel": args.parallel,
+        "results": run_benchmark(row_counts, args.page_size, args.parallel, args.page_rows),
+        "python": platform.python_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds")
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+WXO Test Automation - Benchmark
+
+wxo_test_auto_local.process_csv または wxo_test_auto_ce.main に指定数の質問を
+指定の並列数で流し、スループット・レイテンシ (p50/p95/p99)・エラー率・
+ピークメモリを計測して JSON で出力します。バージョン間の比較に使います。
+
+Usage:
+    python3 bench_runner.py --target local --questions 500 --concurrency 32 --stub
+    python3 bench_runner.py --target ce --questions 200 --concurrency 16 --output bench_ce.json
+
+--stub を付けると、ローカルのスタンドインサーバー (mock_server.py) を
+起動して接続先を切り替えるため、ネットワークなし (CI) でも実行できます。
+付けない場合は .env / 環境変数の接続先 (WXO_API_HOST など) に送信します。
+"""
+
+import argparse
+import csv
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from mock_server import env_for, start_mock_server
+from request_trace import percentile
+
+
+def start_stub(latency):
+    """
+    ローカルのスタンドインサーバー (mock_server) を起動し、接続先の環境変数を設定します。
+    """
+    server, base_url = start_mock_server(["--wxo-latency", f"fixed:{latency}", "--iam-latency", "fixed:0"])
+    os.environ.update(env_for(base_url))
+    os.environ.update({
+        "IBM_CLOUD_API_KEY": "stub-api-key",
+        "WXO_INSTANCE_ID": "stub-instance",
+        "WXO_AGENT_ID": "stub-agent"
+    })
+    return server
+
+
+def make_questions(count, input_file=None):
+    """
+    ベンチマーク用の質問を count 件作ります。input_file があればその質問を巡回して使います
+    (キャッシュや重複排除が効かないよう、連番を付けて一意にします)。
+    """
+    seeds = []
+    if input_file:
+        with open(input_file, "r", encoding="utf-8") as f:
+            seeds = [row[0].strip() for row in list(csv.reader(f))[1:] if row and row[0].strip()]
+    seeds = seeds or ["契約書の確認手順を教えてください"]
+    return [f"{seeds[i % len(seeds)]} (#{i + 1})" for i in range(count)]
+
+
+def _timed(func, latencies, lock):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with lock:
+                latencies.append(time.perf_counter() - started)
+    return wrapper
+
+
+def run_local(questions, concurrency, stream):
+    """
+    process_csv を一時ファイル経由で実行し、結果のステータス一覧を返します。
+    """
+    import wxo_test_auto_local as runner
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_file = os.path.join(workdir, "questions.csv")
+        output_file = os.path.join(workdir, "results.csv")
+        with open(input_file, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Question"])
+            writer.writerows([question] for question in questions)
+        runner.process_csv(input_file, output_file, concurrency=concurrency, stream=stream)
+        with open(output_file, "r", encoding="utf-8", newline="") as f:
+            return [row["Status"] for row in csv.DictReader(f)]
+
+
+def run_ce(questions, concurrency, stream):
+    """
+    Code Engine の main() を直接呼び出し、結果のステータス一覧を返します。
+    """
+    import wxo_test_auto_ce as runner
+
+    result = runner.main({
+        "agent_id": os.getenv("WXO_AGENT_ID", "stub-agent"),
+        "questions": questions,
+        "concurrency": concurrency,
+        "stream": stream,
+        "no_cache": True
+    })
+    if result["statusCode"] != 200:
+        return [f"Error: {result['body']}"] * len(questions)
+    return [row["Status"] for row in csv.DictReader(io.StringIO(result["body"].lstrip("\ufeff")))]
+
+
+def run_benchmark(target, questions, concurrency, stream=False):
+    """
+    ベンチマークを1回実行し、計測結果の dict を返します。
+    """
+    module = __import__("wxo_test_auto_local" if target == "local" else "wxo_test_auto_ce")
+    latencies = []
+    lock = threading.Lock()
+    originals = {name: getattr(module, name) for name in ("send_chat_message", "send_chat_message_stream")}
+    for name, func in originals.items():
+        setattr(module, name, _timed(func, latencies, lock))
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            statuses = (run_local if target == "local" else run_ce)(questions, concurrency, stream)
+    finally:
+        wall_time = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for name, func in originals.items():
+            setattr(module, name, func)
+
+    latencies.sort()
+    errors = sum(1 for status in statuses if status not in ("Success", "Skipped"))
+    return {
+        "target": target,
+        "questions": len(questions),
+        "concurrency": concurrency,
+        "stream": stream,
+        "wall_time_sec": round(wall_time, 3),
+        "throughput_per_min": round(len(questions) / wall_time * 60, 1) if wall_time else None,
+        "latency_sec": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "max": latencies[-1] if latencies else None
+        },
+        "errors": errors,
+        "error_rate": errors / len(statuses) if statuses else None,
+        "peak_memory_bytes": peak_memory,
+        "python": platform.python_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WXO Test Automation benchmark")
+    parser.add_argument("--target", choices=["local", "ce"], default="local",
+                        help="runner to benchmark (default: local)")
+    parser.add_argument("--questions", type=int, default=100, help="number of questions (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=8, help="questions in flight (default: 8)")
+    parser.add_argument("--stream", action="store_true", help="use the streaming (SSE) mode")
+    parser.add_argument("--input", help="CSV whose first column seeds the question texts")
+    parser.add_argument("--stub", action="store_true", help="run against a local stand-in server")
+    parser.add_argument("--stub-latency", type=float, default=0.05,
+                        help="stand-in response latency in seconds (default: 0.05)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.stub:
+        start_stub(args.stub_latency)
+    else:
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    report = run_benchmark(args.target, make_questions(args.questions, args.input), args.concurrency, args.stream)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if report["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
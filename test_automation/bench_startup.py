@@ -0,0 +1,179 @@
+"""
+WXO Test Automation - Startup Benchmark
+
+Code Engine Function として動く wxo_test_auto_ce.py と get_log_from_db2.py の
+コールドスタートを計測し、JSON で出力します。各回とも新しいプロセスで
+
+    - import_sec: モジュールの import にかかった時間
+    - first_sec: import 直後の1回目の main() (コールド: トークン取得・接続確立を含む)
+    - warm_sec: 同じプロセスでの2回目以降の main() の中央値 (ウォーム: トークン・接続を再利用)
+    - process_sec: インタープリターの起動から終了までの時間
+
+を計測し、--repeat 回の中央値と最大値をまとめます。接続先はローカルのスタンドイン
+サーバー (mock_server.py) です。
+
+ホットパスで読み込まないはずのモジュール (LAZY_MODULES) が import 時に読み込まれていた場合や、
+--max-import-ms / --max-first-ms を超えた場合は regressions に記録して終了コード 1 で終わります。
+
+Usage:
+    python3 bench_startup.py
+    python3 bench_startup.py --target ce --repeat 10 --max-import-ms 150 --output bench_startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from mock_server import env_for, start_mock_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# 対象ごとの import するモジュール、main() の引数、import 時に読み込まれていてはいけないモジュール
+TARGETS = {
+    "ce": {
+        "module": "wxo_test_auto_ce",
+        "args": {"agent_id": "stub-agent", "questions": ["起動時間の計測"], "no_cache": True},
+        "lazy": ["job_store", "sse", "uuid"]
+    },
+    "get_log": {
+        "module": "get_log_from_db2",
+        "args": {"page_size": 1000},
+        "lazy": ["test_automation.log_store", "sqlite3", "concurrent.futures"]
+    }
+}
+
+# 子プロセスで実行するコード。計測対象以外のモジュールを読み込まないよう標準ライブラリの
+# sys / time / json だけを使う
+CHILD = """
+import json, sys, time
+sys.path[:0] = {paths!r}
+started = time.perf_counter()
+module = __import__({module!r})
+imported = time.perf_counter()
+loaded = [name for name in {lazy!r} if name in sys.modules]
+first = module.main({args!r})
+first_done = time.perf_counter()
+warm = []
+for _ in range({warm!r}):
+    before = time.perf_counter()
+    result = module.main({args!r})
+    warm.append(time.perf_counter() - before)
+print(json.dumps({{
+    "import_sec": imported - started,
+    "first_sec": first_done - imported,
+    "warm_sec": sorted(warm)[len(warm) // 2] if warm else None,
+    "status": [first["statusCode"]] + ([result["statusCode"]] if warm else []),
+    "eager_modules": loaded
+}}))
+"""
+
+
+def run_once(target, warm, env):
+    """
+    新しいプロセスで対象を1回計測し、計測値の dict を返します。
+    """
+    spec = TARGETS[target]
+    code = CHILD.format(paths=[HERE, ROOT], module=spec["module"], lazy=spec["lazy"],
+                        args=spec["args"], warm=warm)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", code], env=env, cwd=HERE,
+                               capture_output=True, text=True, timeout=120)
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"{target} failed: {completed.stderr.strip()}")
+    sample = json.loads(completed.stdout.strip().splitlines()[-1])
+    sample["process_sec"] = elapsed
+    return sample
+
+
+def _stats(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {"median": round(statistics.median(values), 4), "max": round(max(values), 4)}
+
+
+def run_benchmark(target, repeat, warm, env):
+    """
+    対象を repeat 回計測し、集計結果の dict を返します。
+    """
+    samples = [run_once(target, warm, env) for _ in range(repeat)]
+    report = {"target": target, "repeat": repeat}
+    for name in ("import_sec", "first_sec", "warm_sec", "process_sec"):
+        report[name] = _stats([sample[name] for sample in samples])
+    if report["first_sec"] and report["warm_sec"] and report["warm_sec"]["median"]:
+        report["cold_warm_ratio"] = round(report["first_sec"]["median"] / report["warm_sec"]["median"], 2)
+    report["errors"] = sum(1 for sample in samples for status in sample["status"] if status != 200)
+    report["eager_modules"] = sorted({name for sample in samples for name in sample["eager_modules"]})
+    return report
+
+
+def find_regressions(report, max_import_ms=None, max_first_ms=None):
+    """
+    計測結果から回帰 (読み込まれた遅延モジュール、予算超過、エラー) の説明のリストを返します。
+    """
+    regressions = [f"{report['target']}: {name} is imported eagerly" for name in report["eager_modules"]]
+    if report["errors"]:
+        regressions.append(f"{report['target']}: {report['errors']} invocations did not return 200")
+    for name, budget in (("import_sec", max_import_ms), ("first_sec", max_first_ms)):
+        if budget is not None and report[name]["median"] * 1000 > budget:
+            regressions.append(f"{report['target']}: {name} median "
+                               f"{report[name]['median'] * 1000:.1f} ms exceeds {budget} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Code Engine cold start benchmark")
+    parser.add_argument("--target", choices=["all"] + list(TARGETS), default="all",
+                        help="function to benchmark (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes per target (default: 5)")
+    parser.add_argument("--warm", type=int, default=3, help="warm invocations per process (default: 3)")
+    parser.add_argument("--max-import-ms", type=float, help="fail when the median import time exceeds this")
+    parser.add_argument("--max-first-ms", type=float,
+                        help="fail when the median first-invocation latency exceeds this")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server([
+        "--wxo-latency", "fixed:0", "--iam-latency", "fixed:0", "--db2-rows", "100",
+        "--db2-job-time", "fixed:0", "--db2-latency", "fixed:0"
+    ])
+    env = {
+        **os.environ, **env_for(base_url),
+        "IBM_CLOUD_API_KEY": "stub-key", "WXO_INSTANCE_ID": "stub-instance",
+        "DB2_USERID": "stub-user", "DB2_PASSWORD": "stub-password", "DB2_DEPLOYMENT_ID": "stub",
+        "IAM_TOKEN_CACHE": ""
+    }
+    try:
+        targets = list(TARGETS) if args.target == "all" else [args.target]
+        results = [run_benchmark(target, args.repeat, args.warm, env) for target in targets]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    regressions = [message for result in results
+                   for message in find_regressions(result, args.max_import_ms, args.max_first_ms)]
+    report = {
+        "results": results,
+        "regressions": regressions,
+        "python": platform.python_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds")
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
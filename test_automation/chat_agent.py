@@ -2,41 +2,31 @@ import os
 import requests
 from dotenv import load_dotenv
 
+import token_provider
+
 # Load environment variables
 load_dotenv()
 
 def get_access_token():
     """
     Retrieves an IAM access token from IBM Cloud.
+    Set IAM_TOKEN_CACHE to a file path to reuse the token across runs.
     """
-    url = "https://iam.cloud.ibm.com/identity/token"
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "application/json"
-    }
-    
     api_key = os.getenv("IBM_CLOUD_API_KEY")
     
-    data = {
-        "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
-        "apikey": api_key
-    }
-    
     # Check if API Key is present
     if not api_key:
         print("Error: IBM_CLOUD_API_KEY is not set in .env file.")
         return None
 
     try:
-        response = requests.post(url, headers=headers, data=data)
-        response.raise_for_status()
-        token_data = response.json()
+        token = token_provider.get_access_token(api_key)
         print("Access Token retrieved successfully.")
-        return token_data.get("access_token")
-    except requests.exceptions.RequestException as e:
+        return token
+    except (OSError, ValueError) as e:
         print(f"Error retrieving access token: {e}")
-        if 'response' in locals() and response is not None:
-             print(f"Response: {response.text}")
+        if hasattr(e, "read"):
+            print(f"Response: {e.read().decode('utf-8', 'replace')}")
         return None
 
 def send_chat_message(token, message_content):
@@ -51,7 +41,8 @@ def send_chat_message(token, message_content):
         print("Error: WXO_INSTANCE_ID or WXO_AGENT_ID is not set in .env file.")
         return None
 
-    url = f"https://{api_host}/instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions"
+    base_url = api_host if "://" in api_host else f"https://{api_host}"
+    url = f"{base_url}/instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions"
     
     headers = {
         "Authorization": f"Bearer {token}",
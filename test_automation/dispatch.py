@@ -0,0 +1,203 @@
+"""
+WXO Test Automation - Dispatch Engine
+
+質問リストを asyncio で並列にエージェントへ送信するための共通エンジンです。
+ローカル実行用 (wxo_test_auto_local.py) と Code Engine 用 (wxo_test_auto_ce.py)
+の両方から利用します。
+
+    results = run_dispatch(questions, worker, concurrency=32, rps=10)
+
+worker は (index, item) を受け取って結果を返すブロッキング関数です。
+スレッドプール上で実行され、結果は入力順のリストで返されます。
+worker は例外を送出せず、エラーも結果として返してください。
+
+controller に AIMDController を渡すと、worker 内で report_throttle() /
+report_success() が報告されるたびに同時実行数を増減します (AIMD)。
+スロットリング (429 など) が始まると同時実行数を半分に下げ、成功が続くと
+1ずつ concurrency まで戻します。worker は上限の枠を取得してから実行され、
+再送を待つ間は idle() で枠を他の worker に譲ります。
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class RateLimiter:
+    """
+    1秒あたりのリクエスト数 (rps) を制限する簡易レートリミッタ。
+    rps が None または 0 の場合は制限しません。
+    """
+
+    def __init__(self, rps=None):
+        self.interval = 1.0 / rps if rps else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AIMDController:
+    """
+    同時実行数の上限を加算増加・乗算減少 (AIMD) で調整します。スレッドセーフです。
+
+    - on_throttle(sent_at): 上限を decrease 倍に下げる (前回下げる前に送信したリクエストの
+      報告は古い上限での結果なので数えるだけにする)
+    - on_success(): 上限を 1/上限 ずつ上げる (上限の件数だけ成功すると +1)
+    - acquire() / release(): 実行中の件数が上限未満になるまで待って枠を取得・返却する
+    """
+
+    def __init__(self, max_limit, min_limit=1, decrease=0.5):
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.decrease = decrease
+        self.throttled = 0
+        self.lowest = self.max_limit
+        self._limit = float(self.max_limit)
+        self._last_decrease = float("-inf")
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def on_throttle(self, sent_at=None):
+        with self._cond:
+            self.throttled += 1
+            if sent_at is not None and sent_at < self._last_decrease:
+                return
+            self._last_decrease = time.monotonic()
+            self._limit = max(float(self.min_limit), self._limit * self.decrease)
+            self.lowest = min(self.lowest, int(self._limit))
+
+    def on_success(self):
+        with self._cond:
+            before = self.limit
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+            if self.limit > before:
+                self._cond.notify_all()
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+
+_worker_local = threading.local()
+
+
+def report_throttle(sent_at=None):
+    """
+    worker 内から、スロットリングを受けたことを実行中の controller に報告します。
+    sent_at にはそのリクエストを送信した時刻 (time.monotonic()) を渡します。
+    """
+    controller = getattr(_worker_local, "controller", None)
+    if controller is not None:
+        controller.on_throttle(sent_at)
+
+
+def report_success():
+    """
+    worker 内から、リクエストが成功したことを実行中の controller に報告します。
+    """
+    controller = getattr(_worker_local, "controller", None)
+    if controller is not None:
+        controller.on_success()
+
+
+@contextmanager
+def idle():
+    """
+    worker 内で待機する間 (再送前のバックオフなど)、同時実行数の枠を他の worker に譲ります。
+    ブロックを抜けるときに枠を取り直すため、待機中に下がった上限にも従います。
+    """
+    controller = getattr(_worker_local, "controller", None)
+    if controller is None:
+        yield
+        return
+    controller.release()
+    try:
+        yield
+    finally:
+        controller.acquire()
+
+
+def _run_worker(controller, worker, idx, item):
+    if controller is None:
+        return worker(idx, item)
+    controller.acquire()
+    _worker_local.controller = controller
+    try:
+        return worker(idx, item)
+    finally:
+        _worker_local.controller = None
+        controller.release()
+
+
+async def dispatch(items, worker, concurrency=1, rps=None, on_result=None, collect=True, controller=None):
+    """
+    items の各要素を worker で並列処理し、入力順の結果リストを返します。
+
+    - concurrency: 同時に処理するリクエスト数の上限
+    - rps: 1秒あたりの送信数の上限 (None で無制限)
+    - on_result: 完了するたびに (index, result) で呼ばれるコールバック (完了順)
+    - collect: False の場合は結果を保持せず None を返す (on_result で逐次処理する場合)
+    - controller: AIMDController (同時実行数を concurrency 以下で動的に調整する場合)
+    """
+    concurrency = max(1, int(concurrency))
+    loop = asyncio.get_running_loop()
+    limiter = RateLimiter(rps)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    tasks = set()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def run_one(idx, item):
+            try:
+                await limiter.acquire()
+                result = await loop.run_in_executor(executor, _run_worker, controller, worker, idx, item)
+                if collect:
+                    results[idx] = result
+                if on_result:
+                    on_result(idx, result)
+            finally:
+                semaphore.release()
+
+        # セマフォを取得してからタスクを作るため、入力は必要な分だけ読み進めます
+        for idx, item in enumerate(items):
+            await semaphore.acquire()
+            task = asyncio.create_task(run_one(idx, item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    if not collect:
+        return None
+    return [results[idx] for idx in range(len(results))]
+
+
+def run_dispatch(items, worker, concurrency=1, rps=None, on_result=None, collect=True, controller=None):
+    """
+    dispatch() の同期版。イベントループを起動して完了まで待機します。
+    """
+    return asyncio.run(dispatch(items, worker, concurrency, rps, on_result, collect, controller))
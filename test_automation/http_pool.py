@@ -0,0 +1,270 @@
+"""
+WXO Test Automation - HTTP Connection Pool
+
+http.client をベースにした Keep-Alive 対応のコネクションプールです。
+ホストごとに接続を再利用し、質問ごと・ポーリングごとの TCP/TLS
+ハンドシェイクを省略します。標準ライブラリのみで動作します。
+
+    pool = get_pool()
+    with pool.request("POST", url, body=data, headers=headers) as response:
+        result = response.json()
+
+ステータスコードが 400 以上の場合は urllib.request.urlopen と同様に
+urllib.error.HTTPError を送出します。
+
+request_trace.start() で計測を有効にしたスレッドでは、DNS 解決・TCP 接続・
+TLS ハンドシェイク・応答待ち・本文の読み取りの時間と送受信バイト数を記録します
+(無効なときは記録処理を行いません)。
+
+チューニング用の環境変数:
+    - HTTP_POOL_SIZE: ホストごとに保持するアイドル接続数 (デフォルト: 10)
+    - HTTP_TIMEOUT: 接続・読み取りのタイムアウト秒数 (デフォルト: 120)
+"""
+
+import http.client
+import io
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 120.0
+
+# 再利用した接続がサーバー側で既に閉じられていた場合に発生する例外
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 ConnectionResetError, BrokenPipeError)
+
+# 計測中のスレッドの記録先 (request_trace.start() が設定する dict)
+_trace_local = threading.local()
+
+
+def set_trace(trace):
+    """
+    現在のスレッドの計測の記録先を設定します。None で計測を止めます。
+    """
+    _trace_local.trace = trace
+
+
+def current_trace():
+    return getattr(_trace_local, "trace", None)
+
+
+def _add(trace, name, value):
+    trace[name] = trace.get(name, 0) + value
+
+
+class PooledResponse:
+    """
+    プールから取得した接続のレスポンス。
+    本文を読み終えるか close() すると接続はプールに返却されます。
+    """
+
+    def __init__(self, pool, key, conn, response, trace=None):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._trace = trace
+        self._started = time.perf_counter() if trace is not None else None
+        self._received = 0
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self):
+        try:
+            data = self._response.read()
+            self._received += len(data)
+            return data
+        finally:
+            self.close()
+
+    def json(self):
+        return json.loads(self.read().decode("utf-8"))
+
+    def iter_lines(self):
+        """
+        本文を1行ずつ (改行を除いた str として) 返します。ストリーミング応答用。
+        """
+        try:
+            while True:
+                line = self._response.readline()
+                if not line:
+                    break
+                self._received += len(line)
+                yield line.decode("utf-8").rstrip("\r\n")
+        finally:
+            self.close()
+
+    def close(self):
+        if self._trace is not None:
+            _add(self._trace, "ReadTime", time.perf_counter() - self._started)
+            _add(self._trace, "ResponseBytes", self._received)
+            self._trace = None
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._release(self._key, conn)
+        else:
+            # 読み残しがある接続は再利用できないため破棄する
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HTTPPool:
+    """
+    ホスト (scheme, host, port) ごとにアイドル接続を保持するコネクションプール。
+    スレッドセーフです。
+    """
+
+    def __init__(self, max_per_host=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+        self.stats = {"requests": 0, "reused": 0, "new": 0}
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        リクエストを送信し PooledResponse を返します。
+        """
+        parsed = urllib.parse.urlsplit(url)
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        trace = current_trace()
+        conn, reused = self._acquire(key)
+        try:
+            response = self._send(conn, key, reused, method, path, body, headers, trace)
+        except _STALE_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+            # アイドル中に切断された接続だったので、新しい接続で1回だけ再送する
+            conn, reused = self._connect(key), False
+            try:
+                response = self._send(conn, key, reused, method, path, body, headers, trace)
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["reused" if reused else "new"] += 1
+
+        pooled = PooledResponse(self, key, conn, response, trace)
+        if pooled.status >= 400:
+            data = pooled.read()
+            raise urllib.error.HTTPError(url, pooled.status, pooled.reason, pooled.headers, io.BytesIO(data))
+        return pooled
+
+    def _send(self, conn, key, reused, method, path, body, headers, trace):
+        if trace is None:
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn.getresponse()
+        # 計測あり: 新しい接続は DNS / TCP / TLS を分けて接続してから送信する
+        if not reused:
+            self._open_traced(conn, key, trace)
+        trace["ConnectionReused"] = 1 if reused else 0
+        _add(trace, "RequestBytes", len(body or b""))
+        started = time.perf_counter()
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        _add(trace, "WaitTime", time.perf_counter() - started)
+        return response
+
+    def _open_traced(self, conn, key, trace):
+        scheme, host, port = key
+        port = port or (443 if scheme == "https" else 80)
+        started = time.perf_counter()
+        address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4]
+        resolved = time.perf_counter()
+        sock = socket.create_connection(address[:2], timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connected = time.perf_counter()
+        _add(trace, "DNSTime", resolved - started)
+        _add(trace, "ConnectTime", connected - resolved)
+        if scheme == "https":
+            sock = self._ssl_context.wrap_socket(sock, server_hostname=host)
+            _add(trace, "TLSTime", time.perf_counter() - connected)
+        conn.sock = sock
+
+    def snapshot(self):
+        """
+        現在の統計情報のコピーを返します。
+        """
+        with self._lock:
+            return dict(self.stats)
+
+    def close(self):
+        """
+        保持しているアイドル接続をすべて閉じます。
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _acquire(self, key):
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop(), True
+        return self._connect(key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_per_host:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    モジュールレベルで共有されるデフォルトのプールを返します。
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = HTTPPool(
+                max_per_host=int(os.getenv("HTTP_POOL_SIZE", DEFAULT_POOL_SIZE)),
+                timeout=float(os.getenv("HTTP_TIMEOUT", DEFAULT_TIMEOUT))
+            )
+        return _default_pool
+
+
+def reuse_summary(before, after):
+    """
+    2つの snapshot() の差分を {"requests": n, "reused": m, "new": k} で返します。
+    """
+    return {name: after[name] - before.get(name, 0) for name in after}
@@ -0,0 +1,212 @@
+"""
+WXO Test Automation - Job Store
+
+wxo_test_auto_ce.py の非同期ジョブ (async モード) の状態を保存します。
+
+    - SQLiteJobStore: SQLite ファイルに保存 (デフォルト: /tmp/wxo_jobs.db)
+    - HTTPJobStore: REST API に保存 (mock_server.py の /jobs ルートなど)
+
+環境変数 WXO_JOB_STORE にファイルパスまたは http(s):// の URL を指定して切り替えます。
+Code Engine のインスタンスをまたいでポーリングする場合は、共有できる HTTP の
+ストアを指定してください。
+
+ジョブは処理中のワーカーが期限付きのリース (lease) を持ちます。リースが切れた
+ジョブはポーリングを受けたインスタンスが引き継いで続きを処理します。
+結果は (job_id, index) ごとに1回だけ保存され、届いた順の連番 (seq) が付きます。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+import http_pool
+
+JOB_TTL = 24 * 60 * 60   # 作成から削除までの秒数
+FINISHED_STATUSES = ("completed", "failed")
+STATUS_ONLY = 2 ** 62    # get() の since に渡すと結果を含めずに状態だけを返す
+
+
+class SQLiteJobStore:
+    """
+    SQLite に保存するジョブストア。スレッドセーフです。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " agent_id TEXT NOT NULL,"
+            " questions TEXT NOT NULL,"
+            " options TEXT NOT NULL,"
+            " total INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " error TEXT,"
+            " lease_owner TEXT,"
+            " lease_until REAL NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " job_id TEXT NOT NULL,"
+            " idx INTEGER NOT NULL,"
+            " row TEXT NOT NULL,"
+            " UNIQUE (job_id, idx))"
+        )
+
+    def create(self, job_id, agent_id, questions, options):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # 期限切れのジョブを削除してから登録する
+                expired = "SELECT job_id FROM jobs WHERE created_at < ?"
+                self._conn.execute(f"DELETE FROM results WHERE job_id IN ({expired})", (now - JOB_TTL,))
+                self._conn.execute("DELETE FROM jobs WHERE created_at < ?", (now - JOB_TTL,))
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, agent_id, questions, options, total, status, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                    (job_id, agent_id, json.dumps(questions, ensure_ascii=False), json.dumps(options),
+                     len(questions), now, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id, since=0, include_questions=False):
+        """
+        ジョブの状態と seq が since より大きい結果を返します。ジョブがない場合は None を返します。
+        """
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT agent_id, questions, options, total, status, error, lease_until, created_at, updated_at"
+                " FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            completed = self._conn.execute("SELECT COUNT(*) FROM results WHERE job_id = ?", (job_id,)).fetchone()[0]
+            results = self._conn.execute(
+                "SELECT seq, idx, row FROM results WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, since)
+            ).fetchall()
+        state = {
+            "job_id": job_id,
+            "agent_id": job[0],
+            "options": json.loads(job[2]),
+            "total": job[3],
+            "status": job[4],
+            "error": job[5],
+            "lease_until": job[6],
+            "created_at": job[7],
+            "updated_at": job[8],
+            "completed": completed,
+            "results": [{"seq": seq, "index": idx, "row": json.loads(row)} for seq, idx, row in results],
+            "next": results[-1][0] if results else since
+        }
+        if include_questions:
+            state["questions"] = json.loads(job[1])
+        return state
+
+    def add_result(self, job_id, index, row):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO results (job_id, idx, row) VALUES (?, ?, ?)",
+                (job_id, index, json.dumps(row, ensure_ascii=False))
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def set_status(self, job_id, status, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, time.time(), job_id)
+            )
+
+    def acquire_lease(self, job_id, owner, ttl):
+        """
+        リースを取得 (または更新) します。他のワーカーが有効なリースを持っている場合は False を返します。
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_owner = ?, lease_until = ? WHERE job_id = ?"
+                " AND (lease_owner IS NULL OR lease_owner = ? OR lease_until < ?)",
+                (owner, now + ttl, job_id, owner, now)
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, job_id, owner):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_owner = NULL, lease_until = 0 WHERE job_id = ? AND lease_owner = ?",
+                (job_id, owner)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class HTTPJobStore:
+    """
+    REST API に保存するジョブストア。API は mock_server.py の /jobs ルートを参照してください。
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def _request(self, method, path, payload=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        with http_pool.get_pool().request(method, f"{self.base_url}{path}", body=data, headers=headers) as response:
+            return response.json()
+
+    def _path(self, job_id, suffix=""):
+        return f"/jobs/{urllib.parse.quote(job_id, safe='')}{suffix}"
+
+    def create(self, job_id, agent_id, questions, options):
+        self._request("PUT", self._path(job_id), {"agent_id": agent_id, "questions": questions, "options": options})
+
+    def get(self, job_id, since=0, include_questions=False):
+        query = urllib.parse.urlencode({"since": since, "questions": int(include_questions)})
+        try:
+            return self._request("GET", self._path(job_id, f"?{query}"))
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def add_result(self, job_id, index, row):
+        self._request("POST", self._path(job_id, "/results"), {"index": index, "row": row})
+
+    def set_status(self, job_id, status, error=None):
+        self._request("POST", self._path(job_id, "/status"), {"status": status, "error": error})
+
+    def acquire_lease(self, job_id, owner, ttl):
+        return self._request("POST", self._path(job_id, "/lease"), {"owner": owner, "ttl": ttl})["acquired"]
+
+    def release_lease(self, job_id, owner):
+        self._request("POST", self._path(job_id, "/lease"), {"owner": owner, "release": True})
+
+    def close(self):
+        pass
+
+
+def open_job_store(location=None):
+    """
+    WXO_JOB_STORE (ファイルパスまたは URL) に応じたジョブストアを開きます。
+    """
+    location = location or os.getenv("WXO_JOB_STORE", "/tmp/wxo_jobs.db")
+    if location.startswith(("http://", "https://")):
+        return HTTPJobStore(location)
+    return SQLiteJobStore(location)
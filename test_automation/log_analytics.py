@@ -0,0 +1,469 @@
+"""
+WXO Test Automation - Log Analytics
+
+get_log_from_db2.py でエクスポートした WXO_LOG を列指向でメモリに読み込み、
+フィードバック (isPositive) の集計を行います。Excel での手作業の集計の代わりに使います。
+
+    table = LogTable.load("log_output.csv")       # CSV / JSON Lines / LogStore (SQLite)
+    table.group_by("categories")                 # カテゴリ別の件数・肯定率
+    table.group_by("garoonId", table.select(start="2026-01-01", end="2026-02-01"))
+    table.time_buckets("day")                    # 日別 (hour / week / 秒数も可)
+    table.negative_topics(min_count=3)           # 否定的な評価が多い質問
+
+メモリを抑えるため、列は次の形で保持します (1行あたり約 30 バイト)。
+    - timestamp: array('d') の UNIX 秒 (UTC として扱う。欠損は NaN)
+    - isPositive: array('b') の 1 / 0 / -1 (欠損)
+    - garoonId / name / categories / question: 辞書エンコード (値の一覧 + array('I') のコード)
+    - day / hour: UTC に変換した timestamp の日・時 ("YYYY-MM-DD" / "YYYY-MM-DD HH") の辞書エンコード
+      (時間の集計用に読み込み時に作成。区切りやタイムゾーンの表記が違っても同じ時間帯は同じ値)
+回答 (answer) と text は集計に使わないため読み込みません。
+
+列の値ごとの行番号 (index) と timestamp の昇順の行番号は初回の利用時に作成して保持します。
+集計は collections.Counter と itertools.compress で行い、行ごとの Python の処理を避けます。
+
+WXO_LOG にはレイテンシの列がないため、「遅い質問」は集計できません。
+
+Usage:
+    python3 log_analytics.py log_output.csv                   # 全体・カテゴリ・日別・否定的な質問
+    python3 log_analytics.py log_output.csv --by garoonId --top 20
+    python3 log_analytics.py --store --by hour --start 2026-01-20 --json
+"""
+
+import argparse
+import csv
+import json
+import math
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import compress, islice, repeat
+from operator import itemgetter
+
+COLUMNS = ["id", "garoonId", "name", "timestamp", "question", "answer", "isPositive", "categories", "text"]
+ENCODED_COLUMNS = ["garoonId", "name", "categories", "question", "day", "hour"]
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+# 週の区切りを月曜日にするためのずれ (1970-01-01 は木曜日)
+_WEEK_ORIGIN = 4 * 86400
+
+# 読み込み時に列ごとにまとめて変換する行数
+BATCH_ROWS = 10000
+
+_EPOCH = datetime(1970, 1, 1)
+_NO_FEEDBACK = -1
+_POSITIVE = {"1": 1, "0": 0, "true": 1, "false": 0, "True": 1, "False": 0}
+
+
+class Dictionary:
+    """
+    文字列の値を連番のコードに対応づけます (辞書エンコード)。
+    """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def encode(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode_many(self, values):
+        """
+        値のリストをコードの array('I') に変換します。新しい値は一覧の末尾に追加します。
+        """
+        codes = self._codes
+        before = len(codes)
+        encoded = array("I", [codes.setdefault(value, len(codes)) for value in values])
+        if len(codes) > before:
+            self.values.extend(islice(codes, before, None))
+        return encoded
+
+    def code(self, value):
+        """
+        値のコードを返します。存在しない値は None を返します。
+        """
+        return self._codes.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _parse_timestamp(value):
+    try:
+        return (datetime.fromisoformat(value) - _EPOCH).total_seconds()
+    except TypeError:
+        # タイムゾーン付きの値 (UTC に変換してから比べる)
+        return (datetime.fromisoformat(value).astimezone(timezone.utc).replace(tzinfo=None) - _EPOCH).total_seconds()
+    except ValueError:
+        return math.nan
+
+
+@lru_cache(maxsize=4096)
+def _hour_label(hour):
+    # UNIX 時 (UNIX 秒 // 3600) → "YYYY-MM-DD HH"
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%Y-%m-%d %H")
+
+
+def _hour_labels(seconds):
+    # UNIX 秒 → "YYYY-MM-DD HH" (欠損は空文字)
+    return [_hour_label(int(value // 3600)) if value == value else "" for value in seconds]
+
+
+def _to_seconds(value):
+    # "2026-01-20" / "2026-01-20 10:00:00" / datetime / UNIX 秒 → UNIX 秒
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (value - _EPOCH).total_seconds()
+    return _parse_timestamp(str(value).strip())
+
+
+def _bucket_label(seconds, width):
+    start = datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+    if width % 86400 == 0:
+        return start.strftime("%Y-%m-%d")
+    return start.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class LogTable:
+    """
+    WXO_LOG の列指向のテーブル。行は読み込んだ順に 0 から番号が付きます。
+    """
+
+    def __init__(self):
+        self.timestamps = array("d")
+        self.positive = array("b")
+        self.dictionaries = {name: Dictionary() for name in ENCODED_COLUMNS}
+        self.codes = {name: array("I") for name in ENCODED_COLUMNS}
+        self._indexes = {}
+        self._time_order = None
+        self._flags = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    # ------------------------------------------------------------------
+    # 読み込み
+    # ------------------------------------------------------------------
+
+    def append(self, record):
+        """
+        1行 (列名 → 値の dict) を追加します。
+        """
+        self.extend_rows([[record.get(name) for name in COLUMNS]])
+
+    def extend_rows(self, rows, columns=COLUMNS):
+        """
+        行 (値のリスト) をまとめて追加します。columns は値の並びです。
+        値は列ごとにまとめて変換するため、大量の行は BATCH_ROWS 行程度ずつ渡してください。
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        values = list(zip(*rows))
+        positions = {name: columns.index(name) for name in COLUMNS if name in columns}
+
+        def texts(name):
+            if name not in positions:
+                return [""] * len(rows)
+            return ["" if value is None else str(value).strip() for value in values[positions[name]]]
+
+        seconds = list(map(_parse_timestamp, texts("timestamp")))
+        self.timestamps.extend(seconds)
+        self.positive.extend(map(_POSITIVE.get, texts("isPositive"), repeat(_NO_FEEDBACK)))
+        for name in ("garoonId", "name", "categories", "question"):
+            self.codes[name].extend(self.dictionaries[name].encode_many(texts(name)))
+        # 日・時は入力の文字列ではなく UTC に変換した値から作る (time_buckets の秒数指定と揃える)
+        hours = _hour_labels(seconds)
+        self.codes["day"].extend(self.dictionaries["day"].encode_many([hour[:10] for hour in hours]))
+        self.codes["hour"].extend(self.dictionaries["hour"].encode_many(hours))
+        self._indexes.clear()
+        self._time_order = self._flags = None
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        get_log_from_db2.py の CSV を読み込みます。先頭行が列名でない場合は COLUMNS の順とみなします。
+        """
+        table = cls()
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            columns = COLUMNS
+            first = next(reader, None)
+            if first:
+                # BOM が重なって付いている場合も取り除く
+                first = [first[0].lstrip("\ufeff")] + first[1:]
+                if set(COLUMNS) <= {value.strip() for value in first}:
+                    columns = [value.strip() for value in first]
+                else:
+                    table.extend_rows([first], columns)
+            # 列が足りない行 (途中で切れた行など) は空欄で補う
+            padding = [""] * len(columns)
+            while True:
+                batch = [row + padding[len(row):] for row in islice(reader, BATCH_ROWS) if row]
+                if not batch:
+                    break
+                table.extend_rows(batch, columns)
+        return table
+
+    @classmethod
+    def from_jsonl(cls, path):
+        """
+        JSON Lines (format=jsonl) のエクスポートを読み込みます。
+        """
+        table = cls()
+        with open(path, "r", encoding="utf-8-sig") as f:
+            records = (json.loads(line) for line in f if line.strip())
+            while True:
+                batch = [[record.get(name) for name in COLUMNS] for record in islice(records, BATCH_ROWS)]
+                if not batch:
+                    break
+                table.extend_rows(batch)
+        return table
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        log_store.LogStore (sync=true で同期したストア) から読み込みます。
+        """
+        table = cls()
+        for batch in store.iter_rows():
+            table.extend_rows(batch, store.columns)
+        return table
+
+    @classmethod
+    def load(cls, path):
+        """
+        拡張子に応じて CSV / JSON Lines / SQLite (LogStore) を読み込みます。
+        """
+        if path.endswith((".jsonl", ".ndjson")):
+            return cls.from_jsonl(path)
+        if path.endswith((".db", ".sqlite", ".sqlite3")):
+            from log_store import LogStore
+            store = LogStore(path)
+            try:
+                return cls.from_store(store)
+            finally:
+                store.close()
+        return cls.from_csv(path)
+
+    # ------------------------------------------------------------------
+    # インデックスと行の選択
+    # ------------------------------------------------------------------
+
+    def index(self, column):
+        """
+        列の値のコードごとの行番号 (array('I')) のリストを返します。初回に作成して保持します。
+        """
+        if column not in self._indexes:
+            postings = [array("I") for _ in range(len(self.dictionaries[column]))]
+            for row, code in enumerate(self.codes[column]):
+                postings[code].append(row)
+            self._indexes[column] = postings
+        return self._indexes[column]
+
+    def _time_index(self):
+        # timestamp の昇順の行番号と、同じ順に並べた timestamp (NaN の行は含めない)
+        if self._time_order is None:
+            rows = sorted((row for row, value in enumerate(self.timestamps) if value == value),
+                          key=self.timestamps.__getitem__)
+            order = array("I", rows)
+            self._time_order = (order, array("d", map(self.timestamps.__getitem__, order)))
+        return self._time_order
+
+    def select(self, start=None, end=None, **equals):
+        """
+        条件に合う行番号のリスト (昇順) を返します。
+        start <= timestamp < end (文字列・datetime・UNIX 秒) と、列 = 値 (例: categories="正しくない") を指定できます。
+        """
+        candidates = None
+        if start is not None or end is not None:
+            order, sorted_times = self._time_index()
+            low = bisect_left(sorted_times, _to_seconds(start)) if start is not None else 0
+            high = bisect_left(sorted_times, _to_seconds(end)) if end is not None else len(order)
+            candidates = set(order[low:high])
+        for column, value in equals.items():
+            code = self.dictionaries[column].code("" if value is None else str(value))
+            rows = self.index(column)[code] if code is not None else ()
+            candidates = set(rows) if candidates is None else candidates.intersection(rows)
+        if candidates is None:
+            return list(range(len(self)))
+        return sorted(candidates)
+
+    # ------------------------------------------------------------------
+    # 集計
+    # ------------------------------------------------------------------
+
+    def _feedback_flags(self):
+        # isPositive が 1 / 0 の行を示すバイト列 (itertools.compress 用)
+        if self._flags is None:
+            self._flags = (bytes(value == 1 for value in self.positive),
+                           bytes(value == 0 for value in self.positive))
+        return self._flags
+
+    def _count(self, keys, rows):
+        """
+        keys (行ごとのキー) を rows の行だけで、全件・肯定・否定の3通りに数えます。
+        """
+        positive, negative = self._feedback_flags()
+        if rows is None:
+            keys = list(keys)
+            return Counter(keys), Counter(compress(keys, positive)), Counter(compress(keys, negative))
+        keys = list(map(keys.__getitem__, rows))
+        return (Counter(keys), Counter(compress(keys, map(positive.__getitem__, rows))),
+                Counter(compress(keys, map(negative.__getitem__, rows))))
+
+    @staticmethod
+    def _report(key_label, totals, positives, negatives):
+        report = []
+        for key, count in totals.items():
+            rated = positives[key] + negatives[key]
+            report.append({
+                key_label: key,
+                "count": count,
+                "positive": positives[key],
+                "negative": negatives[key],
+                "positive_rate": round(positives[key] / rated, 4) if rated else None
+            })
+        return report
+
+    def group_by(self, column, rows=None, sort="count"):
+        """
+        列の値ごとの件数・肯定数・否定数・肯定率 (フィードバックのある行のうちの割合) を返します。
+        rows で select() の結果に絞り込めます。sort は "count" / "negative" / "positive_rate" / "key"。
+        """
+        totals, positives, negatives = self._count(self.codes[column], rows)
+        values = self.dictionaries[column].values
+        report = self._report(column, totals, positives, negatives)
+        for item in report:
+            item[column] = values[item[column]]
+        return _sorted(report, sort, column)
+
+    def time_buckets(self, width="day", rows=None):
+        """
+        時間ごとの件数・肯定率を時刻順に返します。width は "hour" / "day" / "week" または秒数です。
+        """
+        if width in ("hour", "day"):
+            # timestamp が欠損している行 (空の値) は秒数指定と同じく除く
+            return _sorted([item for item in self.group_by(width, rows) if item[width]], "key", width)
+        seconds = BUCKETS.get(width, width)
+        origin = _WEEK_ORIGIN if seconds % BUCKETS["week"] == 0 else 0
+        # timestamp が欠損 (NaN) の行は None にして集計から除く
+        buckets = [int((value - origin) // seconds) if value == value else None for value in self.timestamps]
+        totals, positives, negatives = self._count(buckets, rows)
+        totals.pop(None, None)
+        report = self._report("bucket", totals, positives, negatives)
+        for item in report:
+            item["bucket"] = _bucket_label(item["bucket"] * seconds + origin, seconds)
+        return _sorted(report, "key", "bucket")
+
+    def negative_topics(self, rows=None, min_count=1, top=20):
+        """
+        否定的な評価が多い質問を、否定数・否定率の順に返します (min_count 件以上の質問)。
+        """
+        report = [item for item in self.group_by("question", rows) if item["count"] >= min_count and item["negative"]]
+        report.sort(key=lambda item: (-item["negative"], item["positive_rate"] or 0))
+        return report[:top]
+
+    def overview(self, rows=None):
+        """
+        件数・肯定数・否定数・肯定率・期間を返します。
+        """
+        totals, positives, negatives = self._count(bytes(len(self)), rows)
+        rated = positives[0] + negatives[0]
+        times = [value for value in (self.timestamps if rows is None else map(self.timestamps.__getitem__, rows))
+                 if value == value]
+        return {
+            "count": totals[0],
+            "positive": positives[0],
+            "negative": negatives[0],
+            "positive_rate": round(positives[0] / rated, 4) if rated else None,
+            "first": _bucket_label(min(times), 1) if times else None,
+            "last": _bucket_label(max(times), 1) if times else None
+        }
+
+    def memory_bytes(self):
+        """
+        列の配列が使っているおおよそのバイト数を返します (辞書の値の文字列は含めません)。
+        """
+        arrays = [self.timestamps, self.positive] + list(self.codes.values())
+        return sum(values.itemsize * len(values) for values in arrays)
+
+
+def _sorted(report, sort, key_label):
+    if sort == "key":
+        return sorted(report, key=itemgetter(key_label))
+    if sort == "positive_rate":
+        return sorted(report, key=lambda item: (item["positive_rate"] is None, item["positive_rate"] or 0))
+    return sorted(report, key=lambda item: -item[sort])
+
+
+def _print_table(title, report, key_label):
+    print(f"== {title}")
+    for item in report:
+        rate = "-" if item["positive_rate"] is None else f"{item['positive_rate']:.1%}"
+        print(f"  {str(item[key_label]) or '(空)':<40} {item['count']:>8} {item['positive']:>8} {item['negative']:>8} {rate:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feedback analytics over exported WXO_LOG data")
+    parser.add_argument("path", nargs="?", help="exported CSV / JSON Lines, or a LogStore .db file")
+    parser.add_argument("--store", action="store_true", help="read the sync store (WXO_LOG_STORE) instead of a file")
+    parser.add_argument("--by", choices=["categories", "garoonId", "name", "question", "hour", "day", "week"],
+                        help="report only this grouping")
+    parser.add_argument("--start", help="only rows with timestamp >= START")
+    parser.add_argument("--end", help="only rows with timestamp < END")
+    parser.add_argument("--category", help="only rows with this categories value")
+    parser.add_argument("--top", type=int, default=20, help="rows per grouping (default: 20)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.store:
+        from log_store import open_store
+        store = open_store()
+        try:
+            table = LogTable.from_store(store)
+        finally:
+            store.close()
+    elif args.path:
+        table = LogTable.load(args.path)
+    else:
+        parser.error("give an export file or --store")
+
+    filters = {"categories": args.category} if args.category is not None else {}
+    rows = table.select(args.start, args.end, **filters) if (args.start or args.end or filters) else None
+    if args.by in ("hour", "day", "week"):
+        report = {args.by: table.time_buckets(args.by, rows)}
+    elif args.by:
+        report = {args.by: table.group_by(args.by, rows)[:args.top]}
+    else:
+        report = {
+            "categories": table.group_by("categories", rows)[:args.top],
+            "day": table.time_buckets("day", rows),
+            "negative_topics": table.negative_topics(rows, top=args.top)
+        }
+    report = {"overview": table.overview(rows), **report}
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+    overview = report.pop("overview")
+    print(f"{overview['count']} rows ({overview['first']} - {overview['last']}), "
+          f"positive {overview['positive']}, negative {overview['negative']}, rate {overview['positive_rate']}")
+    for name, items in report.items():
+        key_label = "bucket" if name == "week" else ("question" if name == "negative_topics" else name)
+        _print_table(name, items, key_label)
+
+
+if __name__ == "__main__":
+    main()
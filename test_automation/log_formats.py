@@ -0,0 +1,228 @@
+"""
+WXO Test Automation - Log Export Formats
+
+get_log_from_db2.py のエクスポート形式と圧縮のネゴシエーションを行います。
+
+形式 (format パラメータ、または Accept ヘッダーで指定):
+    - csv: BOM 付き CSV (デフォルト。Excel / Office Script 用)
+    - jsonl: JSON Lines (1行1オブジェクト)
+    - parquet: Apache Parquet (pyarrow が必要)
+    - arrow: Apache Arrow IPC ストリーム (pyarrow が必要)
+
+形式を明示した場合は Accept-Encoding に応じて gzip / deflate で圧縮します。
+形式を指定しないリクエスト (Excel の経路) は従来どおり非圧縮の CSV を返します。
+バイナリ (圧縮・Parquet・Arrow) の body は base64 で返します。
+"""
+
+import base64
+import json
+import zlib
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+EXTENSIONS = {"csv": "csv", "jsonl": "jsonl", "parquet": "parquet", "arrow": "arrows"}
+BINARY_FORMATS = ("parquet", "arrow")
+
+_ACCEPT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json-lines": "jsonl",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.arrow.file": "arrow"
+}
+# zlib の wbits: gzip はヘッダー付き、HTTP の deflate は zlib 形式
+_WBITS = {"gzip": 31, "deflate": 15}
+
+
+class FormatError(ValueError):
+    """
+    指定された形式を返せない場合の例外 (未対応の形式、pyarrow が未インストールなど)。
+    """
+
+
+def request_header(args, name):
+    """
+    Code Engine が渡すリクエストヘッダー (__ce_headers) から値を取得します (大文字小文字は区別しません)。
+    """
+    headers = args.get("__ce_headers") or {}
+    for key, value in headers.items():
+        if key.lower() == name.lower():
+            return value[0] if isinstance(value, list) else value
+    return None
+
+
+def _parse_qualities(header):
+    # "gzip;q=0.8, deflate" → [("gzip", 0.8), ("deflate", 1.0)]
+    items = []
+    for part in (header or "").split(","):
+        fields = [field.strip() for field in part.split(";")]
+        if not fields[0]:
+            continue
+        quality = 1.0
+        for field in fields[1:]:
+            if field.startswith("q="):
+                try:
+                    quality = float(field[2:])
+                except ValueError:
+                    quality = 0.0
+        items.append((fields[0].lower(), quality))
+    return items
+
+
+def negotiate_format(args):
+    """
+    format パラメータまたは Accept ヘッダーから形式を決めます。
+    形式が明示されていない場合は None を返します (Excel 向けの CSV)。
+    """
+    requested = args.get("format")
+    if requested:
+        requested = str(requested).lower()
+        if requested not in FORMATS:
+            raise FormatError(f"Unsupported format: {requested} (csv, jsonl, parquet, arrow)")
+        return requested
+    accepted = sorted(_parse_qualities(request_header(args, "Accept")), key=lambda item: -item[1])
+    for media_type, quality in accepted:
+        if quality > 0 and media_type in _ACCEPT_TYPES:
+            return _ACCEPT_TYPES[media_type]
+    return None
+
+
+def negotiate_encoding(args):
+    """
+    Accept-Encoding から gzip / deflate を選びます。圧縮しない場合は None を返します。
+    """
+    best = None
+    for coding, quality in _parse_qualities(request_header(args, "Accept-Encoding")):
+        if coding in _WBITS and quality > 0 and (best is None or quality > best[1]):
+            best = (coding, quality)
+    return best[0] if best else None
+
+
+def iter_jsonl(batches, columns):
+    """
+    行のリストを受け取るたびに JSON Lines の文字列に変換して返します。
+    """
+    for batch in batches:
+        yield "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in batch)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _import_pyarrow(fmt):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise FormatError(f"{fmt} export requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+
+def check_available(fmt):
+    """
+    形式に必要なライブラリがあるか確認します。ない場合は FormatError を送出します。
+    """
+    if fmt in BINARY_FORMATS:
+        _import_pyarrow(fmt)
+
+
+def iter_columnar(batches, columns, fmt):
+    """
+    行のリストを Arrow の RecordBatch に変換しながら Parquet / Arrow IPC を書き出し、
+    書き出されたバイト列を順に返します。pyarrow が必要です (ない場合はすぐに FormatError)。
+    """
+    pa, pq = _import_pyarrow(fmt)
+    return _iter_columnar(pa, pq, batches, columns, fmt)
+
+
+def _iter_columnar(pa, pq, batches, columns, fmt):
+    # isPositive だけ整数、それ以外は文字列として扱う
+    schema = pa.schema([(name, pa.int64() if name == "isPositive" else pa.string()) for name in columns])
+    converters = [_to_int if name == "isPositive" else (lambda v: None if v is None else str(v)) for name in columns]
+    sink = _ChunkSink()
+    target = pa.PythonFile(sink, mode="w")
+    writer = pq.ParquetWriter(target, schema, compression="zstd") if fmt == "parquet" else pa.ipc.new_stream(target, schema)
+    for batch in batches:
+        arrays = [pa.array([convert(row[i]) for row in batch], type=schema.field(i).type)
+                  for i, convert in enumerate(converters)]
+        record_batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        if fmt == "parquet":
+            writer.write_table(pa.Table.from_batches([record_batch]))
+        else:
+            writer.write_batch(record_batch)
+        data = sink.take()
+        if data:
+            yield data
+    writer.close()
+    data = sink.take()
+    if data:
+        yield data
+
+
+class _ChunkSink:
+    """
+    pyarrow の書き出し先。書き込まれたバイト列を take() で取り出せます
+    (Parquet のフッターが使う位置 tell() は取り出した後も通算で返します)。
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def encode_chunks(chunks, encoding=None):
+    """
+    文字列 / バイト列のチャンクを UTF-8 に変換し、encoding (gzip / deflate) を指定した場合は
+    順に圧縮したバイト列を返します。
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _WBITS[encoding]) if encoding else None
+    for chunk in chunks:
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+
+def to_base64(chunks):
+    """
+    バイト列のチャンクをまとめて base64 文字列にします。
+    """
+    return base64.b64encode(b"".join(chunks)).decode("ascii")
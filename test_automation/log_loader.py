@@ -0,0 +1,377 @@
+"""
+WXO Test Automation - WXO_LOG Bulk Loader
+
+テスト結果の CSV やエクスポートした WXO_LOG (CSV / JSON Lines) を、複数行の INSERT を
+まとめたジョブで DB2 の WXO_LOG に書き込みます。main.js / inner_main.js の1行ごとの書き込み
+(認証 + INSERT ジョブの投入 + ポーリング) と比べて、往復の回数をおよそ batch_size 分の1にします。
+
+- 接続と認証は get_log_from_db2 (db2_request / get_db2_token) を使い、1つのトークンを使い回します
+- batch_size 行 (または max_sql_bytes バイト) ごとに1つの INSERT ジョブにし、in_flight 個までの
+  ジョブを投入してからまとめてポーリングします。終わったジョブの分だけ次のジョブを投入します
+- 値はすべて sql_literal でエスケープします。timestamp は解釈し直した値、isPositive は 0 / 1 / NULL (空) だけを使います
+- SQL エラーになったジョブは最初と最後の id とエラーを報告し、残りのジョブは続けます
+- 投入後にポーリングできなくなったジョブは、書き込まれたかどうか分からない (unknown) として報告します。
+  再実行の前に、その id の範囲が WXO_LOG にあるかを確認してください (そのまま再実行すると重複します)
+
+入力の種類 (--kind, デフォルトは列名から判定):
+    - log: WXO_LOG と同じ列 (id, garoonId, name, timestamp, question, answer, isPositive, categories, text)。
+      見出し行のない CSV (get_log_from_db2.py の log_output.csv) はこの列の順とみなします。
+      timestamp が空の行は DB2 の CURRENT TIMESTAMP を使います
+    - results: wxo_test_auto_local.py の結果 CSV (Question, Answer, Status)。
+      id は <--id-prefix>-<行番号>、timestamp は実行時刻、categories は --category (デフォルト: テスト)、
+      text はテストのステータスです。isPositive はユーザーのフィードバックではないため NULL にします。
+      質問が空 (Skipped) の行は書き込みません
+
+Usage:
+    python3 log_loader.py results.csv --kind results --garoon-id wxo-test
+    python3 log_loader.py wxo_logs.jsonl --batch-size 500 --in-flight 8 --json
+    python3 log_loader.py results.csv --stub     # ローカルのスタンドインサーバー (mock_server.py) に書き込む
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import chain
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from get_log_from_db2 import (  # noqa: E402
+    LOG_COLUMNS, LOG_TABLE, POLL_INITIAL, POLL_MAX, db2_request, get_config, get_db2_token, sql_literal
+)
+# db2_request と同じ接続プール (get_log_from_db2 は test_automation パッケージとして読み込む)
+from test_automation import http_pool  # noqa: E402
+
+BATCH_SIZE = 200                # 1つの INSERT ジョブに入れる行数
+IN_FLIGHT = 8                   # 同時に投入しておくジョブの数
+MAX_SQL_BYTES = 1024 * 1024     # 1つの INSERT 文の最大バイト数 (長い回答が多い場合は行数より先にこちらで区切る)
+
+RESULT_COLUMNS = ["Question", "Answer", "Status"]
+DEFAULT_CATEGORY = "テスト"
+
+_FLAGS = {"1": 1, "0": 0, "true": 1, "false": 0}
+
+POLL_RETRIES = 3                # ポーリングの失敗が続いたとき、状態を不明とするまでの回数
+
+
+def iter_records(path):
+    """
+    CSV (UTF-8, BOM 可) または JSON Lines (.jsonl / .ndjson) を1行ずつ dict で返します。
+    CSV の先頭行が列名でない場合 (get_log_from_db2.py の見出しなしの CSV) は WXO_LOG の列の順とみなします。
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line.lstrip("\ufeff") if number == 1 else line)
+                if not isinstance(record, dict):
+                    raise ValueError(f"line {number}: expected a JSON object")
+                yield record
+            return
+        reader = csv.reader(f)
+        first = next(reader, None)
+        if not first:
+            return
+        # BOM が重なって付いている場合も取り除く (log_analytics.LogTable.from_csv と同じ)
+        first = [first[0].lstrip("\ufeff")] + first[1:]
+        names = [value.strip() for value in first]
+        if set(LOG_COLUMNS) <= set(names) or set(RESULT_COLUMNS) <= set(names):
+            columns = names
+        else:
+            columns = LOG_COLUMNS
+            yield dict(zip(columns, first))
+        for row in reader:
+            if row:
+                yield dict(zip(columns, row))
+
+
+def detect_kind(record):
+    """
+    最初の行の列名から入力の種類 (log / results) を判定します。
+    """
+    if record is None or all(name in record for name in ("id", "timestamp", "question")):
+        return "log"
+    if all(name in record for name in RESULT_COLUMNS):
+        return "results"
+    raise ValueError(f"cannot tell the input kind from its columns: {', '.join(record)}")
+
+
+def _text(value):
+    return "NULL" if value is None else sql_literal(value)
+
+
+def _timestamp(value):
+    # 解釈し直した日時からリテラルを作る (inner_main.js と同じくミリ秒まで)
+    if value is None or str(value).strip() == "":
+        return "CURRENT TIMESTAMP"
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).strip())
+        except ValueError:
+            raise ValueError(f"invalid timestamp: {value!r}") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return sql_literal(parsed.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3])
+
+
+def _flag(value):
+    # 空 (フィードバックなし) は NULL にする。0 にすると否定のフィードバックとして集計される
+    text = str(value if value is not None else "").strip().lower()
+    if text == "":
+        return "NULL"
+    flag = _FLAGS.get(text)
+    if flag is None:
+        raise ValueError(f"invalid isPositive: {value!r}")
+    return str(flag)
+
+
+def values_sql(record):
+    """
+    WXO_LOG の列名をキーとする dict から、INSERT の VALUES の1行分 "(...)" を作ります。
+    """
+    values = []
+    for name in LOG_COLUMNS:
+        value = record.get(name)
+        if name == "timestamp":
+            values.append(_timestamp(value))
+        elif name == "isPositive":
+            values.append(_flag(value))
+        else:
+            values.append(_text(value))
+    return "(" + ", ".join(values) + ")"
+
+
+def result_record(row, number, id_prefix, timestamp, garoon_id="", name="", category=DEFAULT_CATEGORY):
+    """
+    結果 CSV の1行を WXO_LOG の列の dict にします。
+    """
+    return {
+        "id": f"{id_prefix}-{number}",
+        "garoonId": garoon_id,
+        "name": name,
+        "timestamp": timestamp,
+        "question": row.get("Question") or "",
+        "answer": row.get("Answer") or "",
+        "isPositive": None,
+        "categories": category,
+        "text": (row.get("Status") or "").strip()
+    }
+
+
+class Batch:
+    """
+    1つの INSERT ジョブにまとめた行。
+    """
+
+    def __init__(self, sql, rows, first_id, last_id):
+        self.sql = sql
+        self.rows = rows
+        self.first_id = first_id
+        self.last_id = last_id
+        self.errors = []
+        self.unknown = False        # 投入後にポーリングできず、書き込まれたかどうか分からない
+        self.poll_failures = 0
+
+
+def iter_batches(records, batch_size=BATCH_SIZE, max_sql_bytes=MAX_SQL_BYTES):
+    """
+    WXO_LOG の列の dict を batch_size 行 (または max_sql_bytes バイト) ごとの複数行 INSERT にまとめます。
+    """
+    names = ", ".join(f'"{name}"' for name in LOG_COLUMNS)
+    prefix = f"INSERT INTO {LOG_TABLE} ({names}) VALUES "
+    values, size, first_id, last_id = [], 0, None, None
+    for record in records:
+        row = values_sql(record)
+        row_bytes = len(row.encode("utf-8")) + 2
+        if values and (len(values) >= batch_size or size + row_bytes > max_sql_bytes):
+            yield Batch(prefix + ", ".join(values), len(values), first_id, last_id)
+            values, size = [], 0
+        if not values:
+            first_id = record.get("id")
+        values.append(row)
+        size += row_bytes
+        last_id = record.get("id")
+    if values:
+        yield Batch(prefix + ", ".join(values), len(values), first_id, last_id)
+
+
+def load_records(base_url, headers, records, batch_size=BATCH_SIZE, in_flight=IN_FLIGHT,
+                 max_sql_bytes=MAX_SQL_BYTES, on_batch=None):
+    """
+    行を INSERT ジョブにまとめて投入し、in_flight 個までのジョブをまとめてポーリングします。
+    集計 (行数・ジョブ数・失敗・所要時間・1秒あたりの行数) の dict を返します。
+    on_batch(batch) を渡すと、ジョブが終わるたびに呼びます (batch.errors が空なら成功、
+    batch.unknown なら書き込まれたかどうか不明)。
+    """
+    batches = iter_batches(records, batch_size, max_sql_bytes)
+    pending = {}
+    report = {"rows": 0, "loaded_rows": 0, "failed_rows": 0, "unknown_rows": 0, "batches": 0,
+              "failures": [], "unknown": []}
+    pool_before = http_pool.get_pool().snapshot()
+    started = time.perf_counter()
+
+    def finish(batch):
+        report["batches"] += 1
+        report["rows"] += batch.rows
+        if batch.unknown:
+            report["unknown_rows"] += batch.rows
+            report["unknown"].append({"first_id": batch.first_id, "last_id": batch.last_id,
+                                      "rows": batch.rows, "error": "; ".join(batch.errors)})
+        elif batch.errors:
+            report["failed_rows"] += batch.rows
+            report["failures"].append({"first_id": batch.first_id, "last_id": batch.last_id,
+                                       "rows": batch.rows, "error": "; ".join(batch.errors)})
+        else:
+            report["loaded_rows"] += batch.rows
+        if on_batch:
+            on_batch(batch)
+
+    delay = POLL_INITIAL
+    exhausted = False
+    while True:
+        # 空いた枠の分だけ次のジョブを投入する
+        while not exhausted and len(pending) < in_flight:
+            batch = next(batches, None)
+            if batch is None:
+                exhausted = True
+                break
+            payload = {"commands": batch.sql, "limit": 1, "separator": ";", "stop_on_error": "yes"}
+            try:
+                job_id = db2_request(f"{base_url}/sql_jobs", "POST", headers, payload).get("id")
+            except Exception as e:
+                batch.errors.append(f"submit failed: {e}")
+                finish(batch)
+                continue
+            pending[job_id] = batch
+        if not pending:
+            break
+
+        # 投入済みのジョブをまとめてポーリングする (どれかが終わったら間隔を戻す)
+        time.sleep(delay)
+        finished = False
+        for job_id, batch in list(pending.items()):
+            try:
+                job_status = db2_request(f"{base_url}/sql_jobs/{job_id}", "GET", headers)
+                batch.poll_failures = 0
+            except Exception as e:
+                # INSERT はすでに送っているため、失敗とはせず (再実行で重複させない) 状態不明とする
+                batch.poll_failures += 1
+                if batch.poll_failures < POLL_RETRIES:
+                    continue
+                batch.errors.append(f"poll failed, job {job_id} may have been applied: {e}")
+                batch.unknown = True
+                finish(pending.pop(job_id))
+                finished = True
+                continue
+            batch.errors.extend(str(result["error"]) for result in job_status.get("results", [])
+                                if result.get("error"))
+            status = job_status.get("status")
+            if status in ("completed", "failed"):
+                if status == "failed" and not batch.errors:
+                    batch.errors.append(f"SQL job {job_id} failed")
+                finish(pending.pop(job_id))
+                finished = True
+        delay = POLL_INITIAL if finished else min(delay * 2, POLL_MAX)
+
+    elapsed = time.perf_counter() - started
+    report["elapsed_sec"] = round(elapsed, 3)
+    report["rows_per_sec"] = round(report["loaded_rows"] / elapsed, 1) if elapsed else None
+    report["http"] = http_pool.reuse_summary(pool_before, http_pool.get_pool().snapshot())
+    return report
+
+
+def open_db2():
+    """
+    環境変数の接続先に認証し、(base_url, ヘッダー) を返します。ヘッダーのトークンは使い回します。
+    """
+    config = get_config()
+    token = get_db2_token(config["base_url"], config["deployment_id"], config["userid"], config["password"])
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+        "x-deployment-id": config["deployment_id"]
+    }
+    return config["base_url"], headers
+
+
+def _print_batch(batch):
+    if batch.unknown:
+        state = "unknown: " + "; ".join(batch.errors)
+    else:
+        state = "error: " + "; ".join(batch.errors) if batch.errors else "ok"
+    print(f"{batch.first_id} .. {batch.last_id} ({batch.rows} rows): {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load test results or exported logs into WXO_LOG")
+    parser.add_argument("path", help="results CSV, or WXO_LOG rows as CSV / JSON Lines")
+    parser.add_argument("--kind", choices=["auto", "log", "results"], default="auto",
+                        help="input kind (default: from the column names)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"rows per INSERT job (default: {BATCH_SIZE})")
+    parser.add_argument("--in-flight", type=int, default=IN_FLIGHT,
+                        help=f"INSERT jobs submitted before polling (default: {IN_FLIGHT})")
+    parser.add_argument("--max-sql-bytes", type=int, default=MAX_SQL_BYTES,
+                        help=f"maximum size of one INSERT statement (default: {MAX_SQL_BYTES})")
+    parser.add_argument("--id-prefix", help="results: id prefix (default: TEST-<yyyymmddHHMMSS>)")
+    parser.add_argument("--garoon-id", default="", help="results: garoonId of the rows")
+    parser.add_argument("--name", default="wxo_test_auto", help="results: name of the rows (default: wxo_test_auto)")
+    parser.add_argument("--category", default=DEFAULT_CATEGORY,
+                        help=f"results: categories of the rows (default: {DEFAULT_CATEGORY})")
+    parser.add_argument("--stub", action="store_true", help="load into a local stand-in server")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if args.batch_size < 1 or args.in_flight < 1 or args.max_sql_bytes < 1:
+        parser.error("--batch-size / --in-flight / --max-sql-bytes must be positive")
+
+    if args.stub:
+        from mock_server import env_for, start_mock_server
+        _, base_url = start_mock_server(["--db2-rows", "0", "--db2-latency", "fixed:0.01", "--db2-job-time", "fixed:0.2"])
+        os.environ.update(env_for(base_url))
+        os.environ.update({"DB2_USERID": "stub-user", "DB2_PASSWORD": "stub-password", "DB2_DEPLOYMENT_ID": "stub"})
+    else:
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    try:
+        records = iter_records(args.path)
+        # 種類の判定に読んだ先頭の行は戻して書き込む
+        first = next(records, None)
+        kind = detect_kind(first) if args.kind == "auto" else args.kind
+        records = chain([first] if first is not None else [], records)
+        if kind == "results":
+            now = datetime.now(timezone.utc)
+            prefix = args.id_prefix or f"TEST-{now.strftime('%Y%m%d%H%M%S')}"
+            records = (result_record(row, number, prefix, now, args.garoon_id, args.name, args.category)
+                       for number, row in enumerate(records, start=1) if (row.get("Question") or "").strip())
+        base_url, headers = open_db2()
+        report = load_records(base_url, headers, records, args.batch_size, args.in_flight, args.max_sql_bytes,
+                              on_batch=None if args.json else _print_batch)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    report = {"kind": kind, "batch_size": args.batch_size, "in_flight": args.in_flight, **report}
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        print(f"Loaded {report['loaded_rows']}/{report['rows']} rows in {report['batches']} jobs, "
+              f"{report['elapsed_sec']}s ({report['rows_per_sec']} rows/s, "
+              f"{report['http']['requests']} DB2 requests)")
+        for failure in report["failures"]:
+            print(f"  failed {failure['first_id']} .. {failure['last_id']} ({failure['rows']} rows): {failure['error']}")
+        for unknown in report["unknown"]:
+            print(f"  unknown {unknown['first_id']} .. {unknown['last_id']} ({unknown['rows']} rows): "
+                  "check WXO_LOG for these ids before loading them again")
+    if report["failures"] or report["unknown"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
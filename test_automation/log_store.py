@@ -0,0 +1,163 @@
+"""
+WXO Test Automation - Log Store
+
+DB2 の WXO_LOG をローカルの SQLite に差分同期して保持します。
+get_log_from_db2.py の同期モード (sync=true) から利用し、CSV はこのストアから返します。
+
+- 前回までに取り込んだ最新の (timestamp, id) をウォーターマークとして保存し、
+  次回はそれ以降の行だけを DB2 から取得します
+- 遅れて書き込まれた行を取りこぼさないよう、ウォーターマークより LOOKBACK 秒前から取得します
+- 行は ("timestamp", "id") をキーに UPSERT します。WXO_LOG の id は一意ではない (同じ id で別の
+  イベントがある) ため、エクスポートのページングと同じ組み合わせで行を区別します。
+  遡って同じ行が再び届いた場合は上書きします
+
+環境変数:
+    - WXO_LOG_STORE: ストアのパス (デフォルト: /tmp/wxo_log_store.db)
+    - WXO_LOG_LOOKBACK: 取り込み時に遡る秒数 (デフォルト: 300)
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+DEFAULT_LOOKBACK = 300
+
+COLUMNS = ["id", "garoonId", "name", "timestamp", "question", "answer", "isPositive", "categories", "text"]
+KEY_COLUMNS = ("timestamp", "id")
+
+
+def _quote(name):
+    return f'"{name}"'
+
+
+class LogStore:
+    """
+    WXO_LOG の行を保持する SQLite ストア。スレッドセーフです。
+    """
+
+    def __init__(self, path, columns=COLUMNS):
+        self.path = path
+        self.columns = list(columns)
+        self._key_index = self.columns.index("id")
+        self._timestamp_index = self.columns.index("timestamp")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        column_defs = ", ".join(f"{_quote(name)} TEXT" if name in KEY_COLUMNS else _quote(name)
+                                for name in self.columns)
+        keys = ", ".join(_quote(name) for name in KEY_COLUMNS)
+        with self._conn:
+            # "id" だけをキーにしていた以前のストアは、重複した id の行が欠けているため作り直す
+            # (ウォーターマークも消すので、次回の同期で全件を取り直す)
+            primary_key = [row[1] for row in sorted(self._conn.execute("PRAGMA table_info(log)"),
+                                                    key=lambda row: row[5]) if row[5]]
+            if primary_key and tuple(primary_key) != KEY_COLUMNS:
+                self._conn.execute("DROP TABLE log")
+                self._conn.execute("DROP TABLE IF EXISTS meta")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS log ({column_defs}, PRIMARY KEY ({keys}))")
+            self._conn.execute('CREATE INDEX IF NOT EXISTS log_timestamp ON log ("timestamp")')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS log_garoon_id ON log ("garoonId")')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS log_categories ON log ("categories")')
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def watermark(self):
+        """
+        取り込み済みの最新の (timestamp, id) を返します。未同期の場合は None を返します。
+        """
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if meta.get("watermark_timestamp") is None:
+            return None
+        return meta["watermark_timestamp"], meta.get("watermark_id")
+
+    def fetch_from(self, lookback=DEFAULT_LOOKBACK):
+        """
+        DB2 から取得を始める timestamp の下限を返します (ウォーターマーク - lookback 秒)。
+        未同期の場合は None (全件) を返します。
+        """
+        mark = self.watermark()
+        if mark is None:
+            return None
+        try:
+            start = datetime.fromisoformat(mark[0]) - timedelta(seconds=lookback)
+        except ValueError:
+            # 解釈できない形式の場合は遡らずにウォーターマークから取得する
+            return mark[0]
+        return start.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+    def upsert(self, rows):
+        """
+        行を ("timestamp", "id") をキーに追加・更新します。取り込んだ件数を返します。
+        """
+        names = ", ".join(_quote(name) for name in self.columns)
+        placeholders = ", ".join("?" for _ in self.columns)
+        updates = ", ".join(f"{_quote(name)} = excluded.{_quote(name)}"
+                            for name in self.columns if name not in KEY_COLUMNS)
+        # lookback で同じ行が再び届いた場合は、DB2 の最新の値で上書きする
+        sql = (f"INSERT INTO log ({names}) VALUES ({placeholders})"
+               f" ON CONFLICT ({', '.join(_quote(name) for name in KEY_COLUMNS)}) DO UPDATE SET {updates}")
+        with self._lock, self._conn:
+            self._conn.executemany(sql, (tuple(row) for row in rows))
+        return len(rows)
+
+    def advance_watermark(self, rows):
+        """
+        取り込んだ行のうち最新の (timestamp, id) でウォーターマークを進めます。
+        """
+        stamped = [row for row in rows if row[self._timestamp_index] is not None]
+        if not stamped:
+            return
+        latest = max(stamped, key=lambda row: (row[self._timestamp_index], str(row[self._key_index])))
+        mark = (latest[self._timestamp_index], str(latest[self._key_index]))
+        current = self.watermark()
+        if current is not None and tuple(current) >= mark:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("watermark_timestamp", mark[0]), ("watermark_id", mark[1])]
+            )
+
+    def reset(self):
+        """
+        全行とウォーターマークを削除します (全件を取り直す場合)。
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM log")
+            self._conn.execute("DELETE FROM meta")
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM log").fetchone()[0]
+
+    def iter_rows(self, batch_size=1000, columns=None, conditions=()):
+        """
+        全行を新しい順 (timestamp, id の降順) に batch_size 行ずつのリストで返します。
+        columns で返す列を、conditions (get_log_from_db2.parse_query の WHERE 条件。
+        検証・エスケープ済みの SQL) で返す行を絞り込めます。
+        """
+        names = ", ".join(_quote(name) for name in (columns or self.columns))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            cursor = self._conn.execute(f'SELECT {names} FROM log{where} ORDER BY "timestamp" DESC, "id" DESC')
+        try:
+            while True:
+                with self._lock:
+                    batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    return
+                yield batch
+        finally:
+            cursor.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(path=None):
+    """
+    環境変数の設定を反映した LogStore を開きます。
+    """
+    return LogStore(path or os.getenv("WXO_LOG_STORE", "/tmp/wxo_log_store.db"))
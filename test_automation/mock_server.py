@@ -0,0 +1,603 @@
+"""
+WXO Test Automation - Local Stand-in Server
+
+IBM Cloud の各エンドポイントをローカルで模擬するサーバーです。
+ネットワークなしで性能テスト・動作確認ができます。
+
+模擬するルート:
+    - POST /identity/token                                       (IAM)
+    - POST /instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions  (WXO, stream 対応)
+    - POST /dbapi/v4/auth/tokens                                 (DB2 認証)
+    - POST /dbapi/v4/sql_jobs, GET /dbapi/v4/sql_jobs/{id}       (DB2 SQL ジョブ)
+    - PUT/GET /jobs/{id}, POST /jobs/{id}/results|status|lease    (非同期ジョブのストア)
+
+/jobs は wxo_test_auto_ce.py の非同期モードのジョブストア (job_store.HTTPJobStore) です。
+WXO_JOB_STORE=http://127.0.0.1:8080 で複数インスタンスから同じジョブを参照できます。
+
+DB2 の SQL はメモリ上の SQLite で実行します ("CLD47628"."WXO_LOG" を用意済み)。
+DB2 固有の構文は FETCH FIRST n ROWS ONLY と CURRENT TIMESTAMP のみ変換します。
+
+Usage:
+    python3 mock_server.py --port 8080 --wxo-latency lognormal:0.5,0.4 --error-rate-429 0.05
+    python3 mock_server.py --port 8080 --max-concurrent-chat 8    (同時 8 件を超えると 429)
+
+各スクリプトは既存の接続先の環境変数で切り替えられます (起動時に表示されます):
+    IAM_TOKEN_URL=http://127.0.0.1:8080/identity/token
+    WXO_API_HOST=http://127.0.0.1:8080
+    DB2_HOSTNAME=http://127.0.0.1:8080
+
+レイテンシの指定形式: fixed:秒 / uniform:最小,最大 / lognormal:中央値,シグマ
+
+記録・再生:
+    --record FILE --upstream-iam URL --upstream-wxo URL --upstream-db2 URL
+        実際のエンドポイントへ中継し、リクエストとレスポンスを JSON Lines で FILE に追記します
+        (apikey / password / token は伏せ字にします)。--upstream-db2 を指定しない場合、
+        DB2 のリクエストは記録せずにこのサーバーの模擬 DB2 が応答します。
+    --replay FILE
+        FILE の記録から、同じメソッド・パス・質問文のレスポンスを返します。
+        該当する記録がなければ通常の模擬応答を返します。
+"""
+
+import argparse
+import calendar
+import json
+import math
+import random
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from job_store import SQLiteJobStore
+
+_CHAT_PATH = re.compile(r"^/instances/[^/]+/v1/orchestrate/([^/]+)/chat/completions$")
+_JOB_PATH = re.compile(r"^/dbapi/v4/sql_jobs/([^/]+)$")
+_ASYNC_JOB_PATH = re.compile(r"^/jobs/([^/]+)(/results|/status|/lease)?$")
+_FETCH_FIRST = re.compile(r"\bFETCH\s+FIRST\s+(\d+)\s+ROWS?\s+ONLY\b", re.IGNORECASE)
+_CURRENT_TIMESTAMP = re.compile(r"\bCURRENT\s+TIMESTAMP\b", re.IGNORECASE)
+_SECRET_FIELDS = ("apikey", "password", "token", "access_token", "refresh_token")
+
+
+def parse_latency(spec):
+    """
+    レイテンシの指定文字列から、秒数を返す関数を作ります。
+    """
+    kind, _, params = (spec or "fixed:0").partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0] if values else 0.0
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def split_sql(commands, separator=";"):
+    """
+    文字列リテラル内の区切り文字を無視して SQL を分割します。
+    """
+    statements = []
+    current = []
+    in_string = False
+    for char in commands:
+        if char == "'":
+            in_string = not in_string
+        if char == separator and not in_string:
+            statements.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    statements.append("".join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def to_sqlite(statement):
+    statement = _FETCH_FIRST.sub(r"LIMIT \1", statement)
+    return _CURRENT_TIMESTAMP.sub("CURRENT_TIMESTAMP", statement)
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {k: ("***" if k in _SECRET_FIELDS else _redact(v)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+
+class MockState:
+    """
+    サーバー全体で共有する設定と状態 (発行済みトークン・DB2 ジョブ・記録)。
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.iam_latency = parse_latency(options.iam_latency)
+        self.wxo_latency = parse_latency(options.wxo_latency)
+        self.db2_latency = parse_latency(options.db2_latency)
+        self.db2_job_time = parse_latency(options.db2_job_time)
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.jobs = {}
+        self.counts = {"iam": 0, "chat": 0, "db2_auth": 0, "db2_jobs": 0, "injected_errors": 0, "throttled": 0}
+        self.chat_in_flight = 0
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.execute("ATTACH DATABASE ':memory:' AS \"CLD47628\"")
+        self.db.execute(
+            'CREATE TABLE "CLD47628"."WXO_LOG" ('
+            '"id" TEXT, "garoonId" TEXT, "name" TEXT, "timestamp" TEXT, "question" TEXT,'
+            ' "answer" TEXT, "isPositive" INTEGER, "categories" TEXT, "text" TEXT)'
+        )
+        self._seed_log(options.db2_rows)
+        self.replay = self._load_replay(options.replay) if options.replay else {}
+        self.job_store = SQLiteJobStore(":memory:")
+
+    def _seed_log(self, count):
+        rng = random.Random(0)
+        topics = ["契約方法教えて", "新規契約の手順", "機密保持契約の雛形", "印紙は必要ですか", "契約書の保管期間"]
+        categories = ["", "正しくない", "情報が古い", "テスト", "PROD_TEST"]
+        started = calendar.timegm((2026, 1, 1, 0, 0, 0))
+        rows = []
+        for i in range(count):
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(started + i * 60)) + f".{i % 1000:03d}"
+            positive = rng.random() < 0.7
+            rows.append((
+                f"U-{i + 1}", str(rng.randint(1, 50)), f"ユーザー{rng.randint(1, 50)}", timestamp,
+                rng.choice(topics), "法務ポータルをご参照ください。", int(positive),
+                "" if positive else rng.choice(categories), ""
+            ))
+        self.db.executemany('INSERT INTO "CLD47628"."WXO_LOG" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def _load_replay(self, path):
+        entries = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if "method" not in entry or "path" not in entry:
+                    continue
+                key = self.replay_key(entry["method"], entry["path"], entry.get("request"))
+                entries.setdefault(key, []).append(entry)
+        return entries
+
+    @staticmethod
+    def replay_key(method, path, request):
+        question = None
+        if isinstance(request, dict) and request.get("messages"):
+            question = request["messages"][-1].get("content")
+        elif isinstance(request, dict) and "commands" in request:
+            question = request["commands"]
+        # ジョブIDやインスタンスIDは記録時と異なるため、パスの可変部分は無視する
+        path = _JOB_PATH.sub("/dbapi/v4/sql_jobs/{id}", path)
+        path = _CHAT_PATH.sub("/chat/completions", path)
+        return method, path, question
+
+    def issue_token(self, kind):
+        token = f"mock-{kind}-{uuid.uuid4().hex}"
+        with self.lock:
+            self.tokens[token] = time.time() + self.options.token_ttl
+        return token
+
+    def token_valid(self, header):
+        token = (header or "").removeprefix("Bearer ").strip()
+        with self.lock:
+            expires_at = self.tokens.get(token)
+        return expires_at is not None and expires_at > time.time()
+
+    def run_job(self, payload):
+        """
+        SQL ジョブを実行して結果を保持し、ジョブIDを返します。
+        """
+        results = []
+        limit = int(payload.get("limit") or 0)
+        stop_on_error = payload.get("stop_on_error", "yes") == "yes"
+        for statement in split_sql(payload.get("commands", ""), payload.get("separator", ";")):
+            try:
+                with self.lock:
+                    cursor = self.db.execute(to_sqlite(statement))
+                    if cursor.description:
+                        rows = cursor.fetchmany(limit) if limit else cursor.fetchall()
+                        columns = [column[0] for column in cursor.description]
+                        rows = [[None if v is None else str(v) for v in row] for row in rows]
+                        results.append({"command": statement, "columns": columns, "rows": rows})
+                    else:
+                        results.append({"command": statement, "rows_count": cursor.rowcount})
+            except sqlite3.Error as e:
+                results.append({"command": statement, "error": str(e)})
+                if stop_on_error:
+                    break
+
+        # 結果はポーリングのたびに page_rows 行ずつ返す (実際の API と同様に分割して届く)
+        chunks = []
+        for result in results:
+            rows = result.get("rows")
+            if rows is None or len(rows) <= self.options.db2_page_rows:
+                chunks.append({**result, "rows_count": len(rows) if rows is not None else result.get("rows_count")})
+                continue
+            for start in range(0, len(rows), self.options.db2_page_rows):
+                page = rows[start:start + self.options.db2_page_rows]
+                chunks.append({**result, "rows": page, "rows_count": len(page)})
+
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {"ready_at": time.time() + self.db2_job_time(), "chunks": chunks}
+        return job_id
+
+    def poll_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if time.time() < job["ready_at"]:
+                return {"id": job_id, "status": "running", "results": []}
+            results = job["chunks"][:1]
+            del job["chunks"][:1]
+            status = "running" if job["chunks"] else "completed"
+        return {"id": job_id, "status": status, "results": results}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に書き込むため、Nagle と遅延 ACK で Keep-Alive 接続の応答が 40ms 遅れないようにする
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, *args):
+        if self.state.options.verbose:
+            super().log_message(*args)
+
+    # ------------------------------------------------------------------
+    # 共通処理
+    # ------------------------------------------------------------------
+
+    def _read_body(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not raw:
+            return raw, None
+        try:
+            return raw, json.loads(raw.decode("utf-8"))
+        except ValueError:
+            return raw, dict(urllib.parse.parse_qsl(raw.decode("utf-8")))
+
+    def _send(self, status, payload=None, content_type="application/json", headers=None):
+        if isinstance(payload, (dict, list)):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        else:
+            data = (payload or "").encode("utf-8") if isinstance(payload, str) else (payload or b"")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject_error(self):
+        """
+        設定された確率で 429 / 5xx を返します。返した場合は True。
+        """
+        options = self.state.options
+        roll = random.random()
+        if roll < options.error_rate_429:
+            status, headers = 429, {"Retry-After": str(options.retry_after)}
+        elif roll < options.error_rate_429 + options.error_rate_5xx:
+            status, headers = random.choice([500, 502, 503]), {}
+        else:
+            return False
+        with self.state.lock:
+            self.state.counts["injected_errors"] += 1
+        self._send(status, {"error": "injected by mock_server"}, headers=headers)
+        return True
+
+    def _replay(self, path, request):
+        entries = self.state.replay.get(MockState.replay_key(self.command, path, request))
+        if not entries:
+            return False
+        entry = entries[0]
+        if len(entries) > 1:
+            # 同じキーの記録が複数あれば順に返す
+            entries.append(entries.pop(0))
+        self._send(entry["status"], entry.get("body", ""), entry.get("content_type", "application/json"))
+        return True
+
+    def _proxy(self, upstream, path, raw):
+        """
+        記録モード: 実際のエンドポイントへ中継し、やり取りを記録します。
+        """
+        headers = {name: value for name, value in self.headers.items()
+                   if name.lower() not in ("host", "content-length", "connection", "accept-encoding")}
+        req = urllib.request.Request(upstream.rstrip("/") + path, data=raw or None, headers=headers,
+                                     method=self.command)
+        try:
+            with urllib.request.urlopen(req) as response:
+                status, body = response.status, response.read()
+                content_type = response.headers.get("Content-Type", "application/json")
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+            content_type = e.headers.get("Content-Type", "application/json")
+
+        try:
+            request = json.loads(raw.decode("utf-8")) if raw else None
+        except ValueError:
+            request = dict(urllib.parse.parse_qsl(raw.decode("utf-8")))
+        text = body.decode("utf-8", "replace")
+        try:
+            recorded_body = json.dumps(_redact(json.loads(text)), ensure_ascii=False)
+        except ValueError:
+            recorded_body = text
+        entry = {"method": self.command, "path": path, "request": _redact(request), "status": status,
+                 "content_type": content_type, "body": recorded_body, "recorded_at": time.time()}
+        with self.state.lock:
+            with open(self.state.options.record, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._send(status, body, content_type)
+
+    def _route(self, path):
+        options = self.state.options
+        if path == "/identity/token":
+            return "iam", options.upstream_iam
+        if _CHAT_PATH.match(path):
+            return "chat", options.upstream_wxo
+        if path.startswith("/dbapi/v4/"):
+            return "db2", options.upstream_db2
+        if _ASYNC_JOB_PATH.match(path):
+            return "jobs", None
+        return None, None
+
+    # ------------------------------------------------------------------
+    # ルーティング
+    # ------------------------------------------------------------------
+
+    def do_POST(self):
+        self._handle()
+
+    def do_GET(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle()
+
+    def _handle(self):
+        path = self.path.split("?", 1)[0]
+        raw, body = self._read_body()
+        kind, upstream = self._route(path)
+        if kind is None:
+            self._send(404, {"error": f"No mock route for {self.command} {path}"})
+            return
+        if kind == "jobs":
+            # ジョブストアは記録・再生の対象外 (常にこのサーバーで保持する)
+            self._jobs(path, body)
+            return
+        if self.state.options.record and upstream:
+            self._proxy(upstream, self.path, raw)
+            return
+        # 中継先が未設定の場合 (--upstream-db2 なしの DB2) は記録せず、このサーバーで応答する
+        if self._replay(path, body):
+            return
+        if kind == "iam":
+            self._iam(body)
+        elif kind == "chat":
+            self._chat(path, body)
+        else:
+            self._db2(path, body)
+
+    def _iam(self, body):
+        time.sleep(self.state.iam_latency())
+        with self.state.lock:
+            self.state.counts["iam"] += 1
+        if not (body or {}).get("apikey"):
+            self._send(400, {"errorMessage": "Provided API key could not be found"})
+            return
+        ttl = self.state.options.token_ttl
+        self._send(200, {
+            "access_token": self.state.issue_token("iam"),
+            "refresh_token": "not_supported",
+            "token_type": "Bearer",
+            "expires_in": ttl,
+            "expiration": int(time.time() + ttl)
+        })
+
+    def _chat(self, path, body):
+        # 同時に処理中のリクエストが --max-concurrent-chat を超えたら 429 を返す (負荷に応じたスロットリング)
+        limit = self.state.options.max_concurrent_chat
+        with self.state.lock:
+            self.state.counts["chat"] += 1
+            self.state.chat_in_flight += 1
+            throttled = bool(limit) and self.state.chat_in_flight > limit
+            if throttled:
+                self.state.counts["throttled"] += 1
+        try:
+            if throttled:
+                self._send(429, {"error": "Too many concurrent requests"},
+                           headers={"Retry-After": str(self.state.options.retry_after)})
+                return
+            self._chat_response(path, body)
+        finally:
+            with self.state.lock:
+                self.state.chat_in_flight -= 1
+
+    def _chat_response(self, path, body):
+        if not self.state.token_valid(self.headers.get("Authorization")):
+            self._send(401, {"error": "Unauthorized: token is missing or expired"})
+            return
+        if self._inject_error():
+            return
+
+        question = ((body or {}).get("messages") or [{}])[-1].get("content", "")
+        agent_id = _CHAT_PATH.match(path).group(1)
+        answer = f"### 回答 ({agent_id})\n「{question}」については法務ポータルをご参照ください。"
+        latency = self.state.wxo_latency()
+
+        if not (body or {}).get("stream"):
+            time.sleep(latency)
+            self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}]})
+            return
+
+        # ストリーミング: 先頭トークンまでに latency の半分、残りをチャンクに分けて送る
+        chunks = [answer[i:i + self.state.options.stream_chunk_chars]
+                  for i in range(0, len(answer), self.state.options.stream_chunk_chars)]
+        time.sleep(latency / 2)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for piece in chunks:
+            event = {"choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}}]}
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+            time.sleep(latency / 2 / len(chunks))
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _db2(self, path, body):
+        time.sleep(self.state.db2_latency())
+        if path == "/dbapi/v4/auth/tokens" and self.command == "POST":
+            with self.state.lock:
+                self.state.counts["db2_auth"] += 1
+            if not (body or {}).get("userid") or not (body or {}).get("password"):
+                self._send(400, {"errors": [{"message": "userid and password are required"}]})
+                return
+            self._send(200, {"userid": body["userid"], "token": self.state.issue_token("db2")})
+            return
+        if not self.state.token_valid(self.headers.get("Authorization")):
+            self._send(401, {"errors": [{"message": "Token is missing or expired"}]})
+            return
+        if self._inject_error():
+            return
+        if path == "/dbapi/v4/sql_jobs" and self.command == "POST":
+            with self.state.lock:
+                self.state.counts["db2_jobs"] += 1
+            self._send(201, {"id": self.state.run_job(body or {}), "commands_count": 1, "limit": (body or {}).get("limit")})
+            return
+        match = _JOB_PATH.match(path)
+        if match and self.command == "GET":
+            status = self.state.poll_job(match.group(1))
+            if status is None:
+                self._send(404, {"errors": [{"message": "Job not found"}]})
+            else:
+                self._send(200, status)
+            return
+        self._send(404, {"error": f"No mock route for {self.command} {path}"})
+
+
+    def _jobs(self, path, body):
+        store = self.state.job_store
+        job_id, action = _ASYNC_JOB_PATH.match(path).groups()
+        job_id = urllib.parse.unquote(job_id)
+        body = body or {}
+        if action is None and self.command == "PUT":
+            store.create(job_id, body.get("agent_id", ""), body.get("questions", []), body.get("options", {}))
+            self._send(201, {"job_id": job_id})
+        elif action is None and self.command == "GET":
+            query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+            job = store.get(job_id, int(query.get("since", 0)), query.get("questions") == "1")
+            if job is None:
+                self._send(404, {"error": "Job not found"})
+            else:
+                self._send(200, job)
+        elif action == "/results" and self.command == "POST":
+            store.add_result(job_id, body["index"], body["row"])
+            self._send(200, {})
+        elif action == "/status" and self.command == "POST":
+            store.set_status(job_id, body["status"], body.get("error"))
+            self._send(200, {})
+        elif action == "/lease" and self.command == "POST":
+            if body.get("release"):
+                store.release_lease(job_id, body["owner"])
+                self._send(200, {"acquired": False})
+            else:
+                self._send(200, {"acquired": store.acquire_lease(job_id, body["owner"], float(body["ttl"]))})
+        else:
+            self._send(404, {"error": f"No mock route for {self.command} {path}"})
+
+
+class MockServer(ThreadingHTTPServer):
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Local stand-in for IAM, WXO chat completions and DB2 REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--iam-latency", default="fixed:0.01")
+    parser.add_argument("--wxo-latency", default="lognormal:0.5,0.3", help="chat completions latency")
+    parser.add_argument("--db2-latency", default="fixed:0.01", help="latency of each DB2 REST call")
+    parser.add_argument("--db2-job-time", default="uniform:0.2,1.5", help="time until a SQL job completes")
+    parser.add_argument("--db2-rows", type=int, default=100, help="number of seeded WXO_LOG rows")
+    parser.add_argument("--db2-page-rows", type=int, default=1000, help="rows returned per job poll")
+    parser.add_argument("--stream-chunk-chars", type=int, default=8, help="characters per SSE chunk")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="probability of a 429 response")
+    parser.add_argument("--error-rate-5xx", type=float, default=0.0, help="probability of a 5xx response")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--max-concurrent-chat", type=int, default=0,
+                        help="answer 429 while more chat requests than this are in flight (default: no limit)")
+    parser.add_argument("--token-ttl", type=int, default=3600, help="lifetime (expires_in) of issued tokens")
+    parser.add_argument("--record", metavar="FILE", help="proxy to the upstreams and append traffic to FILE")
+    parser.add_argument("--upstream-iam", default="https://iam.cloud.ibm.com")
+    parser.add_argument("--upstream-wxo", default="https://api.us-south.watson-orchestrate.cloud.ibm.com")
+    parser.add_argument("--upstream-db2", default=None, help="https://<DB2_HOSTNAME>")
+    parser.add_argument("--replay", metavar="FILE", help="answer from traffic recorded with --record")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    return parser
+
+
+def start_mock_server(argv=(), port=0):
+    """
+    サーバーをバックグラウンドスレッドで起動し (server, base_url) を返します。
+    argv にはコマンドラインと同じオプションを渡せます (ベンチマークやテスト用)。
+    """
+    options = build_parser().parse_args(list(argv) + ["--port", str(port)])
+    return _start(options)
+
+
+def _start(options):
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(options)})
+    server = MockServer((options.host, options.port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{options.host}:{server.server_port}"
+
+
+def env_for(base_url):
+    """
+    各スクリプトをこのサーバーに向けるための環境変数を返します。
+    """
+    return {
+        "IAM_TOKEN_URL": f"{base_url}/identity/token",
+        "WXO_API_HOST": base_url,
+        "DB2_HOSTNAME": base_url
+    }
+
+
+def main():
+    options = build_parser().parse_args()
+    if options.record and not options.upstream_db2:
+        print("Note: --upstream-db2 is not set; DB2 requests are answered by the in-memory DB2 and not recorded.")
+    server, base_url = _start(options)
+    print(f"Mock server listening on {base_url}")
+    print("Point the scripts at it with:")
+    for name, value in env_for(base_url).items():
+        print(f"    export {name}={value}")
+    try:
+        while True:
+            time.sleep(60)
+            if options.verbose:
+                print(f"counts: {server.RequestHandlerClass.state.counts}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
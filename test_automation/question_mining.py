@@ -0,0 +1,264 @@
+"""
+WXO Test Automation - Question Mining
+
+エクスポートした WXO_LOG の question 列から、言い回しが少し違うだけの質問
+(例: 「契約方法教えて」と「新規契約方法教えて」) をまとめ、まとまりごとに代表の
+質問を1つ選んで wxo_test_auto_local.py の入力 CSV (Question 列) を作成します。
+本番の質問の傾向を保ったまま、回帰テストの質問数と実行時間を減らすために使います。
+
+    - 比較の前に全角英数記号を半角に、英大文字を小文字にそろえ (scoring.py と同じ)、
+      空白と句読点・括弧を除きます。そろえた結果が同じ質問は最初から同じまとまりです
+    - 文字 2-gram の集合の Jaccard 係数を MinHash (NUM_PERM 個のハッシュ) で推定し、
+      LSH (BANDS 個のバンド) で候補を絞ります。質問の組をすべて比べないため、
+      処理時間は質問の種類数にほぼ比例します
+    - 重み (件数 + negative_weight × 否定数) の大きい質問から順に、推定値が threshold 以上の
+      代表があればそのまとまりに入れ、なければ新しいまとまりの代表にします。代表との類似度で
+      判定するため、少しずつ違う質問が連鎖して別の話題まで1つにまとまることはありません
+    - まとまりは重みの合計の大きい順に並べます
+
+NumPy があれば MinHash をまとめて配列演算で計算します。ない場合は同じ計算を
+標準ライブラリで行います (結果は同じで、時間がかかります)。
+
+Usage:
+    python3 question_mining.py log_output.csv questions_mined.csv
+    python3 question_mining.py log_output.csv questions_mined.csv --threshold 0.8 --top 200
+    python3 question_mining.py --store questions_mined.csv --start 2026-01-01 --clusters clusters.json
+"""
+
+import argparse
+import csv
+import json
+import random
+import time
+from itertools import repeat
+
+from log_analytics import LogTable
+from result_writer import CSV_OPTIONS
+from scoring import _FOLD
+
+NUM_PERM = 128
+BANDS = 32
+THRESHOLD = 0.7
+NEGATIVE_WEIGHT = 2.0
+# 出力 CSV の列 (Question 以外は参考情報。wxo_test_auto_local.py は Question 列だけを使う)
+OUTPUT_COLUMNS = ["Question", "Variants", "Occurrences", "Negative", "Weight", "Examples"]
+EXAMPLES = 3
+
+# 比較の前に除く文字 (空白・句読点・括弧。_FOLD で半角にそろえた後の文字)
+_DROP = {ord(char): None for char in " \t\r\n?!.,、。・「」『』()[]【】〈〉《》\"'`~…"}
+# 2-gram のハッシュ: 1文字 21 ビットを連結してから 32 ビットに縮める (scoring.py と同じ方法)
+_CODE_BITS = 21
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+# MinHash のハッシュ関数 (a * x + b) mod _PRIME。x < 2^32 なので 64 ビットに収まる
+_PRIME = 4294967291
+_SEED = 20260101
+
+
+def normalize(question):
+    """
+    比較用に質問をそろえます (全角英数の半角化・小文字化、空白と句読点の除去)。
+    """
+    return question.translate(_FOLD).translate(_DROP)
+
+
+def _permutations(num_perm):
+    rng = random.Random(_SEED)
+    return [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+
+def _padded(text):
+    # 1文字の質問は 2-gram がないため、NUL を足してその1文字を 2-gram として扱う
+    return text + "\0" if len(text) == 1 else text
+
+
+def _signatures_python(texts, num_perm):
+    permutations = _permutations(num_perm)
+    signatures = []
+    for text in map(_padded, texts):
+        grams = {((((ord(text[i]) << _CODE_BITS) | ord(text[i + 1])) * _HASH_MULTIPLIER) & _MASK64) >> 32
+                 for i in range(len(text) - 1)}
+        signatures.append(tuple(min((a * gram + b) % _PRIME for gram in grams) for a, b in permutations))
+    return signatures
+
+
+def _signatures_numpy(np, texts, num_perm):
+    texts = [_padded(text) for text in texts]
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    docs = np.repeat(np.arange(len(texts)), lengths)
+    # 質問の境界をまたぐ 2-gram は除く
+    inside = docs[:-1] == docs[1:]
+    grams = ((codes[:-1] << np.uint64(_CODE_BITS)) | codes[1:])[inside]
+    grams = (grams * np.uint64(_HASH_MULTIPLIER)) >> np.uint64(32)
+    # 2-gram は質問の順に並んでいるため、各質問の先頭の位置で区切って最小値を取る
+    starts = np.concatenate(([0], np.cumsum(lengths - 1)[:-1]))
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for column, (a, b) in enumerate(_permutations(num_perm)):
+        hashed = (grams * np.uint64(a) + np.uint64(b)) % np.uint64(_PRIME)
+        signatures[:, column] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+
+def _assign(band_keys, similarities, threshold):
+    """
+    質問を先頭から順に、同じバンドのキーを持つ代表の質問のうち最も似ているもの
+    (推定値が threshold 以上) に割り当てます。なければその質問を新しい代表にします。
+    バケットには最初の代表だけを登録します (候補は BANDS 個のバンドから集めるため十分です)。
+    """
+    buckets = [{} for _ in band_keys[0]] if band_keys else []
+    centers = []
+    for doc, keys in enumerate(band_keys):
+        candidates = set(map(dict.get, buckets, keys))
+        candidates.discard(None)
+        if candidates:
+            candidates = sorted(candidates)
+            scores = similarities(doc, candidates)
+            best = max(range(len(candidates)), key=scores.__getitem__)
+            if scores[best] >= threshold:
+                centers.append(candidates[best])
+                continue
+        centers.append(doc)
+        for _ in map(dict.setdefault, buckets, keys, repeat(doc)):
+            pass
+    return centers
+
+
+def _cluster_python(signatures, bands, threshold):
+    rows = len(signatures[0]) // bands
+    band_keys = [[signature[band * rows:(band + 1) * rows] for band in range(bands)] for signature in signatures]
+
+    def similarities(doc, candidates):
+        signature = signatures[doc]
+        return [sum(x == y for x, y in zip(signature, signatures[candidate])) / len(signature)
+                for candidate in candidates]
+
+    return _assign(band_keys, similarities, threshold)
+
+
+def _cluster_numpy(np, signatures, bands, threshold):
+    rows = signatures.shape[1] // bands
+    # バンドごとの rows 個の値を1つの 64 ビットのキーにまとめる (衝突しても類似度で判定するため問題ない)
+    mixed = signatures.reshape(len(signatures), bands, rows) * np.uint64(_HASH_MULTIPLIER)
+    keys = np.zeros((len(signatures), bands), dtype=np.uint64)
+    for row in range(rows):
+        keys = (keys ^ mixed[:, :, row]) * np.uint64(0x100000001B3)
+
+    def similarities(doc, candidates):
+        return (signatures[candidates] == signatures[doc]).mean(axis=1).tolist()
+
+    return _assign(keys.tolist(), similarities, threshold)
+
+
+def cluster_texts(texts, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+    """
+    そろえた質問のリストをまとめ、質問ごとのまとまりの中心 (代表) の位置を返します。
+    先に並んでいる質問ほど中心になりやすいため、優先する質問から順に渡してください。
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+    if not texts:
+        return []
+    try:
+        import numpy as np
+    except ImportError:
+        return _cluster_python(_signatures_python(texts, num_perm), bands, threshold)
+    return _cluster_numpy(np, _signatures_numpy(np, texts, num_perm), bands, threshold)
+
+
+def mine(table, rows=None, threshold=THRESHOLD, negative_weight=NEGATIVE_WEIGHT, num_perm=NUM_PERM, bands=BANDS):
+    """
+    LogTable の question 列をまとめ、まとまりのリストを重みの大きい順に返します。
+    まとまりは {"question": 代表, "weight", "occurrences", "negative", "members": [質問ごとの集計]} です。
+    """
+    stats = [item for item in table.group_by("question", rows) if item["question"]]
+    for item in stats:
+        item["weight"] = item["count"] + negative_weight * item["negative"]
+    # そろえた結果が同じ質問は同じ文書として扱い、重みの大きい文書から中心を決める
+    stats.sort(key=lambda item: -item["weight"])
+    documents = {}
+    for position, item in enumerate(stats):
+        documents.setdefault(normalize(item["question"]) or item["question"], []).append(position)
+    texts = list(documents)
+    groups = {}
+    for root, positions in zip(cluster_texts(texts, threshold, num_perm, bands), documents.values()):
+        groups.setdefault(root, []).extend(positions)
+
+    clusters = []
+    for positions in groups.values():
+        members = sorted((stats[position] for position in positions), key=lambda item: -item["weight"])
+        clusters.append({
+            "question": members[0]["question"],
+            "weight": sum(item["weight"] for item in members),
+            "occurrences": sum(item["count"] for item in members),
+            "negative": sum(item["negative"] for item in members),
+            "members": members
+        })
+    clusters.sort(key=lambda cluster: -cluster["weight"])
+    return clusters
+
+
+def write_suite(clusters, output_file, top=None, min_occurrences=1):
+    """
+    まとまりの代表の質問を wxo_test_auto_local.py の入力 CSV に書き出し、書き出した行数を返します。
+    """
+    selected = [cluster for cluster in clusters if cluster["occurrences"] >= min_occurrences][:top]
+    # Excel で開けるよう BOM 付きで書く (QuestionSource は utf-8-sig で読む)
+    with open(output_file, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS, **CSV_OPTIONS)
+        writer.writeheader()
+        for cluster in selected:
+            writer.writerow({
+                "Question": cluster["question"],
+                "Variants": len(cluster["members"]),
+                "Occurrences": cluster["occurrences"],
+                "Negative": cluster["negative"],
+                "Weight": round(cluster["weight"], 2),
+                "Examples": " | ".join(item["question"] for item in cluster["members"][1:EXAMPLES + 1])
+            })
+    return len(selected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate WXO_LOG questions into a test suite")
+    parser.add_argument("path", nargs="?", help="exported CSV / JSON Lines, or a LogStore .db file")
+    parser.add_argument("output_file", help="input CSV for wxo_test_auto_local.py")
+    parser.add_argument("--store", action="store_true", help="read the sync store (WXO_LOG_STORE) instead of a file")
+    parser.add_argument("--start", help="only rows with timestamp >= START")
+    parser.add_argument("--end", help="only rows with timestamp < END")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help=f"minimum estimated Jaccard similarity of character bigrams (default: {THRESHOLD})")
+    parser.add_argument("--negative-weight", type=float, default=NEGATIVE_WEIGHT,
+                        help=f"weight of a negative rating relative to one occurrence (default: {NEGATIVE_WEIGHT})")
+    parser.add_argument("--top", type=int, help="write at most N questions")
+    parser.add_argument("--min-count", type=int, default=1, help="skip clusters asked fewer than N times")
+    parser.add_argument("--clusters", help="also write every cluster with its members to this JSON file")
+    args = parser.parse_args()
+    if args.store == bool(args.path):
+        parser.error("give either an export file or --store")
+
+    started = time.perf_counter()
+    if args.store:
+        from log_store import open_store
+        store = open_store()
+        try:
+            table = LogTable.from_store(store)
+        finally:
+            store.close()
+    else:
+        table = LogTable.load(args.path)
+    rows = table.select(args.start, args.end) if (args.start or args.end) else None
+    clusters = mine(table, rows, args.threshold, args.negative_weight)
+    written = write_suite(clusters, args.output_file, args.top, args.min_count)
+    if args.clusters:
+        with open(args.clusters, "w", encoding="utf-8") as f:
+            json.dump(clusters, f, indent=2, ensure_ascii=False)
+
+    distinct = sum(len(cluster["members"]) for cluster in clusters)
+    print(f"{len(table) if rows is None else len(rows)} rows, {distinct} distinct questions, "
+          f"{len(clusters)} clusters ({time.perf_counter() - started:.2f}s)")
+    print(f"{written} questions saved to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+WXO Test Automation - Question Source
+
+質問の入力を1行ずつ読み出します。ファイル全体を読み込まないため、
+数百万行の入力でもメモリ使用量はほぼ一定です。
+
+対応する形式:
+    - CSV (UTF-8, BOM 可): 1行目が列名。質問の列は QUESTION_COLUMNS の順に探し、
+      見つからなければ先頭の列を使います
+    - JSON Lines (.jsonl / .ndjson): 1行に1つの JSON オブジェクト (requests.jsonl と同じ形式)。
+      質問のキーは CSV と同じ順に探し、見つからなければ最初の文字列の値のキーを使います。
+      JSON の文字列だけの行はそれを質問とします
+    - 標準入力 ("-"): 最初の空でない行が { か " で始まれば JSON Lines、それ以外は CSV
+
+質問以外の列 (模範解答・必須単語・カテゴリなど) はメタデータとして質問と一緒に返し、
+結果の CSV にそのまま追加できます。メタデータの列 (columns) は最初の行で決まり、
+JSON Lines で後の行にだけあるキーは無視します。
+
+    with QuestionSource("questions.jsonl") as source:
+        print(source.question_column, source.columns)
+        for text, metadata in source:
+            ...
+"""
+
+import csv
+import io
+import json
+import sys
+from itertools import chain
+
+QUESTION_COLUMNS = ["Question", "question", "質問", "input", "Input"]
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+STDIN = "-"
+
+
+def _text(value):
+    # メタデータの値を CSV のセルの文字列にする (配列やオブジェクトは JSON のまま)
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+class QuestionSource:
+    """
+    質問の入力を (質問文, メタデータの dict) の順に返すイテレータ。
+    open() (または with) の後に question_column / columns / format が決まります。
+    """
+
+    def __init__(self, path, question_column=None):
+        self.path = path
+        self.question_column = question_column
+        self.columns = []
+        self.format = None
+        self.count = 0
+        self._file = None
+        self._records = iter(())
+
+    def open(self):
+        if self.path == STDIN:
+            self._file = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+        else:
+            self._file = open(self.path, "r", encoding="utf-8-sig", newline="")
+        lines = iter(self._file)
+        if self.path == STDIN:
+            # 最初の空でない行で形式を判定し、読んだ行は戻す
+            head = []
+            for line in lines:
+                head.append(line)
+                if line.strip():
+                    break
+            jsonl = bool(head) and head[-1].lstrip().startswith(("{", '"'))
+            lines = chain(head, lines)
+        else:
+            jsonl = self.path.lower().endswith(JSONL_EXTENSIONS)
+        self.format = "jsonl" if jsonl else "csv"
+        try:
+            self._records = self._read_jsonl(lines) if jsonl else self._read_csv(lines)
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def _read_csv(self, lines):
+        reader = csv.DictReader(lines)
+        fieldnames = reader.fieldnames or []
+        self._choose_columns(fieldnames, fieldnames[:1])
+        return reader
+
+    def _read_jsonl(self, lines):
+        records = self._parse_jsonl(lines)
+        first = next(records, None)
+        if first is None:
+            self._choose_columns([], [])
+            return iter(())
+        keys = list(first)
+        self._choose_columns(keys, [key for key in keys if isinstance(first[key], str)][:1] or keys[:1])
+        return chain([first], records)
+
+    @staticmethod
+    def _parse_jsonl(lines):
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"line {number}: invalid JSON ({e})") from None
+            if isinstance(record, str):
+                record = {QUESTION_COLUMNS[0]: record}
+            if not isinstance(record, dict):
+                raise ValueError(f"line {number}: expected a JSON object or string")
+            yield record
+
+    def _choose_columns(self, names, fallback):
+        if self.question_column is None:
+            self.question_column = next((name for name in QUESTION_COLUMNS if name in names),
+                                        fallback[0] if fallback else QUESTION_COLUMNS[0])
+        elif names and self.question_column not in names:
+            raise ValueError(f"question column '{self.question_column}' not found in {self.path}")
+        self.columns = [name for name in names if name != self.question_column]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        record = next(self._records)
+        self.count += 1
+        text = _text(record.get(self.question_column)).strip()
+        return text, {name: _text(record.get(name)) for name in self.columns}
+
+    def close(self):
+        if self._file is not None:
+            if self.path == STDIN:
+                # sys.stdin は閉じない
+                self._file.detach()
+            else:
+                self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self if self._file is not None else self.open()
+
+    def __exit__(self, *exc):
+        self.close()
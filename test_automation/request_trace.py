@@ -0,0 +1,152 @@
+"""
+WXO Test Automation - Request Trace
+
+質問ごとのレイテンシの内訳 (IAM・DNS・TCP 接続・TLS・応答待ち・本文の読み取り)
+と送受信バイト数を記録します。
+
+    trace = request_trace.start()       # このスレッドで計測を開始
+    ... get_access_token / send_chat_message ...
+    row.update(request_trace.finish())  # COLUMNS の値を取り出して計測を終了
+
+計測は start() を呼んだスレッドだけで行われ、呼ばない場合は http_pool の
+記録処理も行われません。TraceSummary で1回の実行分をまとめ、フェーズごとの
+パーセンタイルとヒストグラムを JSON で出力できます。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import http_pool
+
+# 時間 (秒) の列
+PHASE_COLUMNS = ["IAMTime", "DNSTime", "ConnectTime", "TLSTime", "WaitTime", "ReadTime"]
+# 結果に追加される列
+COLUMNS = PHASE_COLUMNS + ["RequestBytes", "ResponseBytes", "ConnectionReused"]
+
+# ヒストグラムの上限 (秒)。最後のバケットはそれより大きい値
+HISTOGRAM_BOUNDS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 60]
+
+
+def start():
+    """
+    現在のスレッドで計測を開始し、記録先の dict を返します。
+    """
+    trace = {}
+    http_pool.set_trace(trace)
+    return trace
+
+
+def active():
+    """
+    現在のスレッドで計測中かどうかを返します。
+    """
+    return http_pool.current_trace() is not None
+
+
+def add(name, value):
+    """
+    計測中であれば値を加算します (計測していないスレッドでは何もしません)。
+    """
+    trace = http_pool.current_trace()
+    if trace is not None:
+        trace[name] = trace.get(name, 0) + value
+
+
+@contextmanager
+def phase(name):
+    """
+    with ブロックの所要時間を name に加算します。
+    """
+    if http_pool.current_trace() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - started)
+
+
+def finish():
+    """
+    計測を終了し、COLUMNS の値を dict で返します (記録のない列は空文字)。
+    """
+    trace = http_pool.current_trace() or {}
+    http_pool.set_trace(None)
+    row = {}
+    for column in COLUMNS:
+        value = trace.get(column, "")
+        row[column] = round(value, 4) if isinstance(value, float) else value
+    return row
+
+
+def percentile(sorted_values, pct):
+    """
+    ソート済みの値から最近傍順位法でパーセンタイルを求めます。
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def histogram(values):
+    """
+    値を HISTOGRAM_BOUNDS のバケットに数えます。[{"le": 上限, "count": 件数}, ...] を返します。
+    """
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for value in values:
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = HISTOGRAM_BOUNDS + ["+Inf"]
+    return [{"le": label, "count": count} for label, count in zip(labels, counts)]
+
+
+class TraceSummary:
+    """
+    1回の実行分の計測値を集計します。スレッドセーフです。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = []
+
+    def add(self, row):
+        with self._lock:
+            self._rows.append(row)
+
+    def to_dict(self):
+        with self._lock:
+            rows = list(self._rows)
+        phases = {}
+        for column in PHASE_COLUMNS:
+            values = sorted(row[column] for row in rows if isinstance(row.get(column), (int, float)))
+            phases[column] = {
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 4) if values else None,
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else None,
+                "histogram": histogram(values)
+            }
+        sizes = {}
+        for column in ("RequestBytes", "ResponseBytes"):
+            values = [row[column] for row in rows if isinstance(row.get(column), int)]
+            sizes[column] = {
+                "total": sum(values),
+                "mean": round(sum(values) / len(values), 1) if values else None,
+                "max": max(values) if values else None
+            }
+        reused = [row["ConnectionReused"] for row in rows if row.get("ConnectionReused") in (0, 1)]
+        return {
+            "requests": len(rows),
+            "phases": phases,
+            "bytes": sizes,
+            "connections": {"reused": sum(reused), "new": len(reused) - sum(reused)}
+        }
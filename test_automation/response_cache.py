@@ -0,0 +1,151 @@
+"""
+WXO Test Automation - Response Cache
+
+エージェントの回答をディスク (SQLite) にキャッシュします。
+キーはエージェントIDと正規化した質問文 (NFKC・前後の空白除去・連続空白の圧縮)
+のハッシュです。同じ questions.csv を同じエージェントに繰り返し流す場合、
+変更のない質問はエージェントに送信せずキャッシュから回答を返します。
+
+- ttl 秒を過ぎたエントリは使用しません
+- max_entries を超えると最後に参照された時刻が古いものから削除します (LRU)
+
+環境変数:
+    - WXO_CACHE_FILE: キャッシュファイルのパス
+    - WXO_CACHE_TTL: 有効期限 (秒, デフォルト: 86400)
+    - WXO_CACHE_MAX_ENTRIES: 最大エントリ数 (デフォルト: 10000)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 10000
+EVICT_EVERY = 100
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """
+    キャッシュキー用に質問文を正規化します。
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", question)).strip()
+
+
+def cache_key(agent_id, question):
+    """
+    エージェントIDと正規化した質問文から SHA-256 のキーを作ります。
+    """
+    text = f"{agent_id}\0{normalize_question(question)}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def group_duplicates(indices, key_of):
+    """
+    同じキーを持つインデックスをまとめます。
+    (送信するインデックスのリスト, {代表インデックス: [重複インデックス, ...]}) を返します。
+    key_of が None を返すインデックスはまとめずにそのまま送信します。
+    """
+    representatives = {}
+    unique = []
+    duplicates = {}
+    for idx in indices:
+        key = key_of(idx)
+        if key is None:
+            unique.append(idx)
+            continue
+        first = representatives.setdefault(key, idx)
+        if first == idx:
+            unique.append(idx)
+        else:
+            duplicates.setdefault(first, []).append(idx)
+    return unique, duplicates
+
+
+class ResponseCache:
+    """
+    SQLite ファイルに回答を保存する TTL + LRU キャッシュ。スレッドセーフです。
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " answer TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def get(self, agent_id, question):
+        """
+        キャッシュ済みの回答を返します。ないか期限切れの場合は None を返します。
+        """
+        key = cache_key(agent_id, question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, agent_id, question, answer):
+        """
+        回答を保存します。上限を超えた分は EVICT_EVERY 件ごとに古い順に削除します。
+        """
+        key = cache_key(agent_id, question)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, answer, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, answer, now, now)
+            )
+            self._puts += 1
+            if self._puts >= EVICT_EVERY:
+                self._evict(now)
+
+    def close(self):
+        with self._lock:
+            if self._puts:
+                self._evict(time.time())
+            self._conn.close()
+
+    def _evict(self, now):
+        # 書き込みのたびに走査しないよう、EVICT_EVERY 件ごとにまとめて削除する
+        self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ? OR key IN ("
+            " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (now - self.ttl, self.max_entries)
+        )
+        self._puts = 0
+
+
+def open_cache(path=None):
+    """
+    環境変数の設定を反映した ResponseCache を開きます。
+    """
+    return ResponseCache(
+        path or os.getenv("WXO_CACHE_FILE", ".wxo_response_cache.db"),
+        ttl=float(os.getenv("WXO_CACHE_TTL", DEFAULT_TTL)),
+        max_entries=int(os.getenv("WXO_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    )
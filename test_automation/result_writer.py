@@ -0,0 +1,199 @@
+"""
+WXO Test Automation - Result Writer
+
+結果 CSV を1問ごとにディスクへ書き出すライターです。
+並列実行で完了順が前後しても、出力ファイルは常に入力順に並びます
+(先頭から連続して揃った行だけを書き出し、flush + fsync します)。
+途中でクラッシュしても、それまでの結果は出力ファイルに残ります。
+
+--resume 用に、既存の出力ファイルから完了済みの行を引き継ぐ機能も持ちます。
+
+    previous, done = prepare_resume(output_file, questions)
+    with OrderedCSVWriter(output_file, fieldnames, len(questions), previous, done) as writer:
+        writer.add(index, row)
+
+入力を1行ずつ読む場合 (行数が事前にわからない場合) は、move_previous() で退避してから
+previous_rows() の行を入力と同じ順に突き合わせ、is_done() の行をそのまま add() します。
+"""
+
+import csv
+import os
+
+# 再送しなくてよいステータス
+DONE_STATUSES = ("Success", "Skipped")
+
+CSV_OPTIONS = {
+    "quoting": csv.QUOTE_ALL,
+    "lineterminator": "\r\n",  # 行終端文字
+    "strict": True  # 不正なcsvはエラー
+}
+
+
+def _ends_with_complete_row(path):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < 3:
+            return True
+        f.seek(-3, os.SEEK_END)
+        return f.read() == b'"\r\n'
+
+
+def _read_rows(path):
+    # 書き込み途中で落ちた最終行は途中までの値になるため読み捨てる
+    drop_last = not _ends_with_complete_row(path)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        previous = None
+        try:
+            for row in csv.DictReader(f):
+                if previous is not None:
+                    yield previous
+                previous = row
+        except csv.Error:
+            drop_last = True
+        if previous is not None and not drop_last:
+            yield previous
+
+
+def move_previous(output_file):
+    """
+    既存の出力ファイルを <output_file>.prev に退避し、退避先のパスを返します。
+    出力ファイルも退避済みのファイルもなければ None を返します。
+    """
+    previous = output_file + ".prev"
+    if os.path.exists(previous):
+        if os.path.exists(output_file):
+            # 前回の再開処理が途中で中断された: 出力ファイルの行が新しく、残りは .prev にある
+            _merge_interrupted(output_file, previous)
+    elif os.path.exists(output_file):
+        os.replace(output_file, previous)
+    else:
+        return None
+    return previous
+
+
+def previous_rows(previous):
+    """
+    退避したファイルの行 (dict) を先頭から順に返します (書き込み途中の最終行は除きます)。
+    """
+    return _read_rows(previous)
+
+
+def is_done(row, question):
+    """
+    前回の行が同じ質問文で、ステータスが成功またはスキップなら True を返します。
+    """
+    return row is not None and row.get("Question", "") == question and row.get("Status") in DONE_STATUSES
+
+
+def prepare_resume(output_file, questions):
+    """
+    既存の出力ファイルを <output_file>.prev に退避し、(退避先パス, 完了済みインデックスの集合) を返します。
+    questions は入力の質問文のリスト (入力順) で、同じ位置の質問文が一致し、
+    ステータスが成功またはスキップの行だけを完了済みとみなします。
+    出力ファイルがなければ (None, 空集合) を返します。
+    """
+    previous = move_previous(output_file)
+    if previous is None:
+        return None, set()
+
+    done = set()
+    for idx, row in enumerate(_read_rows(previous)):
+        if idx >= len(questions):
+            break
+        if is_done(row, questions[idx]):
+            done.add(idx)
+    return previous, done
+
+
+def _merge_interrupted(output_file, previous):
+    merged = previous + ".tmp"
+    with open(merged, "w", encoding="utf-8", newline="") as f:
+        writer = None
+        count = 0
+        for row in _read_rows(output_file):
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row.keys()), extrasaction="ignore", **CSV_OPTIONS)
+                writer.writeheader()
+            writer.writerow(row)
+            count += 1
+        for idx, row in enumerate(_read_rows(previous)):
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row.keys()), extrasaction="ignore", **CSV_OPTIONS)
+                writer.writeheader()
+            if idx >= count:
+                writer.writerow(row)
+    os.replace(merged, previous)
+    os.remove(output_file)
+
+
+class OrderedCSVWriter:
+    """
+    (index, row) を完了順に受け取り、入力順に並べ替えて逐次書き出します。
+    total は入力の行数です。事前にわからない場合は None にし、読み終えた時点で設定してください。
+    previous / done を渡すと、done に含まれるインデックスの行は previous
+    ファイルの同じ位置の行で埋めます。
+    """
+
+    def __init__(self, output_file, fieldnames, total=None, previous=None, done=None):
+        self.output_file = output_file
+        self.total = total
+        self.fieldnames = list(fieldnames)
+        self.previous = previous
+        self.done = done or set()
+        self.written = 0
+        self._pending = {}
+        self._previous_rows = enumerate(_read_rows(previous)) if previous else iter(())
+        self._file = open(output_file, "w", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction="raise", **CSV_OPTIONS)
+        self._writer.writeheader()
+        self._sync()
+        self._drain()
+
+    def add(self, index, row):
+        """
+        index 番目の結果を追加し、書き出せる行をすべて書き出します。
+        """
+        self._pending[index] = row
+        self._drain()
+
+    def close(self):
+        """
+        末尾に残った完了済みの行を書き出してファイルを閉じます。
+        total 行すべてが揃っていれば退避ファイル (.prev) を削除します。
+        """
+        if self._file is None:
+            return
+        self._drain()
+        complete = self.total is not None and self.written >= self.total
+        self._file.close()
+        self._file = None
+        if complete and self.previous and os.path.exists(self.previous):
+            os.remove(self.previous)
+
+    def _drain(self):
+        while True:
+            if self.written in self._pending:
+                row = self._pending.pop(self.written)
+            elif self.written in self.done:
+                row = self._previous_row(self.written)
+            else:
+                break
+            self._writer.writerow(row)
+            self._sync()
+            self.written += 1
+
+    def _previous_row(self, index):
+        for idx, row in self._previous_rows:
+            if idx == index:
+                return {name: row.get(name) or "" for name in self.fieldnames}
+        raise ValueError(f"Row {index} is missing from {self.previous}")
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,125 @@
+"""
+WXO Test Automation - Retry
+
+429 (Too Many Requests) や一時的な 5xx・接続エラーを受けたリクエストを、
+指数バックオフ + ジッターで再送します。Retry-After ヘッダーがあればその秒数を待ちます。
+
+    response = retry.call(lambda: send(...))
+
+送信関数は失敗時に例外を送出してください。HTTP のステータスは次のどちらの例外からも読み取ります。
+    - urllib.error.HTTPError (http_pool): e.code / e.headers
+    - requests.exceptions.HTTPError (raise_for_status): e.response.status_code / e.response.headers
+
+スロットリング (429) を受けたときと成功したときは dispatch.report_throttle() /
+report_success() で通知し、AIMDController が同時実行数を調整します。
+再送を待つ間は dispatch.idle() で同時実行数の枠を譲ります。
+
+環境変数:
+    - WXO_RETRY_MAX: 最大試行回数 (初回を含む, デフォルト: 6。1 で再送しない)
+    - WXO_RETRY_BASE: バックオフの初期値 (秒, デフォルト: 0.5)
+    - WXO_RETRY_CAP: 1回の待ち時間の上限 (秒, デフォルト: 30)
+"""
+
+import email.utils
+import os
+import random
+import time
+
+from dispatch import idle, report_success, report_throttle
+
+# 再送するステータス
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUS = 429
+
+
+def _env_number(name, default, cast=float):
+    try:
+        return cast(os.getenv(name, default))
+    except ValueError:
+        return cast(default)
+
+
+def status_and_headers(error):
+    """
+    例外から (HTTP ステータス, レスポンスヘッダー) を取り出します。HTTP 以外のエラーは (None, {})。
+    """
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None) is not None:
+        return response.status_code, response.headers
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code, getattr(error, "headers", None) or {}
+    return None, {}
+
+
+def parse_retry_after(value, now=None):
+    """
+    Retry-After の値 (秒数または HTTP 日付) を待ち秒数にします。解釈できない場合は None。
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (now if now is not None else time.time()))
+
+
+def backoff_delay(attempt, base=None, cap=None, retry_after=None):
+    """
+    attempt 回目 (0 から) の失敗後の待ち秒数を返します。
+    Retry-After がある場合はそれに少しのジッターを足し、ない場合は Full Jitter
+    (0 〜 min(cap, base * 2^attempt) の一様乱数) にします。
+    """
+    base = _env_number("WXO_RETRY_BASE", 0.5) if base is None else base
+    cap = _env_number("WXO_RETRY_CAP", 30) if cap is None else cap
+    if retry_after is not None:
+        # 同時に待った送信が一斉に再開しないよう最大 1 割ずらす
+        return min(cap, retry_after) * (1 + random.uniform(0, 0.1))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(error):
+    """
+    再送してよいエラーか判定します (再送対象のステータス、または接続・タイムアウトのエラー)。
+    """
+    status, _ = status_and_headers(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    # requests の ConnectionError / Timeout も OSError (IOError) のサブクラス
+    return isinstance(error, OSError)
+
+
+def call(send, max_attempts=None, sleep=time.sleep):
+    """
+    send() を呼び、再送できるエラーの場合は待ってから再試行します。
+    最後の試行も失敗した場合、または再送できないエラーの場合は例外をそのまま送出します。
+    """
+    if max_attempts is None:
+        max_attempts = _env_number("WXO_RETRY_MAX", 6, int)
+    attempt = 0
+    while True:
+        sent_at = time.monotonic()
+        try:
+            result = send()
+        except Exception as e:
+            status, headers = status_and_headers(e)
+            if status == THROTTLE_STATUS:
+                report_throttle(sent_at)
+            attempt += 1
+            if attempt >= max_attempts or not is_retryable(e):
+                raise
+            retry_after = parse_retry_after(headers.get("Retry-After")) if status in (429, 503) else None
+            # 待つ間は同時実行数の枠を譲る (AIMDController を使う場合)
+            with idle():
+                sleep(backoff_delay(attempt - 1, retry_after=retry_after))
+            continue
+        report_success()
+        return result
@@ -0,0 +1,338 @@
+"""
+WXO Test Automation - Run History
+
+wxo_test_auto_local.py の実行 (run) ごとの質問・回答・ステータス・レイテンシ・エージェントIDを
+ローカルの SQLite に記録し、実行をまたいだ比較を CSV を開かずに問い合わせできるようにします。
+
+    - changed_answers(X): 実行 X から回答 (またはステータス) が変わった質問
+    - latency_trend(): 直近の実行での質問ごとのレイテンシの推移
+    - error_regressions(X): 実行 X と比べたエラー率の増加と、新たにエラーになった質問
+
+質問は正規化した質問文 (response_cache.normalize_question) のハッシュで実行間を対応付けます。
+書き込みは BATCH_SIZE 行 (または FLUSH_INTERVAL 秒) ごとに1つのトランザクションにまとめるため、
+高い並列数で実行しても1行ごとのコミットで遅くなりません。
+
+環境変数:
+    - WXO_RUN_HISTORY: 履歴のパス (デフォルト: wxo_run_history.db)
+
+Usage:
+    python3 run_history.py runs
+    python3 run_history.py changed 12            # 実行 12 から最新の実行までに回答が変わった質問
+    python3 run_history.py changed 12 --run 15
+    python3 run_history.py latency --runs 10 --top 20
+    python3 run_history.py errors 12 --max-increase 0.02   # 増加が 2 ポイントを超えたら終了コード 1
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from response_cache import normalize_question
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+
+# エラーとして数えないステータス
+OK_STATUSES = ("Success", "Skipped")
+
+
+def question_key(question):
+    """
+    実行間で質問を対応付けるキー (正規化した質問文の SHA-256 の先頭 16 桁) を返します。
+    """
+    return hashlib.sha256(normalize_question(question or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _latest_results(alias):
+    # 実行内の同じ質問は最初の行だけを使う (SQLite では MIN() と一緒に選んだ列はその行の値になる)
+    return (f"{alias} AS (SELECT question_key, question, answer, status, MIN(idx) AS idx"
+            f" FROM results WHERE run_id = ? GROUP BY question_key)")
+
+
+class RunHistory:
+    """
+    実行履歴を保持する SQLite ストア。スレッドセーフです。
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " started_at TEXT NOT NULL,"
+                " finished_at TEXT,"
+                " agent_id TEXT,"
+                " input_file TEXT,"
+                " output_file TEXT,"
+                " options TEXT,"
+                " total INTEGER,"
+                " errors INTEGER)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " run_id INTEGER NOT NULL,"
+                " idx INTEGER NOT NULL,"
+                " question_key TEXT NOT NULL,"
+                " question TEXT NOT NULL,"
+                " answer TEXT,"
+                " status TEXT NOT NULL,"
+                " latency REAL,"
+                " agent_id TEXT,"
+                " PRIMARY KEY (run_id, idx))"
+            )
+            # 質問ごとの推移 (実行をまたいだ比較) と、実行ごとのエラー数の集計用
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_question ON results (question_key, run_id)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_errors ON results (run_id)"
+                f" WHERE status NOT IN {OK_STATUSES!r}"
+            )
+
+    def start_run(self, agent_id=None, input_file=None, output_file=None, options=None):
+        """
+        実行を登録し、run_id を返します。
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (started_at, agent_id, input_file, output_file, options) VALUES (?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec="seconds"), agent_id, input_file, output_file,
+                 json.dumps(options or {}, ensure_ascii=False))
+            )
+            return cursor.lastrowid
+
+    def record(self, run_id, idx, row, latency=None, agent_id=None):
+        """
+        結果の行 (Question / Answer / Status) を記録します。まとめて書き込むため、
+        batch_size 行たまるか flush_interval 秒たつまではメモリに保持します。
+        """
+        question = row.get("Question") or ""
+        entry = (run_id, idx, question_key(question), question, row.get("Answer"), row.get("Status") or "",
+                 latency, agent_id)
+        with self._lock:
+            self._pending.append(entry)
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._flushed_at >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        """
+        保持している行を書き込みます。
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO results"
+                    " (run_id, idx, question_key, question, answer, status, latency, agent_id)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._pending
+                )
+            self._pending = []
+        self._flushed_at = time.monotonic()
+
+    def finish_run(self, run_id):
+        """
+        残りの行を書き込み、実行の終了時刻・行数・エラー数を記録します。
+        """
+        with self._lock:
+            self._flush()
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE runs SET finished_at = ?,"
+                    " total = (SELECT COUNT(*) FROM results WHERE run_id = ?),"
+                    f" errors = (SELECT COUNT(*) FROM results WHERE run_id = ? AND status NOT IN {OK_STATUSES!r})"
+                    " WHERE run_id = ?",
+                    (datetime.now().isoformat(timespec="seconds"), run_id, run_id, run_id)
+                )
+
+    def latest_run(self):
+        """
+        最新の実行の run_id を返します。実行がない場合は None を返します。
+        """
+        with self._lock:
+            return self._conn.execute("SELECT MAX(run_id) FROM runs").fetchone()[0]
+
+    def runs(self, limit=20):
+        """
+        新しい順に実行の一覧を dict のリストで返します。
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT run_id, started_at, finished_at, agent_id, input_file, output_file, total, errors"
+                " FROM runs ORDER BY run_id DESC LIMIT ?", (limit,)
+            )
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor]
+
+    def changed_answers(self, since_run, run=None):
+        """
+        実行 since_run と実行 run (デフォルト: 最新) の両方にある質問のうち、回答または
+        ステータスが変わったものを run の入力順に返します。
+        """
+        run = run or self.latest_run()
+        sql = (f"WITH {_latest_results('prev')}, {_latest_results('curr')}"
+               " SELECT curr.question, prev.answer, curr.answer, prev.status, curr.status"
+               " FROM curr JOIN prev USING (question_key)"
+               " WHERE prev.answer IS NOT curr.answer OR prev.status IS NOT curr.status"
+               " ORDER BY curr.idx")
+        with self._lock:
+            rows = self._conn.execute(sql, (since_run, run)).fetchall()
+        return [{"question": question, "before_answer": before_answer, "after_answer": after_answer,
+                 "before_status": before_status, "after_status": after_status}
+                for question, before_answer, after_answer, before_status, after_status in rows]
+
+    def latency_trend(self, question=None, runs=10):
+        """
+        直近 runs 回の実行での質問ごとのレイテンシ (秒, 実行内の平均) の推移を返します。
+        最初と最後の実行の差 (change) が大きい (遅くなった) 順に並べます。
+        question を指定した場合はその質問だけを返します。
+        """
+        sql = ("SELECT question_key, MIN(question), run_id, AVG(latency) FROM results"
+               " WHERE run_id IN (SELECT run_id FROM runs ORDER BY run_id DESC LIMIT ?)"
+               " AND latency IS NOT NULL")
+        params = [runs]
+        if question is not None:
+            sql += " AND question_key = ?"
+            params.append(question_key(question))
+        sql += " GROUP BY question_key, run_id ORDER BY question_key, run_id"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        trends = {}
+        for key, text, run_id, latency in rows:
+            trend = trends.setdefault(key, {"question": text, "latencies": []})
+            trend["latencies"].append({"run_id": run_id, "latency": round(latency, 3)})
+        for trend in trends.values():
+            first, last = trend["latencies"][0]["latency"], trend["latencies"][-1]["latency"]
+            trend["change"] = round(last - first, 3)
+            trend["ratio"] = round(last / first, 2) if first else None
+        return sorted(trends.values(), key=lambda trend: trend["change"], reverse=True)
+
+    def error_regressions(self, baseline_run, run=None):
+        """
+        実行 run (デフォルト: 最新) のエラー率を baseline_run と比べ、増加量 (increase) と、
+        baseline_run では成功していたのにエラーになった質問 (new_errors) を返します。
+        """
+        run = run or self.latest_run()
+        rates = {}
+        with self._lock:
+            for run_id in (baseline_run, run):
+                sent, errors = self._conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(status NOT IN {OK_STATUSES!r}), 0) FROM results"
+                    " WHERE run_id = ? AND status != 'Skipped'", (run_id,)
+                ).fetchone()
+                rates[run_id] = {"run_id": run_id, "sent": sent, "errors": errors,
+                                 "error_rate": round(errors / sent, 4) if sent else None}
+            sql = (f"WITH {_latest_results('prev')}, {_latest_results('curr')}"
+                   " SELECT curr.question, curr.status FROM curr JOIN prev USING (question_key)"
+                   f" WHERE prev.status = 'Success' AND curr.status NOT IN {OK_STATUSES!r}"
+                   " ORDER BY curr.idx")
+            new_errors = [{"question": question, "status": status}
+                          for question, status in self._conn.execute(sql, (baseline_run, run))]
+        baseline, current = rates[baseline_run], rates[run]
+        increase = (round(current["error_rate"] - baseline["error_rate"], 4)
+                    if None not in (current["error_rate"], baseline["error_rate"]) else None)
+        return {"baseline": baseline, "run": current, "increase": increase, "new_errors": new_errors}
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+
+def open_history(path=None):
+    """
+    環境変数の設定を反映した RunHistory を開きます。
+    """
+    return RunHistory(path or os.getenv("WXO_RUN_HISTORY", "wxo_run_history.db"))
+
+
+def _shorten(text, width=60):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the run history of wxo_test_auto_local.py")
+    parser.add_argument("--db", help="history database (default: WXO_RUN_HISTORY or wxo_run_history.db)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runs = commands.add_parser("runs", help="list recent runs")
+    runs.add_argument("--limit", type=int, default=20, help="runs to list (default: 20)")
+    changed = commands.add_parser("changed", help="questions whose answer changed since a run")
+    changed.add_argument("since", type=int, help="run id to compare against")
+    changed.add_argument("--run", type=int, help="run id to compare (default: latest)")
+    latency = commands.add_parser("latency", help="per-question latency over recent runs")
+    latency.add_argument("--question", help="only this question")
+    latency.add_argument("--runs", type=int, default=10, help="recent runs to include (default: 10)")
+    latency.add_argument("--top", type=int, default=20, help="questions to show (default: 20)")
+    errors = commands.add_parser("errors", help="error rate of a run compared with a baseline run")
+    errors.add_argument("baseline", type=int, help="baseline run id")
+    errors.add_argument("--run", type=int, help="run id to compare (default: latest)")
+    errors.add_argument("--max-increase", type=float, default=None,
+                        help="exit with status 1 when the error rate grew by more than this (e.g. 0.02)")
+    args = parser.parse_args()
+
+    history = open_history(args.db)
+    try:
+        if args.command == "runs":
+            result = history.runs(args.limit)
+        elif args.command == "changed":
+            result = history.changed_answers(args.since, args.run)
+        elif args.command == "latency":
+            result = history.latency_trend(args.question, args.runs)[:args.top]
+        else:
+            result = history.error_regressions(args.baseline, args.run)
+    finally:
+        history.close()
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    elif args.command == "runs":
+        for run in result:
+            print(f"{run['run_id']:>5}  {run['started_at']}  {run['agent_id'] or '-'}  "
+                  f"{run['total'] if run['total'] is not None else '?'} rows, "
+                  f"{run['errors'] if run['errors'] is not None else '?'} errors  {run['output_file'] or ''}")
+    elif args.command == "changed":
+        for row in result:
+            print(f"- {_shorten(row['question'])}")
+            print(f"    before [{row['before_status']}]: {_shorten(row['before_answer'])}")
+            print(f"    after  [{row['after_status']}]: {_shorten(row['after_answer'])}")
+        print(f"{len(result)} questions changed")
+    elif args.command == "latency":
+        for trend in result:
+            values = " -> ".join(f"{point['latency']:.2f}" for point in trend["latencies"])
+            print(f"{trend['change']:+8.3f}s  {values}  {_shorten(trend['question'], 40)}")
+    else:
+        baseline, current = result["baseline"], result["run"]
+        print(f"baseline run {baseline['run_id']}: {baseline['errors']}/{baseline['sent']} errors "
+              f"(rate {baseline['error_rate']})")
+        print(f"run {current['run_id']}: {current['errors']}/{current['sent']} errors "
+              f"(rate {current['error_rate']}), increase {result['increase']}")
+        for row in result["new_errors"]:
+            print(f"  new error [{row['status']}]: {_shorten(row['question'])}")
+
+    if (args.command == "errors" and args.max_increase is not None
+            and result["increase"] is not None and result["increase"] > args.max_increase):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
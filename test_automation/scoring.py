@@ -0,0 +1,251 @@
+"""
+WXO Test Automation - Answer Scoring
+
+結果 CSV の回答を、入力 CSV の必須単語 (必須単語1〜3) と模範解答で採点します。
+Office Script (wxo_test_auto_os.ts) がセルごとに行っている必須単語の検索を
+Excel の外でまとめて行い、模範解答との類似度を追加します。
+
+    - 検索結果: 必須単語ごとに 〇 (含む) / × (含まない) / - (未設定) をカンマ区切りで
+      (Office Script の G 列と同じ形式。完全一致の部分文字列検索)
+    - 類似度: 模範解答との文字 n-gram (2, 3-gram) TF-IDF のコサイン類似度 (0〜1)。
+      IDF は全行の回答と模範解答から求めます。どちらかが空の行は空欄。
+      全角英数記号・全角スペースは半角に、英大文字は小文字にそろえてから比較します
+
+NumPy があれば n-gram の抽出から類似度までを配列演算でまとめて計算します
+(CHUNK_ROWS 行ずつ処理するため、メモリは行数によらずほぼ一定です)。
+ない場合は同じ計算を標準ライブラリで行います (結果は同じで、時間がかかります)。
+
+Usage:
+    python3 scoring.py questions.csv results.csv [scored.csv]
+    (出力を省略すると <results>_scored.csv)
+"""
+
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+from question_source import QUESTION_COLUMNS
+from result_writer import CSV_OPTIONS
+
+NGRAM_SIZES = (2, 3)
+CHUNK_ROWS = 20000
+KEYWORD_COLUMNS = ["必須単語1", "必須単語2", "必須単語3"]
+MODEL_ANSWER_COLUMN = "模範解答"
+# 出力列 (Office Script の「出力」シートと同じ並び + Status / 類似度)
+OUTPUT_COLUMNS = ["質問", "模範解答", "WXO回答"] + KEYWORD_COLUMNS + ["検索結果", "類似度", "Status"]
+
+# n-gram のキー: 1文字 21 ビット (Unicode の範囲) を連結し、文書番号と組み合わせるため 40 ビットに縮める
+_CODE_BITS = 21
+_HASH_BITS = 40
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+# 全角英数記号 (U+FF01〜U+FF5E)・全角スペースを半角に、英大文字を小文字に
+# (NFKC は日本語の文字列では遅いため、比較に効く範囲だけをそろえる)
+_FOLD = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_FOLD[0x3000] = 0x20
+for _code in range(ord("A"), ord("Z") + 1):
+    _FOLD[_code] = _FOLD[_code + 0xFEE0] = _code + 32
+
+
+def _fold(text):
+    return text.translate(_FOLD)
+
+
+def _fold_codes(np, codes):
+    # _fold() と同じ変換をコードポイントの配列に行う
+    wide = (codes >= 0xFF01) & (codes <= 0xFF5E)
+    codes[wide] -= np.uint64(0xFEE0)
+    codes[codes == 0x3000] = 0x20
+    upper = (codes >= ord("A")) & (codes <= ord("Z"))
+    codes[upper] += np.uint64(32)
+
+
+def keyword_marks(answer, keywords):
+    """
+    必須単語ごとの検索結果 (〇 / × / -) のリストを返します。
+    """
+    return ["-" if not keyword else ("〇" if keyword in answer else "×") for keyword in keywords]
+
+
+def _idf(doc_count, df):
+    # scikit-learn の smooth_idf と同じ式
+    return math.log((1 + doc_count) / (1 + df)) + 1
+
+
+def _ngrams(text):
+    return Counter(text[i:i + n] for n in NGRAM_SIZES for i in range(len(text) - n + 1))
+
+
+def _similarities_python(answers, models):
+    counts = [(_ngrams(answer), _ngrams(model)) for answer, model in zip(answers, models)]
+    df = Counter()
+    doc_count = 0
+    for pair in counts:
+        for grams in pair:
+            if grams:
+                doc_count += 1
+                df.update(grams.keys())
+    idf = {gram: _idf(doc_count, value) for gram, value in df.items()}
+    similarities = []
+    for answer, model in counts:
+        if not answer or not model:
+            similarities.append(None)
+            continue
+        dot = sum(count * model[gram] * idf[gram] ** 2 for gram, count in answer.items() if gram in model)
+        norm_answer = math.sqrt(sum((count * idf[gram]) ** 2 for gram, count in answer.items()))
+        norm_model = math.sqrt(sum((count * idf[gram]) ** 2 for gram, count in model.items()))
+        similarities.append(dot / (norm_answer * norm_model))
+    return similarities
+
+
+def _pairs_numpy(np, texts):
+    """
+    texts の各文書の (文書番号 << 40 | n-gram のハッシュ) ごとの出現回数を返します。
+    戻り値は (キー, 回数) で、キーは昇順 (文書番号順) です。
+    """
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    _fold_codes(np, codes)
+    docs = np.repeat(np.arange(len(texts), dtype=np.uint64), lengths)
+    keys = []
+    for n in NGRAM_SIZES:
+        if len(codes) < n:
+            continue
+        gram = codes[:len(codes) - n + 1].copy()
+        for offset in range(1, n):
+            gram = (gram << np.uint64(_CODE_BITS)) | codes[offset:len(codes) - n + 1 + offset]
+        # 文書の境界をまたぐ n-gram は除く
+        inside = docs[:len(docs) - n + 1] == docs[n - 1:]
+        hashed = (gram[inside] * np.uint64(_HASH_MULTIPLIER)) >> np.uint64(64 - _HASH_BITS)
+        keys.append((docs[:len(docs) - n + 1][inside] << np.uint64(_HASH_BITS)) | hashed)
+    if not keys:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(keys), return_counts=True)
+
+
+def _similarities_numpy(np, answers, models):
+    # 文書は 回答0, 模範解答0, 回答1, 模範解答1, ... の順 (文書番号 = 行 * 2 + 模範解答なら 1)
+    chunks = [(start, min(start + CHUNK_ROWS, len(answers))) for start in range(0, len(answers), CHUNK_ROWS)]
+    gram_mask = np.uint64((1 << _HASH_BITS) - 1)
+
+    def chunk_pairs(start, end):
+        texts = [text for pair in zip(answers[start:end], models[start:end]) for text in pair]
+        return _pairs_numpy(np, texts)
+
+    # 1回目: n-gram ごとの文書頻度 (DF)
+    chunk_grams, chunk_dfs = [], []
+    doc_count = 0
+    for start, end in chunks:
+        keys, _ = chunk_pairs(start, end)
+        doc_count += len(np.unique(keys >> np.uint64(_HASH_BITS)))
+        grams, df = np.unique(keys & gram_mask, return_counts=True)
+        chunk_grams.append(grams)
+        chunk_dfs.append(df)
+    grams, inverse = np.unique(np.concatenate(chunk_grams or [np.zeros(0, dtype=np.uint64)]), return_inverse=True)
+    df = np.bincount(inverse, weights=np.concatenate(chunk_dfs or [np.zeros(0)]), minlength=len(grams))
+    idf = np.log((1 + doc_count) / (1 + df)) + 1
+
+    # 2回目: TF-IDF の重みから行ごとの内積とノルムを求める
+    similarities = []
+    for start, end in chunks:
+        keys, counts = chunk_pairs(start, end)
+        docs = keys >> np.uint64(_HASH_BITS)
+        weights = counts * idf[np.searchsorted(grams, keys & gram_mask)]
+        rows = end - start
+        norms = np.sqrt(np.bincount(docs.astype(np.int64), weights=weights ** 2, minlength=rows * 2))
+        is_model = (docs & np.uint64(1)).astype(bool)
+        # 同じ行の回答と模範解答に共通する n-gram を突き合わせる (キーから文書の末尾1ビットを除く)
+        row_keys = ((docs >> np.uint64(1)) << np.uint64(_HASH_BITS)) | (keys & gram_mask)
+        _, answer_at, model_at = np.intersect1d(row_keys[~is_model], row_keys[is_model],
+                                                assume_unique=True, return_indices=True)
+        answer_weights, model_weights = weights[~is_model], weights[is_model]
+        answer_rows = (docs[~is_model] >> np.uint64(1)).astype(np.int64)
+        dots = np.bincount(answer_rows[answer_at], weights=answer_weights[answer_at] * model_weights[model_at],
+                           minlength=rows)
+        denominators = norms[0::2] * norms[1::2]
+        for dot, denominator in zip(dots.tolist(), denominators.tolist()):
+            similarities.append(dot / denominator if denominator else None)
+    return similarities
+
+
+def similarities(answers, models):
+    """
+    回答と模範解答の組ごとの TF-IDF コサイン類似度のリストを返します (どちらかが空なら None)。
+    """
+    answers = [answer or "" for answer in answers]
+    models = [model or "" for model in models]
+    try:
+        import numpy as np
+    except ImportError:
+        return _similarities_python([_fold(answer) for answer in answers], [_fold(model) for model in models])
+    return _similarities_numpy(np, answers, models)
+
+
+def score_rows(inputs, results):
+    """
+    入力 CSV の行 (dict) と結果 CSV の行 (dict) を同じ順で受け取り、OUTPUT_COLUMNS の行のリストを返します。
+    """
+    question_column = next((column for column in QUESTION_COLUMNS if inputs and column in inputs[0]), None)
+    rows = []
+    for row, result in zip(inputs, results):
+        keywords = [(row.get(column) or "").strip() for column in KEYWORD_COLUMNS]
+        answer = result.get("Answer") or ""
+        rows.append({
+            "質問": result.get("Question") or ((row.get(question_column) or "").strip() if question_column else ""),
+            "模範解答": (row.get(MODEL_ANSWER_COLUMN) or "").strip(),
+            "WXO回答": answer,
+            **dict(zip(KEYWORD_COLUMNS, keywords)),
+            "検索結果": ",".join(keyword_marks(answer, keywords)),
+            "Status": result.get("Status", "")
+        })
+    scores = similarities([row["WXO回答"] for row in rows], [row["模範解答"] for row in rows])
+    for row, score in zip(rows, scores):
+        row["類似度"] = "" if score is None else round(score, 4)
+    return rows
+
+
+def _read_csv(path):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def score_files(input_file, results_file, output_file=None):
+    """
+    入力 CSV と結果 CSV を採点して output_file (省略時は <results>_scored.csv) に書き込み、出力先を返します。
+    """
+    output_file = output_file or f"{os.path.splitext(results_file)[0]}_scored.csv"
+    inputs, results = _read_csv(input_file), _read_csv(results_file)
+    if len(inputs) != len(results):
+        raise ValueError(f"Row count mismatch: {input_file} has {len(inputs)} rows, {results_file} has {len(results)}")
+    rows = score_rows(inputs, results)
+    # Excel で開けるよう BOM 付きで書き出す
+    with open(output_file, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS, **CSV_OPTIONS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score WXO answers against required words and model answers")
+    parser.add_argument("input_file", help="input CSV with 模範解答 / 必須単語1-3 columns")
+    parser.add_argument("results_file", help="results CSV written by wxo_test_auto_local.py")
+    parser.add_argument("output_file", nargs="?", help="scored CSV (default: <results>_scored.csv)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        output_file = score_files(args.input_file, args.results_file, args.output_file)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Scored results saved to {output_file} ({time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+WXO Test Automation - Shard Coordinator
+
+大量の質問を shard_size 件ずつのシャードに分けて複数の wxo_test_auto_ce の呼び出しに並列に送り、
+結果の CSV を入力順に1つのファイルにまとめます。1回の関数呼び出しの CPU・メモリ・タイムアウトで
+処理しきれない質問数を、呼び出しの数を増やして処理するために使います。
+
+    - 送信先: --url で Code Engine の関数の URL に HTTP で送るか、--local でこのマシンの
+      プロセスプール (multiprocessing) から wxo_test_auto_ce.main を直接呼びます
+      (--stub を付けるとローカルのスタンドインサーバー (mock_server.py) に送ります)
+    - 失敗したシャード (関数のエラー応答・例外・行数の不一致) はバックオフして送り直します
+      (最大 --attempts 回。使い切ったシャードの行は Status を "Error: ..." にして出力します)
+    - 未送信のシャードがなくなった後、完了したシャードの所要時間の中央値の STRAGGLER_FACTOR 倍
+      (最低 STRAGGLER_MIN 秒) を過ぎても終わらないシャードは、空いた枠で同じシャードをもう1つ送り、
+      先に返った結果を使います (バックアップ送信)
+    - 入力は wxo_test_auto_local.py と同じ形式 (CSV / JSON Lines / 標準入力) で、送信するシャードの
+      分だけ読み進めます。質問以外の列は結果の CSV の末尾に引き継ぎます
+    - 結果は完了順に受け取り、result_writer.OrderedCSVWriter で入力順に書き出します。
+      シャードごとの所要時間と再送の集計は <出力ファイル名>_shards.json に保存します
+
+Usage:
+    python3 shard_coordinator.py questions.csv results.csv --url https://xxx.codeengine.appdomain.cloud --parallel 8
+    python3 shard_coordinator.py questions.csv results.csv --local --stub --parallel 4 --shard-size 50
+
+    --concurrency / --rps / --stream / --trace / --no-cache はシャードごとの関数呼び出しに渡します
+    (--concurrency と --rps は1回の呼び出しあたりの値です)。
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.error
+from collections import deque
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import http_pool
+import retry
+import wxo_test_auto_ce
+from request_trace import percentile
+from result_writer import OrderedCSVWriter
+
+SHARD_SIZE = 100
+ATTEMPTS = 3
+STRAGGLER_FACTOR = 2.0
+STRAGGLER_MIN = 5.0         # バックアップ送信までの最短の待ち時間 (秒)
+INVOKE_TIMEOUT = 600.0      # HTTP での1回の呼び出しのタイムアウト (秒)
+
+
+class ShardError(Exception):
+    """
+    シャードの呼び出しが失敗したことを表します。
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def invoke_local(payload):
+    """
+    このプロセスで wxo_test_auto_ce.main を呼びます (ProcessPoolExecutor のワーカーで実行)。
+    """
+    return wxo_test_auto_ce.main(payload)
+
+
+class HTTPInvoker:
+    """
+    Code Engine の関数の URL に JSON を POST し、main() と同じ形 (statusCode / headers / body) の dict を返します。
+    """
+
+    def __init__(self, url, parallel, timeout=INVOKE_TIMEOUT):
+        self.url = url
+        self.pool = http_pool.HTTPPool(max_per_host=parallel, timeout=timeout)
+
+    def __call__(self, payload):
+        headers = {"Content-Type": "application/json", "Accept": "text/csv"}
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        try:
+            with self.pool.request("POST", self.url, body=data, headers=headers) as response:
+                return {"statusCode": response.status, "headers": dict(response.headers),
+                        "body": response.read().decode("utf-8")}
+        except urllib.error.HTTPError as e:
+            return {"statusCode": e.code, "headers": dict(e.headers or {}),
+                    "body": e.read().decode("utf-8", errors="replace")}
+
+
+def shard_rows(response, expected):
+    """
+    関数の応答から結果の行 (dict) のリストを取り出します。失敗した応答は ShardError を送出します。
+    """
+    status = response.get("statusCode")
+    if status != 200:
+        headers = response.get("headers") or {}
+        retry_after = retry.parse_retry_after(headers.get("Retry-After")) if status in (429, 503) else None
+        raise ShardError(f"status {status}: {str(response.get('body', ''))[:200]}", retry_after)
+    rows = list(csv.DictReader(io.StringIO(response["body"].lstrip("\ufeff"))))
+    if len(rows) != expected:
+        raise ShardError(f"expected {expected} rows, got {len(rows)}")
+    return rows
+
+
+class ShardCoordinator:
+    """
+    シャードを executor (ThreadPoolExecutor / ProcessPoolExecutor) で並列に呼び出し、
+    再送とバックアップ送信を行いながら on_shard(開始位置, 行のリスト) に結果を渡します。
+    """
+
+    def __init__(self, executor, invoke, parallel, attempts=ATTEMPTS,
+                 straggler_factor=STRAGGLER_FACTOR, straggler_min=STRAGGLER_MIN):
+        self.executor = executor
+        self.invoke = invoke
+        self.parallel = parallel
+        self.attempts = attempts
+        self.straggler_factor = straggler_factor
+        self.straggler_min = straggler_min
+        self.stats = {"shards": 0, "invocations": 0, "retries": 0, "backups": 0, "backup_wins": 0, "failed": 0}
+        self.durations = []
+
+    def run(self, questions, payload, on_shard, shard_size=SHARD_SIZE):
+        """
+        全シャードを処理し、集計 (self.summary()) を返します。
+        questions は (質問文, メタデータの dict) のイテラブルで、送信する分だけ読み進めます
+        (保持するのは処理中のシャードの質問だけです)。結果の行にはメタデータの列を追加します。
+        payload は questions 以外の関数の引数 (agent_id, concurrency など) です。
+        """
+        questions = iter(questions)
+        shards = {}             # 未完了のシャード番号 → (開始位置, [(質問文, メタデータ), ...])
+        queue = deque()         # 送り直すシャード (シャード番号, 送信してよい時刻)
+        running = {}            # future → (シャード番号, 送信時刻, バックアップか)
+        failures = {}
+        position = 0
+        exhausted = False
+        started = time.monotonic()
+
+        def submit(number, backup=False):
+            _, chunk = shards[number]
+            future = self.executor.submit(self.invoke, {**payload, "questions": [text for text, _ in chunk]})
+            running[future] = (number, time.monotonic(), backup)
+            self.stats["invocations"] += 1
+
+        while not exhausted or shards:
+            now = time.monotonic()
+            for _ in range(len(queue)):
+                if len(running) >= self.parallel:
+                    break
+                number, not_before = queue.popleft()
+                if not_before <= now:
+                    submit(number)
+                else:
+                    queue.append((number, not_before))
+            while not exhausted and len(running) < self.parallel:
+                chunk = list(islice(questions, shard_size))
+                if not chunk:
+                    exhausted = True
+                    break
+                number = self.stats["shards"]
+                self.stats["shards"] += 1
+                shards[number] = (position, chunk)
+                position += len(chunk)
+                submit(number)
+            if exhausted and not queue:
+                self._submit_backups(running, submit, now)
+
+            if not running:
+                if queue:
+                    # 送り直しの待ち時間中
+                    time.sleep(max(0.0, min(not_before for _, not_before in queue) - now))
+                continue
+            done, _ = wait(running, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                number, sent_at, backup = running.pop(future)
+                if number not in shards:
+                    continue
+                start, chunk = shards[number]
+                try:
+                    rows = shard_rows(future.result(), len(chunk))
+                except Exception as e:
+                    if any(other == number for other, _, _ in running.values()):
+                        # 同じシャードの別の送信がまだ残っている
+                        continue
+                    failures[number] = failures.get(number, 0) + 1
+                    if failures[number] < self.attempts:
+                        self.stats["retries"] += 1
+                        delay = retry.backoff_delay(failures[number] - 1, retry_after=getattr(e, "retry_after", None))
+                        queue.append((number, time.monotonic() + delay))
+                        continue
+                    self.stats["failed"] += 1
+                    rows = [{"Question": text, "Answer": "", "Status": f"Error: shard failed: {e}"}
+                            for text, _ in chunk]
+                else:
+                    self.durations.append(time.monotonic() - sent_at)
+                    self.stats["backup_wins"] += backup
+                del shards[number]
+                failures.pop(number, None)
+                on_shard(start, [{**row, **metadata} for row, (_, metadata) in zip(rows, chunk)])
+        self.stats["elapsed"] = round(time.monotonic() - started, 3)
+        return self.summary()
+
+    def _submit_backups(self, running, submit, now):
+        # 遅れているシャードを空いた枠でもう一度送る (1シャードにつき1回まで)
+        if not self.durations or len(running) >= self.parallel:
+            return
+        threshold = max(self.straggler_min, self.straggler_factor * statistics.median(self.durations))
+        attempts = {}
+        for number, sent_at, _ in running.values():
+            attempts.setdefault(number, []).append(sent_at)
+        for number, sent_times in sorted(attempts.items(), key=lambda item: min(item[1])):
+            if len(running) >= self.parallel:
+                break
+            if len(sent_times) == 1 and now - sent_times[0] > threshold:
+                submit(number, backup=True)
+                self.stats["backups"] += 1
+
+    def summary(self):
+        durations = sorted(self.durations)
+        return {
+            **self.stats,
+            "shard_seconds": {
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "max": durations[-1] if durations else None
+            }
+        }
+
+
+def start_stub(latency):
+    """
+    スタンドインサーバーを起動し、接続先の環境変数を設定します (子プロセスにも引き継がれます)。
+    """
+    from bench_runner import start_stub as start_bench_stub
+    return start_bench_stub(latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan a question set out over several wxo_test_auto_ce invocations")
+    parser.add_argument("input_file", help="input CSV / JSON Lines / - (same formats as wxo_test_auto_local.py)")
+    parser.add_argument("output_file", help="merged results CSV")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Code Engine function URL")
+    target.add_argument("--local", action="store_true", help="call wxo_test_auto_ce.main in a local process pool")
+    parser.add_argument("--stub", action="store_true", help="with --local, send to a local mock_server instance")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="mock chat latency in seconds (default: 0.05)")
+    parser.add_argument("--agent-id", default=os.getenv("WXO_AGENT_ID"), help="agent id (default: WXO_AGENT_ID)")
+    parser.add_argument("--parallel", type=int, default=4, help="invocations in flight (default: 4)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help=f"questions per invocation (default: {SHARD_SIZE})")
+    parser.add_argument("--attempts", type=int, default=ATTEMPTS, help=f"invocations per shard before giving up (default: {ATTEMPTS})")
+    parser.add_argument("--timeout", type=float, default=INVOKE_TIMEOUT, help="HTTP timeout per invocation in seconds")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrency inside each invocation")
+    parser.add_argument("--rps", type=float, help="requests per second inside each invocation")
+    parser.add_argument("--stream", action="store_true", help="pass stream=true")
+    parser.add_argument("--trace", action="store_true", help="pass trace=true")
+    parser.add_argument("--no-cache", action="store_true", help="pass no_cache=true")
+    parser.add_argument("--question-column", metavar="NAME", help="input column / JSON key holding the question")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from wxo_test_auto_local import open_questions
+    load_dotenv()
+
+    if args.stub:
+        if not args.local:
+            parser.error("--stub requires --local")
+        server = start_stub(args.stub_latency)
+        args.agent_id = os.environ["WXO_AGENT_ID"]
+    else:
+        server = None
+    if not args.agent_id:
+        parser.error("give --agent-id or set WXO_AGENT_ID")
+    source = open_questions(args.input_file, args.question_column)
+    if source is None:
+        sys.exit(1)
+
+    payload = {"agent_id": args.agent_id, "concurrency": args.concurrency, "stream": args.stream,
+               "trace": args.trace, "no_cache": args.no_cache}
+    if args.rps:
+        payload["rps"] = args.rps
+    if args.local:
+        executor, invoke = ProcessPoolExecutor(max_workers=args.parallel), invoke_local
+    else:
+        executor, invoke = ThreadPoolExecutor(max_workers=args.parallel), HTTPInvoker(args.url, args.parallel, args.timeout)
+
+    columns = wxo_test_auto_ce.result_columns(args.stream, args.trace)
+    fieldnames = columns + [name for name in source.columns if name not in columns]
+    coordinator = ShardCoordinator(executor, invoke, args.parallel, args.attempts)
+    try:
+        with source, OrderedCSVWriter(args.output_file, fieldnames) as writer:
+            def on_shard(start, rows):
+                for offset, row in enumerate(rows):
+                    writer.add(start + offset, {name: row.get(name) or "" for name in fieldnames})
+                print(f"Rows {start + 1}-{start + len(rows)} done ({writer.written} written)")
+
+            summary = coordinator.run(source, payload, on_shard, args.shard_size)
+            writer.total = source.count
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if server:
+            server.shutdown()
+
+    summary_file = f"{os.path.splitext(args.output_file)[0]}_shards.json"
+    with open(summary_file, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print("-" * 50)
+    print(f"{summary['shards']} shards, {summary['invocations']} invocations "
+          f"({summary['retries']} retries, {summary['backups']} backups, {summary['failed']} failed) "
+          f"in {summary['elapsed']}s")
+    print(f"Results saved to {args.output_file} (summary: {summary_file})")
+
+
+if __name__ == "__main__":
+    main()
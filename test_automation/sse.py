@@ -0,0 +1,86 @@
+"""
+WXO Test Automation - Server-Sent Events
+
+/chat/completions のストリーミング応答 (text/event-stream) を解析し、
+届いたチャンクから回答を組み立てます。あわせて最初のトークンが届くまでの
+時間 (TTFT) と全体の生成時間を計測します。
+
+    answer, timings = collect_stream(response_lines, started_at)
+"""
+
+import json
+import time
+
+
+def iter_sse_data(lines):
+    """
+    SSE の行イテレータから、イベントごとの data フィールドを返します。
+    複数行の data は改行で連結されます。
+    """
+    data = []
+    for line in lines:
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if field == "data":
+            data.append(value[1:] if value.startswith(" ") else value)
+    if data:
+        yield "\n".join(data)
+
+
+def extract_delta(event):
+    """
+    1イベント分の JSON から回答テキストの断片を取り出します。
+    """
+    choices = event.get("choices") if isinstance(event, dict) else None
+    if not choices:
+        return ""
+    choice = choices[0]
+    delta = choice.get("delta") or choice.get("message") or {}
+    return delta.get("content") or ""
+
+
+def _parse_events(data):
+    try:
+        return [json.loads(data)]
+    except ValueError:
+        pass
+    # 空行が欠けて複数イベントの data が連結された場合は1行ずつ解析する
+    events = []
+    for line in data.split("\n"):
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events
+
+
+def collect_stream(lines, started_at):
+    """
+    ストリームを最後まで読み、(回答, 計測値) を返します。
+    計測値は {"TimeToFirstToken": 秒, "TotalTime": 秒} で、started_at は
+    リクエスト送信直前の time.perf_counter() の値です。
+    """
+    parts = []
+    first_token_at = None
+    for data in iter_sse_data(lines):
+        # [DONE] の後も終端まで読み切ることで、接続をプールに返却できる
+        if data.strip() == "[DONE]":
+            continue
+        text = "".join(extract_delta(event) for event in _parse_events(data))
+        if text:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(text)
+    finished_at = time.perf_counter()
+
+    timings = {
+        "TimeToFirstToken": round(first_token_at - started_at, 3) if first_token_at else "",
+        "TotalTime": round(finished_at - started_at, 3)
+    }
+    return "".join(parts), timings
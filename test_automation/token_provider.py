@@ -0,0 +1,160 @@
+"""
+WXO Test Automation - IAM Token Provider
+
+IBM Cloud IAM のアクセストークンを有効期限 (expires_in) 付きでキャッシュし、
+期限切れ前にバックグラウンドで更新します。標準ライブラリのみで動作するため、
+ローカル実行・Code Engine Function・chat_agent.py のいずれからも利用できます。
+
+    token = get_access_token(api_key)
+
+- プロバイダは API キーごとにモジュールレベルで共有されるため、
+  Code Engine のウォーム起動では IAM への問い合わせを省略できます。
+- 複数スレッドから同時に呼ばれても、更新処理は1回だけ実行されます。
+- cache_file (または環境変数 IAM_TOKEN_CACHE) を指定すると、
+  トークンをローカルファイルに保存し、CLI の再実行時に再利用します。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+IAM_TOKEN_URL = "https://iam.cloud.ibm.com/identity/token"
+
+# 期限の何秒前に更新するか (トークン寿命の1割の方が短ければそちらを使用)
+REFRESH_MARGIN = 300
+
+
+class TokenProvider:
+    """
+    1つの API キーに対するアクセストークンを管理します。
+    """
+
+    def __init__(self, api_key, cache_file=None, refresh_margin=REFRESH_MARGIN):
+        self.api_key = api_key
+        self.cache_file = cache_file
+        self.refresh_margin = refresh_margin
+        self._key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._timer = None
+        if cache_file:
+            self._load_cache()
+
+    def get_token(self):
+        """
+        有効なアクセストークンを返します。期限が近い場合のみ IAM に問い合わせます。
+        """
+        if self._token and time.time() < self._refresh_at:
+            return self._token
+        with self._lock:
+            # 待っている間に他のスレッドが更新していれば、その結果を使う
+            if not self._token or time.time() >= self._refresh_at:
+                self._refresh()
+            return self._token
+
+    def invalidate(self):
+        """
+        キャッシュ済みのトークンを破棄します (401 を受けた場合など)。
+        """
+        with self._lock:
+            self._token = None
+            self._expires_at = self._refresh_at = 0.0
+
+    def _refresh(self):
+        url = os.getenv("IAM_TOKEN_URL", IAM_TOKEN_URL)
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+        }
+        data = urllib.parse.urlencode({
+            "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
+            "apikey": self.api_key
+        }).encode("utf-8")
+
+        req = urllib.request.Request(url, data=data, headers=headers, method="POST")
+        with urllib.request.urlopen(req) as response:
+            result = json.loads(response.read().decode("utf-8"))
+
+        token = result.get("access_token")
+        if not token:
+            raise ValueError(f"IAM response has no access_token: {result}")
+        self._set_token(token, time.time() + float(result.get("expires_in", 3600)))
+        self._save_cache()
+
+    def _set_token(self, token, expires_at):
+        lifetime = max(0.0, expires_at - time.time())
+        self._token = token
+        self._expires_at = expires_at
+        self._refresh_at = expires_at - min(self.refresh_margin, lifetime * 0.1)
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(0.0, self._refresh_at - time.time()), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        with self._lock:
+            if time.time() < self._refresh_at:
+                return
+            try:
+                self._refresh()
+            except Exception:
+                # 失敗しても現在のトークンは期限まで使えるので、次回の get_token で再試行する
+                pass
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cached.get("key_id") == self._key_id and cached.get("expires_at", 0) > time.time():
+            self._set_token(cached["access_token"], cached["expires_at"])
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        try:
+            fd = os.open(self.cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({
+                    "key_id": self._key_id,
+                    "access_token": self._token,
+                    "expires_at": self._expires_at
+                }, f)
+        except OSError:
+            pass
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(api_key, cache_file=None):
+    """
+    API キーに対応する共有 TokenProvider を返します。
+    """
+    cache_file = cache_file or os.getenv("IAM_TOKEN_CACHE") or None
+    with _providers_lock:
+        provider = _providers.get(api_key)
+        if provider is None:
+            provider = TokenProvider(api_key, cache_file=cache_file)
+            _providers[api_key] = provider
+        return provider
+
+
+def get_access_token(api_key, cache_file=None):
+    """
+    キャッシュ済みのアクセストークンを返します (必要な場合のみ IAM から取得)。
+    """
+    return get_provider(api_key, cache_file).get_token()
@@ -10,43 +10,91 @@ CSV形式で結果を返します。
     - IBM_CLOUD_API_KEY: IBM Cloud APIキー
     - WXO_INSTANCE_ID: WXOインスタンスID
     - WXO_API_HOST: WXO APIホスト (デフォルト: api.us-south.watson-orchestrate.cloud.ibm.com)
+    - HTTP_POOL_SIZE / HTTP_TIMEOUT: 接続プールの保持数とタイムアウト (http_pool.py を参照)
+    - WXO_JOB_STORE: 非同期ジョブの保存先 (ファイルパスまたは URL, job_store.py を参照)
+    - WXO_RETRY_MAX / WXO_RETRY_BASE / WXO_RETRY_CAP: 429 / 5xx の再送回数と待ち時間 (retry.py を参照)
 
 リクエストパラメータ:
     - agent_id: WXOエージェントID
     - questions: 質問リスト（文字列配列）
+    - concurrency: 同時に送信する質問数 (任意, デフォルト: 1)
+    - rps: 1秒あたりの送信数の上限 (任意, デフォルト: 無制限)
+    - adaptive: false で同時実行数を固定する (任意, デフォルト: true。429 を受けると
+      同時実行数を下げ、解消すると concurrency まで戻す。dispatch.AIMDController を参照)
+    - stream: true でストリーミング受信し、TTFT と生成時間の列を追加 (任意)
+    - no_cache: true で回答キャッシュと重複質問のまとめ送信を使わない (任意)
+    - refresh: true でキャッシュを参照せずに送信し、キャッシュを更新 (任意)
+    - trace: true でレイテンシの内訳 (IAM / DNS / TCP / TLS / 応答待ち / 読み取り) と
+      送受信バイト数の列を追加し、集計を X-Trace-Summary ヘッダー (JSON) で返す (任意)
+    - async: true でジョブとして登録し、すぐに job_id を返す (任意, main() を参照)
+    - job_id / since / wait / format: 非同期ジョブのポーリング (main() を参照)
 """
 
-import urllib.request
 import json
 import csv
 import io
 import os
+import threading
+import time
+
+import http_pool
+import request_trace
+import retry
+import token_provider
+from dispatch import AIMDController, run_dispatch
+from response_cache import cache_key, group_duplicates, open_cache
+
+# 非同期ジョブ (job_store, uuid) とストリーミング (sse) のモジュールは、使うときに読み込みます
+# (通常の同期リクエストのコールドスタートで読み込まないため)
+
+# ストリーミングモードで追加される列 (秒)
+TIMING_COLUMNS = ["TimeToFirstToken", "TotalTime"]
+
+DEFAULT_API_HOST = "api.us-south.watson-orchestrate.cloud.ibm.com"
+
+_config = None
+
+
+def get_config():
+    """
+    環境変数の接続設定 (api_key / instance_id / api_host) を dict で返します。
+    ウォーム起動時は解釈済みの dict を再利用し、環境変数が変わった場合だけ読み直します。
+    """
+    global _config
+    environ = (os.getenv("IBM_CLOUD_API_KEY"), os.getenv("WXO_INSTANCE_ID"), os.getenv("WXO_API_HOST"))
+    if _config is None or _config["environ"] != environ:
+        api_key, instance_id, api_host = environ
+        _config = {
+            "environ": environ,
+            "api_key": api_key,
+            "instance_id": instance_id,
+            "api_host": api_host or DEFAULT_API_HOST
+        }
+    return _config
 
 
 def get_access_token(api_key):
     """
     IBM Cloud IAMからアクセストークンを取得します。
+    トークンはモジュールレベルでキャッシュされるため、ウォーム起動時や
+    同一実行内の2回目以降は IAM への問い合わせを行いません。
     """
-    url = "https://iam.cloud.ibm.com/identity/token"
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-    }
-    
-    data = f"grant_type=urn:ibm:params:oauth:grant-type:apikey&apikey={api_key}".encode('utf-8')
-    
-    req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-    with urllib.request.urlopen(req) as response:
-        result = json.loads(response.read().decode('utf-8'))
-        return result.get("access_token")
+    return token_provider.get_access_token(api_key)
+
+
+def api_base_url(api_host):
+    """
+    WXO_API_HOST からベースURLを作ります。
+    スキーム付き (例: ローカルのスタンドイン http://127.0.0.1:8080) の場合はそのまま使います。
+    """
+    return api_host.rstrip("/") if "://" in api_host else f"https://{api_host}"
 
 
 def send_chat_message(token, instance_id, agent_id, api_host, message_content):
     """
     Watsonx Orchestrate エージェントにチャットメッセージを送信します。
     """
-    url = f"https://{api_host}/instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions"
+    url = f"{api_base_url(api_host)}/instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions"
     
     headers = {
         "Authorization": f"Bearer {token}",
@@ -66,10 +114,11 @@ def send_chat_message(token, instance_id, agent_id, api_host, message_content):
     }
     
     data = json.dumps(payload).encode('utf-8')
-    req = urllib.request.Request(url, data=data, headers=headers, method="POST")
     
-    with urllib.request.urlopen(req) as response:
-        result = json.loads(response.read().decode('utf-8'))
+    # Keep-Alive 接続をプールから再利用して送信 (429 / 5xx はバックオフして再送)
+    pool = http_pool.get_pool()
+    with retry.call(lambda: pool.request("POST", url, body=data, headers=headers)) as response:
+        result = response.json()
         
         if 'choices' in result and len(result['choices']) > 0:
             return result['choices'][0]['message']['content'], None
@@ -77,6 +126,341 @@ def send_chat_message(token, instance_id, agent_id, api_host, message_content):
             return str(result), None
 
 
+def send_chat_message_stream(token, instance_id, agent_id, api_host, message_content):
+    """
+    "stream": True で送信し、SSE のチャンクから回答を組み立てます。
+    (回答, エラー, 計測値) を返します。計測値は TimeToFirstToken / TotalTime (秒) です。
+    """
+    url = f"{api_base_url(api_host)}/instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions"
+    
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+    }
+    
+    payload = {
+        "messages": [
+            {
+                "role": "user",
+                "content": message_content
+            }
+        ],
+        "stream": True
+    }
+    
+    data = json.dumps(payload).encode('utf-8')
+    
+    pool = http_pool.get_pool()
+    started_at = None
+    
+    def send():
+        # 計測は成功した試行の送信時刻から (再送の待ち時間を含めない)
+        nonlocal started_at
+        started_at = time.perf_counter()
+        return pool.request("POST", url, body=data, headers=headers)
+    
+    with retry.call(send) as response:
+        # サーバーがストリーミングせず JSON で返した場合
+        if "json" in (response.headers.get("Content-Type") or ""):
+            result = response.json()
+            elapsed = round(time.perf_counter() - started_at, 3)
+            timings = {"TimeToFirstToken": elapsed, "TotalTime": elapsed}
+            if 'choices' in result and len(result['choices']) > 0:
+                return result['choices'][0]['message']['content'], None, timings
+            return str(result), None, timings
+        
+        from sse import collect_stream
+        answer, timings = collect_stream(response.iter_lines(), started_at)
+        return answer, None, timings
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """
+    回答キャッシュを開きます。ウォーム起動時は同じ接続を再利用します。
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = open_cache(os.getenv("WXO_CACHE_FILE", "/tmp/wxo_response_cache.db"))
+    return _response_cache
+
+
+def _is_true(value):
+    return str(value or "").lower() in ("1", "true", "yes")
+
+
+def _json_response(status_code, payload):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json.dumps(payload, ensure_ascii=False)
+    }
+
+
+def answer_question(question, agent_id, api_key, instance_id, api_host, stream=False, cache=None, refresh=False):
+    """
+    1件の質問をエージェントに送信し、CSV の1行分の dict を返します。
+    エラーは例外にせず Status 列に入れて返します。
+    """
+    if not question:
+        return {
+            "Question": "",
+            "Answer": "",
+            "Status": "Skipped"
+        }
+    
+    if cache and not refresh:
+        answer = cache.get(agent_id, question)
+        if answer is not None:
+            return {
+                "Question": question,
+                "Answer": answer,
+                "Status": "Success"
+            }
+    
+    try:
+        # 長時間の実行中に期限切れにならないよう、質問ごとに (キャッシュから) 取得
+        with request_trace.phase("IAMTime"):
+            token = get_access_token(api_key)
+        if stream:
+            answer, error, timings = send_chat_message_stream(token, instance_id, agent_id, api_host, question)
+        else:
+            answer, error = send_chat_message(token, instance_id, agent_id, api_host, question)
+            timings = {}
+        
+        if error:
+            return {
+                "Question": question,
+                "Answer": "",
+                "Status": error,
+                **timings
+            }
+        if cache:
+            cache.put(agent_id, question, answer)
+        return {
+            "Question": question,
+            "Answer": answer,
+            "Status": "Success",
+            **timings
+        }
+    except Exception as e:
+        return {
+            "Question": question,
+            "Answer": "",
+            "Status": f"Error: {str(e)}"
+        }
+
+
+def traced(func, *args):
+    """
+    func(*args) の行に、実行中のレイテンシの内訳 (request_trace.COLUMNS) を追加して返します。
+    """
+    request_trace.start()
+    try:
+        row = func(*args)
+    finally:
+        breakdown = request_trace.finish()
+    return {**row, **breakdown}
+
+
+def trace_summary_header(results):
+    """
+    結果の行から集計 (ヒストグラム付き) を作り、ヘッダー用の JSON 文字列にします。
+    集計するのは実際にリクエストを送った (計測値のある) 行だけです。キャッシュから返した行や
+    重複としてコピーした行は数えません。
+    """
+    summary = request_trace.TraceSummary()
+    for row in results:
+        if row["Status"] != "Skipped" and any(row.get(name) not in (None, "") for name in request_trace.COLUMNS):
+            summary.add(row)
+    return json.dumps(summary.to_dict(), separators=(",", ":"))
+
+
+def result_columns(stream=False, trace=False):
+    """
+    結果の CSV の列名のリストを返します。
+    """
+    return (["Question", "Answer", "Status"] + (TIMING_COLUMNS if stream else [])
+            + (request_trace.COLUMNS if trace else []))
+
+
+def to_csv(results, stream=False, trace=False):
+    """
+    結果の行を BOM 付き CSV 文字列にします。
+    """
+    output = io.StringIO()
+    writer = csv.DictWriter(
+        output,
+        fieldnames=result_columns(stream, trace),
+        quoting=csv.QUOTE_ALL,
+        lineterminator='\r\n',
+        extrasaction='raise',
+        strict=True
+    )
+    writer.writeheader()
+    writer.writerows(results)
+    
+    # Excelで開いた際の文字化けを防ぐため BOM (\ufeff) を付与
+    return "\ufeff" + output.getvalue()
+
+
+# ----------------------------------------------------------------------
+# 非同期ジョブ (async モード)
+# ----------------------------------------------------------------------
+
+JOB_LEASE_TTL = 30          # ワーカーのリースの有効期間 (秒)
+JOB_POLL_BUDGET = 20        # ポーリング時に処理を引き継いだ場合の処理時間の上限 (秒)
+JOB_MAX_WAIT = 25           # ポーリングで新しい結果を待つ最大秒数
+
+_job_store = None
+
+
+def get_job_store():
+    """
+    ジョブストアを開きます (WXO_JOB_STORE)。ウォーム起動時は同じものを再利用します。
+    """
+    global _job_store
+    if _job_store is None:
+        from job_store import open_job_store
+        _job_store = open_job_store()
+    return _job_store
+
+
+def run_job(store, job_id, budget=None):
+    """
+    ジョブの未処理の質問を処理します。リースを取得できなかった場合は False を返します。
+    budget (秒) を指定した場合は、その時間を過ぎると新しい質問の送信をやめて戻ります。
+    """
+    import uuid
+    from job_store import STATUS_ONLY
+    owner = uuid.uuid4().hex
+    if not store.acquire_lease(job_id, owner, JOB_LEASE_TTL):
+        return False
+    try:
+        job = store.get(job_id, include_questions=True)
+        options = job["options"]
+        texts = [question.strip() if isinstance(question, str) else "" for question in job["questions"]]
+        done = {result["index"] for result in job["results"]}
+        pending = [idx for idx in range(len(texts)) if idx not in done]
+        store.set_status(job_id, "running")
+        
+        config = get_config()
+        api_key, instance_id, api_host = config["api_key"], config["instance_id"], config["api_host"]
+        cache = None if options.get("no_cache") else get_response_cache()
+        deadline = time.monotonic() + budget if budget else None
+        lease = {"renewed_at": time.monotonic(), "lost": False}
+        
+        def items():
+            # 時間切れやリースを失った場合は残りを送らない (次のポーリングで引き継がれる)
+            for idx in pending:
+                if lease["lost"] or (deadline and time.monotonic() >= deadline):
+                    return
+                yield idx
+        
+        def worker(_, idx):
+            arguments = (texts[idx], job["agent_id"], api_key, instance_id, api_host,
+                         options.get("stream", False), cache, options.get("refresh", False))
+            if options.get("trace"):
+                return idx, traced(answer_question, *arguments)
+            return idx, answer_question(*arguments)
+        
+        def on_result(_, result):
+            store.add_result(job_id, *result)
+            if time.monotonic() - lease["renewed_at"] > JOB_LEASE_TTL / 3:
+                lease["renewed_at"] = time.monotonic()
+                lease["lost"] = not store.acquire_lease(job_id, owner, JOB_LEASE_TTL)
+        
+        concurrency = options.get("concurrency", 1)
+        controller = AIMDController(concurrency) if options.get("adaptive", True) else None
+        run_dispatch(items(), worker, concurrency=concurrency, rps=options.get("rps"),
+                     on_result=on_result, collect=False, controller=controller)
+        if store.get(job_id, since=STATUS_ONLY)["completed"] >= len(texts):
+            store.set_status(job_id, "completed")
+        return True
+    except Exception as e:
+        store.set_status(job_id, "failed", str(e))
+        return True
+    finally:
+        store.release_lease(job_id, owner)
+
+
+def submit_job(agent_id, questions, options):
+    """
+    ジョブを登録し、バックグラウンドのスレッドで処理を始めます。
+    """
+    import uuid
+    store = get_job_store()
+    job_id = uuid.uuid4().hex
+    store.create(job_id, agent_id, questions, options)
+    threading.Thread(target=run_job, args=(store, job_id), daemon=True).start()
+    return job_id
+
+
+def poll_job(args):
+    """
+    ジョブの進捗と、since (前回の next) 以降に届いた結果を返します。
+    処理中のワーカーがいない (リース切れ) 場合は、この呼び出しで続きを処理します。
+    format=csv の場合は完了済みのジョブの全結果を CSV で返します。
+    """
+    from job_store import FINISHED_STATUSES
+    store = get_job_store()
+    job_id = str(args.get("job_id"))
+    try:
+        since = int(args.get("since", 0))
+        wait = min(float(args.get("wait", 0)), JOB_MAX_WAIT)
+    except (TypeError, ValueError):
+        return _json_response(400, {"error": "Invalid parameter: since / wait must be numbers"})
+    
+    job = store.get(job_id, since)
+    if job is None:
+        return _json_response(404, {"error": f"Job not found: {job_id}"})
+    
+    if job["status"] not in FINISHED_STATUSES and job["lease_until"] < time.time():
+        budget = float(os.getenv("WXO_JOB_POLL_BUDGET", JOB_POLL_BUDGET))
+        run_job(store, job_id, budget=budget)
+        job = store.get(job_id, since)
+    
+    # 新しい結果が届くか完了するまで最大 wait 秒待つ (ロングポーリング)
+    waited_until = time.monotonic() + wait
+    while not job["results"] and job["status"] not in FINISHED_STATUSES and time.monotonic() < waited_until:
+        time.sleep(0.5)
+        job = store.get(job_id, since)
+    
+    stream = job["options"].get("stream", False)
+    trace = job["options"].get("trace", False)
+    if str(args.get("format", "")).lower() == "csv":
+        if job["status"] != "completed":
+            return _json_response(409, {"error": f"Job is not completed: {job['status']}",
+                                        "completed": job["completed"], "total": job["total"]})
+        rows = {result["index"]: result["row"] for result in store.get(job_id)["results"]}
+        results = [rows[idx] for idx in range(job["total"])]
+        headers = {
+            "Content-Type": "text/csv; charset=utf-8",
+            "Access-Control-Allow-Origin": "*",
+            "Content-Disposition": "attachment; filename=wxo_results.csv"
+        }
+        if trace:
+            headers["X-Trace-Summary"] = trace_summary_header(results)
+        return {"statusCode": 200, "headers": headers, "body": to_csv(results, stream, trace)}
+    
+    return _json_response(200, {
+        "job_id": job_id,
+        "status": job["status"],
+        "error": job["error"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "results": [{"index": result["index"], **result["row"]} for result in job["results"]],
+        "next": job["next"]
+    })
+
+
 def main(args):
     """
     Code Engine Function のエントリーポイント。
@@ -84,127 +468,128 @@ def main(args):
     CSVを返します。
     
     リクエスト形式:
-        POST body: {"agent_id": "エージェントID", "questions": ["質問1", "質問2", ...]}
+        POST body: {"agent_id": "エージェントID", "questions": ["質問1", "質問2", ...],
+                    "concurrency": 8, "rps": 5, "stream": true}
     
     レスポンス形式:
         CSV (Question, Answer, Status)
+        stream が true の場合は TimeToFirstToken, TotalTime 列を追加
+    
+    非同期モード (関数のタイムアウトを超える大量の質問向け):
+        1. {"agent_id": ..., "questions": [...], "async": true} を送ると、すぐに
+           202 {"job_id": ..., "status": "queued", "total": n} を返し、バックグラウンドで処理します
+        2. {"job_id": ..., "since": 前回の next, "wait": 20} で進捗をポーリングします。
+           {"status", "total", "completed", "results": [{"index", "Question", "Answer", "Status"}], "next"}
+           を返します (results は since 以降に届いた分のみ)
+        3. 完了後に {"job_id": ..., "format": "csv"} で全結果を CSV で取得できます
     """
     
-    # 環境変数の取得
-    api_key = os.getenv("IBM_CLOUD_API_KEY")
-    instance_id = os.getenv("WXO_INSTANCE_ID")
-    api_host = os.getenv("WXO_API_HOST", "api.us-south.watson-orchestrate.cloud.ibm.com")
+    # 環境変数の取得 (ウォーム起動時は解釈済みの設定を再利用)
+    config = get_config()
+    api_key, instance_id, api_host = config["api_key"], config["instance_id"], config["api_host"]
     
     # リクエストからagent_idを取得
     agent_id = args.get("agent_id", "")
     
     if not api_key or not instance_id:
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps({"error": "Missing required environment variables (IBM_CLOUD_API_KEY, WXO_INSTANCE_ID)"})
-        }
+        return _json_response(500, {"error": "Missing required environment variables (IBM_CLOUD_API_KEY, WXO_INSTANCE_ID)"})
+    
+    try:
+        # 非同期ジョブのポーリング
+        if args.get("job_id"):
+            return poll_job(args)
+    except Exception as e:
+        return _json_response(500, {"error": str(e)})
     
     if not agent_id:
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps({"error": "Missing required parameter: agent_id"})
-        }
+        return _json_response(400, {"error": "Missing required parameter: agent_id"})
     
     try:
         # リクエストボディから質問リストを取得
         questions = args.get("questions", [])
         
         if not questions:
-            return {
-                "statusCode": 400,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                "body": json.dumps({"error": "No questions provided"})
+            return _json_response(400, {"error": "No questions provided"})
+        
+        try:
+            concurrency = int(args.get("concurrency", 1))
+            rps = float(args["rps"]) if args.get("rps") else None
+            stream = _is_true(args.get("stream"))
+            trace = _is_true(args.get("trace"))
+            adaptive = _is_true(args.get("adaptive", True))
+        except (TypeError, ValueError):
+            return _json_response(400, {"error": "Invalid parameter: concurrency / rps must be numbers"})
+        
+        # 同時実行数に合わせてホストごとの保持接続数を広げる
+        pool = http_pool.get_pool()
+        pool.max_per_host = max(pool.max_per_host, concurrency)
+        pool_before = pool.snapshot()
+        
+        # アクセストークンの取得 (認証エラーはここで 500 として返す)
+        get_access_token(api_key)
+        
+        if _is_true(args.get("async")):
+            options = {
+                "concurrency": concurrency,
+                "rps": rps,
+                "stream": stream,
+                "no_cache": _is_true(args.get("no_cache")),
+                "refresh": _is_true(args.get("refresh")),
+                "trace": trace,
+                "adaptive": adaptive
             }
+            job_id = submit_job(agent_id, questions, options)
+            return _json_response(202, {"job_id": job_id, "status": "queued", "total": len(questions)})
         
-        # アクセストークンの取得
-        token = get_access_token(api_key)
-        
-        # 各質問を処理
-        results = []
-        for question in questions:
-            question = question.strip() if isinstance(question, str) else ""
-            
-            if not question:
-                results.append({
-                    "Question": "",
-                    "Answer": "",
-                    "Status": "Skipped"
-                })
-                continue
-            
-            try:
-                answer, error = send_chat_message(token, instance_id, agent_id, api_host, question)
-                
-                if error:
-                    results.append({
-                        "Question": question,
-                        "Answer": "",
-                        "Status": error
-                    })
-                else:
-                    results.append({
-                        "Question": question,
-                        "Answer": answer,
-                        "Status": "Success"
-                    })
-            except Exception as e:
-                results.append({
-                    "Question": question,
-                    "Answer": "",
-                    "Status": f"Error: {str(e)}"
-                })
-        
-        # CSV変換 (BOM付きUTF-8)
-        output = io.StringIO()
-        writer = csv.DictWriter(
-            output,
-            fieldnames=["Question", "Answer", "Status"],
-            quoting=csv.QUOTE_ALL,
-            lineterminator='\r\n',
-            extrasaction='raise',
-            strict=True
-        )
-        writer.writeheader()
-        writer.writerows(results)
-        
-        # Excelで開いた際の文字化けを防ぐため BOM (\ufeff) を付与
-        csv_body = "\ufeff" + output.getvalue()
+        # 回答キャッシュ (no_cache で無効化、refresh でキャッシュを参照せず更新のみ)
+        cache = None if _is_true(args.get("no_cache")) else get_response_cache()
+        refresh = _is_true(args.get("refresh"))
         
-        return {
-            "statusCode": 200,
-            "headers": {
-                "Content-Type": "text/csv; charset=utf-8",
-                "Access-Control-Allow-Origin": "*",
-                "Content-Disposition": "attachment; filename=wxo_results.csv"
-            },
-            "body": csv_body
+        # 同じ質問 (正規化後) は1回だけ送信し、回答を各行にコピーする
+        texts = [question.strip() if isinstance(question, str) else "" for question in questions]
+        indices = range(len(texts))
+        duplicates = {}
+        if cache:
+            indices, duplicates = group_duplicates(
+                indices, lambda idx: cache_key(agent_id, texts[idx]) if texts[idx] else None)
+        
+        # 各質問を処理 (concurrency 件まで並列、rps で送信レートを制限)
+        def process_question(_, idx):
+            arguments = (texts[idx], agent_id, api_key, instance_id, api_host, stream, cache, refresh)
+            if trace:
+                return traced(answer_question, *arguments)
+            return answer_question(*arguments)
+        
+        controller = AIMDController(concurrency) if adaptive else None
+        sent = run_dispatch(indices, process_question, concurrency=concurrency, rps=rps, controller=controller)
+        results = [None] * len(texts)
+        for idx, result in zip(indices, sent):
+            results[idx] = result
+            # コピーした行はリクエストを送っていないため、計測値の列は空にする
+            copied = {**result, **dict.fromkeys(request_trace.COLUMNS, "")} if trace else result
+            for duplicate in duplicates.get(idx, ()):
+                results[duplicate] = {**copied, "Question": texts[duplicate]}
+        reuse = http_pool.reuse_summary(pool_before, pool.snapshot())
+        
+        headers = {
+            "Content-Type": "text/csv; charset=utf-8",
+            "Access-Control-Allow-Origin": "*",
+            "Content-Disposition": "attachment; filename=wxo_results.csv",
+            # 接続プールの再利用状況 (送信リクエスト数 / うち既存接続を再利用した数)
+            "X-Pool-Requests": str(reuse["requests"]),
+            "X-Pool-Reused": str(reuse["reused"])
         }
+        if controller:
+            # 429 を受けた回数と、下がった同時実行数の最小値
+            headers["X-Throttled"] = str(controller.throttled)
+            headers["X-Concurrency-Lowest"] = str(controller.lowest)
+        if trace:
+            headers["X-Trace-Summary"] = trace_summary_header(results)
+            headers["Access-Control-Expose-Headers"] = "X-Trace-Summary"
+        return {"statusCode": 200, "headers": headers, "body": to_csv(results, stream, trace)}
     
     except Exception as e:
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps({"error": str(e)})
-        }
+        return _json_response(500, {"error": str(e)})
 
 
 if __name__ == "__main__":
@@ -222,6 +607,7 @@ if __name__ == "__main__":
     result = main(test_args)
     
     if result["statusCode"] == 200:
+        print(f"接続の再利用: {result['headers']['X-Pool-Reused']}/{result['headers']['X-Pool-Requests']}")
         with open("test_output.csv", "w", encoding="utf-8-sig", newline="") as f:
             f.write(result["body"])
         print("--- 成功！ ---")
@@ -5,21 +5,73 @@ WXO Test Automation Script
 Watsonx Orchestrate エージェントに送信し、
 回答を含む新しいCSVファイルを出力します。
 
+入力は CSV のほか JSON Lines (.jsonl) と標準入力 (-) に対応し、1行ずつ読みながら送信します
+(question_source.py を参照)。質問以外の列 (模範解答・必須単語など) は結果の CSV の末尾に引き継ぎます。
+
 Usage:
     python3 wxo_test_automation.py input.csv output.csv
 
     または、デフォルトのファイル名を使用:
     python3 wxo_test_automation.py
     (入力: questions.csv, 出力: results.csv)
+
+Options:
+    --concurrency N   同時に送信する質問数 (デフォルト: 1)
+    --rps N           1秒あたりの送信数の上限 (デフォルト: 無制限)
+    --token-cache F   アクセストークンをファイル F にキャッシュして再実行時に再利用
+    --stream          ストリーミング (SSE) で回答を受信し、TTFT と生成時間を出力
+    --resume          既存の出力ファイルを引き継ぎ、未回答・失敗した質問だけを送信
+                      (出力ファイルを省略した場合は最新の results_<日時>.csv を引き継ぐ)
+    --no-cache        回答キャッシュと重複質問のまとめ送信を使わない
+    --refresh         キャッシュを参照せずに全質問を送信し、キャッシュを更新
+    --trace           IAM・応答待ち・本文の読み取りの時間と送受信バイト数の列を追加し、
+                      集計 (ヒストグラム付き) を <出力ファイル名>_trace.json に保存
+    --score           完了後に必須単語 (必須単語1〜3) の検索と模範解答との類似度を計算し、
+                      <出力ファイル名>_scored.csv に保存 (scoring.py を参照)
+    --agents ID,ID,...
+                      同じ質問を複数のエージェントに同時に送信して比較し、エージェントごとの
+                      回答・レイテンシ・採点と先頭のエージェントとの差を1つの CSV に出力
+                      (統計は <出力ファイル名>_ab.json。--concurrency / --rps はエージェントごと)
+    --fixed-concurrency
+                      同時実行数を固定する (デフォルトでは 429 を受けると同時実行数を下げ、
+                      解消すると --concurrency まで戻す)
+    --question-column NAME
+                      質問の列名 / JSON のキー (デフォルト: Question, 質問 などを探し、なければ先頭の列)
+    --history FILE    実行履歴 (質問・回答・ステータス・レイテンシ) を記録する SQLite
+                      (デフォルト: WXO_RUN_HISTORY または wxo_run_history.db。run_history.py で比較)
+    --no-history      実行履歴を記録しない
+    (429 / 5xx は指数バックオフで再送します。回数と待ち時間は WXO_RETRY_MAX /
+     WXO_RETRY_BASE / WXO_RETRY_CAP で変更できます)
+    (キャッシュの保存先・有効期限は WXO_CACHE_FILE / WXO_CACHE_TTL で変更できます)
+
+    例: python3 wxo_test_automation.py questions.csv results.csv --concurrency 32 --rps 10
 """
 
 import os
 import sys
 import csv
+import json
+import time
+import argparse
+import glob
 import requests
 from dotenv import load_dotenv
 from datetime import datetime
 
+import request_trace
+import retry
+import scoring
+import token_provider
+from dispatch import AIMDController, run_dispatch
+from sse import collect_stream
+from question_source import QUESTION_COLUMNS, QuestionSource
+from result_writer import CSV_OPTIONS, OrderedCSVWriter, is_done, move_previous, previous_rows
+from response_cache import cache_key, open_cache
+from run_history import open_history
+
+# Extra result columns written in streaming mode (seconds)
+TIMING_COLUMNS = ["TimeToFirstToken", "TotalTime"]
+
 # Load environment variables
 load_dotenv()
 
@@ -27,46 +79,62 @@ load_dotenv()
 def get_access_token():
     """
     Retrieves an IAM access token from IBM Cloud.
+    The token is cached until shortly before it expires, so this is cheap
+    to call for every question.
     """
-    url = "https://iam.cloud.ibm.com/identity/token"
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "application/json"
-    }
-    
     api_key = os.getenv("IBM_CLOUD_API_KEY")
     
     if not api_key:
         print("Error: IBM_CLOUD_API_KEY is not set in .env file.")
         return None
-    
-    data = {
-        "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
-        "apikey": api_key
-    }
 
     try:
-        response = requests.post(url, headers=headers, data=data)
-        response.raise_for_status()
-        token_data = response.json()
-        return token_data.get("access_token")
-    except requests.exceptions.RequestException as e:
+        return token_provider.get_access_token(api_key)
+    except (OSError, ValueError) as e:
         print(f"Error retrieving access token: {e}")
         return None
 
 
-def send_chat_message(token, message_content):
+_session = None
+
+
+def get_session(pool_size=None):
+    """
+    Returns the requests.Session shared by all sends, so keep-alive
+    connections are reused across questions (and across agents in --agents
+    mode). pool_size raises the number of connections kept per host.
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    if pool_size:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=max(10, pool_size))
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def api_base_url(api_host):
+    """
+    Returns the base URL for WXO_API_HOST. A host given with a scheme
+    (e.g. http://127.0.0.1:8080 for a local stand-in) is used as is.
+    """
+    return api_host.rstrip("/") if "://" in api_host else f"https://{api_host}"
+
+
+def send_chat_message(token, message_content, agent_id=None):
     """
-    Sends a chat message to the Watsonx Orchestrate agent.
+    Sends a chat message to the Watsonx Orchestrate agent
+    (agent_id, or WXO_AGENT_ID when not given).
     """
     instance_id = os.getenv("WXO_INSTANCE_ID")
-    agent_id = os.getenv("WXO_AGENT_ID")
+    agent_id = agent_id or os.getenv("WXO_AGENT_ID")
     api_host = os.getenv("WXO_API_HOST", "api.us-south.watson-orchestrate.cloud.ibm.com")
 
     if not instance_id or not agent_id:
         return None, "Error: WXO_INSTANCE_ID or WXO_AGENT_ID is not set."
 
-    url = f"https://{api_host}/instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions"
+    url = f"{api_base_url(api_host)}/instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions"
     
     headers = {
         "Authorization": f"Bearer {token}",
@@ -84,10 +152,20 @@ def send_chat_message(token, message_content):
         "stream": False
     }
 
-    try:
-        response = requests.post(url, headers=headers, json=payload)
+    def send():
+        started_at = time.perf_counter()
+        response = get_session().post(url, headers=headers, json=payload)
+        # requests does not expose DNS/TCP/TLS timings; connection setup is part of WaitTime
+        request_trace.add("WaitTime", response.elapsed.total_seconds())
+        request_trace.add("ReadTime", time.perf_counter() - started_at - response.elapsed.total_seconds())
+        request_trace.add("RequestBytes", len(response.request.body or b""))
+        request_trace.add("ResponseBytes", len(response.content))
         response.raise_for_status()
-        result = response.json()
+        return response
+
+    try:
+        # 429 and transient 5xx / connection errors are retried with backoff
+        result = retry.call(send).json()
         
         # Extract answer from response
         if 'choices' in result and len(result['choices']) > 0:
@@ -99,9 +177,244 @@ def send_chat_message(token, message_content):
         return None, f"Error: {e}"
 
 
-def process_csv(input_file, output_file):
+def send_chat_message_stream(token, message_content, agent_id=None):
+    """
+    Sends a chat message with "stream": True and assembles the answer from
+    the server-sent events as they arrive.
+    Returns (answer, error, timings) where timings holds TimeToFirstToken
+    and TotalTime in seconds.
+    """
+    instance_id = os.getenv("WXO_INSTANCE_ID")
+    agent_id = agent_id or os.getenv("WXO_AGENT_ID")
+    api_host = os.getenv("WXO_API_HOST", "api.us-south.watson-orchestrate.cloud.ibm.com")
+
+    if not instance_id or not agent_id:
+        return None, "Error: WXO_INSTANCE_ID or WXO_AGENT_ID is not set.", {}
+
+    url = f"{api_base_url(api_host)}/instances/{instance_id}/v1/orchestrate/{agent_id}/chat/completions"
+    
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    
+    payload = {
+        "messages": [
+            {
+                "role": "user",
+                "content": message_content
+            }
+        ],
+        "stream": True
+    }
+
+    started_at = None
+
+    def send():
+        # Timings start at the attempt that succeeds, not before the retries
+        nonlocal started_at
+        started_at = time.perf_counter()
+        response = get_session().post(url, headers=headers, json=payload, stream=True)
+        request_trace.add("WaitTime", response.elapsed.total_seconds())
+        request_trace.add("RequestBytes", len(response.request.body or b""))
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            response.close()
+            raise
+        return response
+
+    try:
+        with retry.call(send) as response:
+            # The server may ignore "stream" and answer with plain JSON
+            if "json" in response.headers.get("Content-Type", ""):
+                result = response.json()
+                elapsed = round(time.perf_counter() - started_at, 3)
+                request_trace.add("ReadTime", elapsed - response.elapsed.total_seconds())
+                request_trace.add("ResponseBytes", len(response.content))
+                timings = {"TimeToFirstToken": elapsed, "TotalTime": elapsed}
+                if 'choices' in result and len(result['choices']) > 0:
+                    return result['choices'][0]['message']['content'], None, timings
+                return str(result), None, timings
+            
+            # text/event-stream has no charset, so requests would assume latin-1
+            response.encoding = "utf-8"
+            lines = response.iter_lines(decode_unicode=True)
+            if request_trace.active():
+                lines = _count_bytes(lines)
+            answer, timings = collect_stream(lines, started_at)
+            request_trace.add("ReadTime", timings["TotalTime"] - response.elapsed.total_seconds())
+            return answer, None, timings
+            
+    except requests.exceptions.RequestException as e:
+        return None, f"Error: {e}", {}
+
+
+def _count_bytes(lines):
+    # Adds the size of each received line (plus its newline) to ResponseBytes
+    for line in lines:
+        request_trace.add("ResponseBytes", len(line.encode("utf-8")) + 1)
+        yield line
+
+
+def process_question(question, stream=False, cache=None, refresh=False, trace=False, agent_id=None):
+    """
+    Sends a single question (to agent_id, or WXO_AGENT_ID) and returns its result row.
+    With stream=True the row also carries the TIMING_COLUMNS, and with
+    trace=True the request_trace.COLUMNS (latency breakdown and sizes).
+    When a ResponseCache is given, a cached answer is returned without
+    calling the agent (unless refresh=True) and new answers are stored.
+    """
+    if not trace:
+        return answer_question(question, stream, cache, refresh, agent_id)
+    request_trace.start()
+    try:
+        row = answer_question(question, stream, cache, refresh, agent_id)
+    finally:
+        breakdown = request_trace.finish()
+    return {**row, **breakdown}
+
+
+def cached_answer(question, cache, agent_id=None):
+    """
+    Returns the result row for a question answered from the cache, or None
+    when the question is empty or not cached.
+    """
+    if not question or not cache:
+        return None
+    answer = cache.get(agent_id or os.getenv("WXO_AGENT_ID"), question)
+    if answer is None:
+        return None
+    return {
+        "Question": question,
+        "Answer": answer,
+        "Status": "Success"
+    }
+
+
+def answer_question(question, stream=False, cache=None, refresh=False, agent_id=None):
+    if not question:
+        return {
+            "Question": "",
+            "Answer": "",
+            "Status": "Skipped"
+        }
+    
+    agent_id = agent_id or os.getenv("WXO_AGENT_ID")
+    if not refresh:
+        row = cached_answer(question, cache, agent_id)
+        if row is not None:
+            return row
+    
+    # Fetched per question so long runs pick up the refreshed token
+    with request_trace.phase("IAMTime"):
+        token = get_access_token()
+    if not token:
+        return {
+            "Question": question,
+            "Answer": "",
+            "Status": "Error: failed to retrieve access token"
+        }
+    
+    if stream:
+        answer, error, timings = send_chat_message_stream(token, question, agent_id)
+    else:
+        answer, error = send_chat_message(token, question, agent_id)
+        timings = {}
+    
+    if error:
+        return {
+            "Question": question,
+            "Answer": "",
+            "Status": error,
+            **timings
+        }
+    if cache:
+        cache.put(agent_id, question, answer)
+    return {
+        "Question": question,
+        "Answer": answer,
+        "Status": "Success",
+        **timings
+    }
+
+
+def open_questions(input_file, question_column=None):
+    """
+    Opens the input (CSV, JSON Lines, or "-" for stdin) as a QuestionSource
+    that yields (question text, metadata) one row at a time, or returns
+    None (after printing the reason) when it cannot be read.
+    """
+    try:
+        source = QuestionSource(input_file, question_column).open()
+    except FileNotFoundError:
+        print(f"Error: Input file '{input_file}' not found.")
+        return None
+    except Exception as e:
+        print(f"Error reading input file: {e}")
+        return None
+    
+    if source.question_column in QUESTION_COLUMNS or question_column:
+        print(f"Using column '{source.question_column}' for questions ({source.format}).")
+    else:
+        print(f"Using first column '{source.question_column}' as question column ({source.format}).")
+    if source.columns:
+        print(f"Passing through columns: {', '.join(source.columns)}")
+    return source
+
+
+def read_questions(input_file, question_column=None):
     """
-    Reads questions from input CSV and writes results to output CSV.
+    Reads the whole input and returns a list of (question text, metadata)
+    pairs, or None (after printing the reason) when there is nothing to send.
+    """
+    source = open_questions(input_file, question_column)
+    if source is None:
+        return None
+    try:
+        with source:
+            questions = list(source)
+    except Exception as e:
+        print(f"Error reading input file: {e}")
+        return None
+    
+    if not questions:
+        print("No questions found in input file.")
+        return None
+    
+    print(f"Found {len(questions)} questions.")
+    print("-" * 50)
+    return questions
+
+
+def process_csv(input_file, output_file, concurrency=1, rps=None, stream=False, resume=False,
+                cache=None, refresh=False, trace=False, adaptive=True, question_column=None, history=None):
+    """
+    Reads questions from the input and writes results to output CSV.
+    The input (CSV, JSON Lines, or "-" for stdin; see question_source) is
+    read one row at a time, only as fast as workers free up, so memory
+    stays flat for inputs of any size. Input columns other than the
+    question (model answer, required words, category, ...) are copied to
+    the output after the result columns.
+    Questions are sent concurrently (up to `concurrency` in flight and at
+    most `rps` requests per second); results keep the input order.
+    With stream=True answers are streamed and timing columns are added.
+    With resume=True rows already answered in an existing output file are
+    kept and only missing or failed questions are sent.
+    With a ResponseCache, a question that is already in flight is not sent
+    again (its rows get the same answer) and answers are served from /
+    stored in the cache (see process_question).
+    With trace=True the latency breakdown columns are added (left blank on
+    deduplicated rows, which sent no request) and a summary with histograms
+    is written to <output>_trace.json.
+    With adaptive=True the number of questions in flight is lowered when
+    the agent answers 429 and raised back towards `concurrency` once the
+    throttling clears (see dispatch.AIMDController).
+    With a RunHistory, every output row (with the latency of the request
+    that answered it) is recorded as a new run (see run_history). Rows
+    answered from the cache are recorded without a latency, so they do not
+    pull down the latency trend.
     """
     print(f"Input file: {input_file}")
     print(f"Output file: {output_file}")
@@ -109,102 +422,323 @@ def process_csv(input_file, output_file):
     
     # 1. Get Access Token
     print("Retrieving access token...")
-    token = get_access_token()
-    if not token:
+    if not get_access_token():
         print("Failed to authenticate. Exiting.")
         return False
     print("Access token retrieved successfully.")
     print("-" * 50)
     
-    # 2. Read input CSV
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            questions = list(reader)
-    except FileNotFoundError:
-        print(f"Error: Input file '{input_file}' not found.")
+    # 2. Open the input (rows are read while the questions are sent)
+    source = open_questions(input_file, question_column)
+    if source is None:
         return False
+    print("-" * 50)
+    get_session(concurrency)
+    
+    # 3. Process each question
+    # Results are written (and flushed) as soon as they can be placed in
+    # input order, so a crash keeps everything finished so far.
+    columns = (["Question", "Answer", "Status"] + (TIMING_COLUMNS if stream else [])
+               + (request_trace.COLUMNS if trace else []))
+    metadata_columns = [name for name in source.columns if name not in columns]
+    fieldnames = columns + metadata_columns
+    summary = request_trace.TraceSummary() if trace else None
+    
+    previous = move_previous(output_file) if resume else None
+    if previous:
+        print(f"Resuming: answered questions are kept from {previous}.")
+    earlier = previous_rows(previous) if previous else iter(())
+    
+    try:
+        writer = OrderedCSVWriter(output_file, fieldnames, previous=previous)
     except Exception as e:
+        print(f"Error writing output file: {e}")
+        source.close()
+        return False
+    
+    agent_id = os.getenv("WXO_AGENT_ID")
+    sending = {}    # index -> (question, metadata) of the rows being sent
+    in_flight = {}  # cache key -> rows waiting for the answer to the same question
+    keys = {}       # index -> cache key of the rows being sent
+    counts = {"rows": 0, "kept": 0, "deduplicated": 0}
+    run_id = history.start_run(agent_id, input_file, output_file, {
+        "concurrency": concurrency, "rps": rps, "stream": stream, "resume": resume,
+        "cache": bool(cache), "refresh": refresh
+    }) if history else None
+
+    def add(idx, row, latency=None):
+        writer.add(idx, row)
+        if history:
+            history.record(run_id, idx, row, latency, agent_id)
+
+    def items():
+        # run_dispatch pulls the next row only when a worker is free
+        for idx, (question, metadata) in enumerate(source):
+            counts["rows"] = idx + 1
+            metadata = {name: metadata[name] for name in metadata_columns}
+            before = next(earlier, None)
+            if is_done(before, question):
+                add(idx, {**{name: before.get(name) or "" for name in columns}, **metadata})
+                counts["kept"] += 1
+                continue
+            key = cache_key(agent_id, question) if cache and question else None
+            if key in in_flight:
+                in_flight[key].append((idx, question, metadata))
+                counts["deduplicated"] += 1
+                continue
+            if key:
+                in_flight[key] = []
+                keys[idx] = key
+            sending[idx] = (question, metadata)
+            yield idx
+
+    def worker(_, idx):
+        question = sending[idx][0]
+        if question:
+            print(f"[{idx + 1}] Processing: {question[:50]}...")
+        # A cached answer is not a request, so it has no latency (and no trace columns)
+        result = None if refresh else cached_answer(question, cache, agent_id)
+        if result is not None:
+            return idx, result, None
+        started_at = time.perf_counter()
+        result = process_question(question, stream, cache, True, trace)
+        return idx, result, round(time.perf_counter() - started_at, 3) if question else None
+
+    if concurrency > 1 or rps:
+        print(f"Concurrency: {concurrency}, RPS limit: {rps or 'none'}")
+
+    def on_result(_, item):
+        idx, result, latency = item
+        _, metadata = sending.pop(idx)
+        if result["Status"] == "Skipped":
+            print(f"[{idx + 1}] Skipping empty question.")
+        elif result["Status"] == "Success":
+            print(f"[{idx + 1}]  -> OK")
+        else:
+            print(f"[{idx + 1}]  -> Error: {result['Status']}")
+        add(idx, {**result, **metadata}, latency)
+        if summary and result["Status"] != "Skipped":
+            summary.add(result)
+        # Repeated questions get the answer but not the trace columns: no request was sent for them
+        copied = {**result, **dict.fromkeys(request_trace.COLUMNS, "")} if trace else result
+        for duplicate, question, duplicate_metadata in in_flight.pop(keys.pop(idx, None), ()):
+            add(duplicate, {**copied, "Question": question, **duplicate_metadata})
+
+    controller = AIMDController(concurrency) if adaptive else None
+    try:
+        with source, writer:
+            run_dispatch(items(), worker, concurrency=concurrency, rps=rps, on_result=on_result, collect=False,
+                         controller=controller)
+            writer.total = counts["rows"]
+    except (OSError, ValueError, csv.Error) as e:
         print(f"Error reading input file: {e}")
         return False
+    finally:
+        if history:
+            history.finish_run(run_id)
     
-    if not questions:
+    print("-" * 50)
+    if not counts["rows"]:
         print("No questions found in input file.")
         return False
+    print(f"Processed {counts['rows']} questions"
+          + (f" ({counts['kept']} kept from the previous run)" if previous else ""))
+    if counts["deduplicated"]:
+        print(f"Deduplicated {counts['deduplicated']} repeated questions.")
+    if controller and controller.throttled:
+        print(f"Throttled: {controller.throttled} responses with 429, "
+              f"concurrency lowered to {controller.lowest} at the lowest (now {controller.limit})")
+    if cache:
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses")
+    if history:
+        print(f"Run history: recorded as run {run_id} in {history.path}")
+    if summary:
+        summary_file = f"{os.path.splitext(output_file)[0]}_trace.json"
+        with open(summary_file, "w", encoding="utf-8") as f:
+            json.dump(summary.to_dict(), f, indent=2, ensure_ascii=False)
+        print(f"Latency breakdown saved to {summary_file}")
+    print(f"Done! Results saved to {output_file}")
+    return True
+
+
+def ab_columns(labels, stream=False):
+    """
+    Returns the columns of the --agents comparison file: the input's
+    scoring columns, then answer/status/latency/score per agent label,
+    then the deltas of every other agent against the first (baseline).
+    """
+    columns = ["Question", scoring.MODEL_ANSWER_COLUMN] + scoring.KEYWORD_COLUMNS
+    per_agent = ["Answer", "Status", "Latency"] + (TIMING_COLUMNS if stream else []) + ["検索結果", "類似度"]
+    for label in labels:
+        columns += [f"{label}:{name}" for name in per_agent]
+    for label in labels[1:]:
+        columns += [f"{label}-{labels[0]}:{name}" for name in ("類似度差", "必須単語差", "Latency差")]
+    return columns
+
+
+def _delta(value, base):
+    # Difference of two numeric cells ("" when either is empty)
+    return round(value - base, 4) if "" not in (value, base) else ""
+
+
+def process_ab(input_file, output_file, agent_ids, concurrency=1, rps=None, stream=False,
+               cache=None, adaptive=True, question_column=None, history=None):
+    """
+    Sends every question to each agent in agent_ids in a single run and
+    writes one wide CSV with the answers, latencies and scores side by side
+    (see ab_columns), plus per-agent statistics in <output>_ab.json.
+    Requests for all agents share the access token and the connection pool
+    and are interleaved question by question (the agent order rotates per
+    question), so every agent sees the same load. `concurrency` and `rps`
+    apply per agent (N agents run with N times as many requests in flight),
+    so the run takes about as long as a single-agent run. Cached answers
+    are never served (the cache is only updated), so every agent is
+    actually asked.
+    With a RunHistory, each agent's answers are recorded as a run of their own.
+    """
+    labels = [chr(ord("A") + i) for i in range(len(agent_ids))]
+    print(f"Input file: {input_file}")
+    print(f"Output file: {output_file}")
+    for label, agent_id in zip(labels, agent_ids):
+        print(f"Agent {label}: {agent_id}")
+    print("-" * 50)
     
-    print(f"Found {len(questions)} questions.")
+    print("Retrieving access token...")
+    if not get_access_token():
+        print("Failed to authenticate. Exiting.")
+        return False
+    print("Access token retrieved successfully.")
     print("-" * 50)
     
-    # Determine the question column name
-    # Try common column names
-    question_column = None
-    for col in ['Question', 'question', '質問', 'input', 'Input']:
-        if col in questions[0]:
-            question_column = col
-            break
-    
-    if not question_column:
-        # Use the first column
-        question_column = list(questions[0].keys())[0]
-        print(f"Using first column '{question_column}' as question column.")
-    else:
-        print(f"Using column '{question_column}' for questions.")
+    questions = read_questions(input_file, question_column)
+    if questions is None:
+        return False
+    total = len(questions)
+    agents = len(agent_ids)
+    get_session(concurrency * agents)
     
-    # 3. Process each question
-    results = []
-    for idx, row in enumerate(questions, 1):
-        question = row.get(question_column, "").strip()
-        
-        if not question:
-            print(f"[{idx}/{len(questions)}] Skipping empty question.")
-            results.append({
-                "Question": "",
-                "Answer": "",
-                "Status": "Skipped"
-            })
-            continue
-        
-        print(f"[{idx}/{len(questions)}] Processing: {question[:50]}...")
-        
-        answer, error = send_chat_message(token, question)
-        
-        if error:
-            print(f"  -> Error: {error}")
-            results.append({
-                "Question": question,
-                "Answer": "",
-                "Status": error
-            })
-        else:
-            print(f"  -> OK")
-            results.append({
-                "Question": question,
-                "Answer": answer,
-                "Status": "Success"
+    # Question 0 goes A, B, C; question 1 goes B, C, A; ... so no agent is always first
+    items = [(idx, (idx + offset) % agents) for idx in range(total) for offset in range(agents)]
+    results = [[None] * agents for _ in range(total)]
+
+    def worker(_, item):
+        idx, agent = item
+        started_at = time.perf_counter()
+        row = process_question(questions[idx][0], stream, cache, True, agent_id=agent_ids[agent])
+        row["Latency"] = round(time.perf_counter() - started_at, 3) if row["Status"] != "Skipped" else ""
+        return row
+
+    def on_result(position, row):
+        idx, agent = items[position]
+        results[idx][agent] = row
+        if row["Status"] not in ("Success", "Skipped"):
+            print(f"[{idx + 1}/{total}] {labels[agent]} -> Error: {row['Status']}")
+        elif all(results[idx]):
+            print(f"[{idx + 1}/{total}]  -> OK")
+
+    if concurrency > 1 or rps:
+        print(f"Concurrency: {concurrency} per agent, RPS limit: {rps or 'none'} per agent")
+    controller = AIMDController(concurrency * agents) if adaptive else None
+    started_at = time.perf_counter()
+    run_dispatch(items, worker, concurrency=concurrency * agents, rps=rps * agents if rps else None,
+                 on_result=on_result, collect=False, controller=controller)
+    wall_time = time.perf_counter() - started_at
+    
+    run_ids = []
+    if history:
+        for agent, (label, agent_id) in enumerate(zip(labels, agent_ids)):
+            run_id = history.start_run(agent_id, input_file, output_file, {
+                "agents": agent_ids, "label": label, "concurrency": concurrency, "rps": rps, "stream": stream
             })
+            for idx in range(total):
+                row = results[idx][agent]
+                history.record(run_id, idx, row, row["Latency"] if row["Latency"] != "" else None, agent_id)
+            history.finish_run(run_id)
+            run_ids.append(str(run_id))
     
-    # 4. Write output CSV
-    print("-" * 50)
-    print(f"Writing results to {output_file}...")
+    # Score every agent's answers together so the TF-IDF weights are shared
+    inputs = [row for _, row in questions]
+    models = [(row.get(scoring.MODEL_ANSWER_COLUMN) or "").strip() for row in inputs]
+    keywords = [[(row.get(column) or "").strip() for column in scoring.KEYWORD_COLUMNS] for row in inputs]
+    answers = [results[idx][agent]["Answer"] or "" for agent in range(agents) for idx in range(total)]
+    similarities = scoring.similarities(answers, models * agents)
+    
+    rows = []
+    stats = []
+    for idx in range(total):
+        row = {"Question": questions[idx][0], scoring.MODEL_ANSWER_COLUMN: models[idx],
+               **dict(zip(scoring.KEYWORD_COLUMNS, keywords[idx]))}
+        hits = []
+        for agent, label in enumerate(labels):
+            result = results[idx][agent]
+            marks = scoring.keyword_marks(result["Answer"] or "", keywords[idx])
+            similarity = similarities[agent * total + idx]
+            hits.append(marks.count("〇"))
+            row.update({f"{label}:{name}": result.get(name, "") for name in ["Answer", "Status", "Latency"] + TIMING_COLUMNS})
+            row[f"{label}:検索結果"] = ",".join(marks)
+            row[f"{label}:類似度"] = "" if similarity is None else round(similarity, 4)
+        base = labels[0]
+        for agent, label in enumerate(labels[1:], start=1):
+            row[f"{label}-{base}:類似度差"] = _delta(row[f"{label}:類似度"], row[f"{base}:類似度"])
+            row[f"{label}-{base}:必須単語差"] = hits[agent] - hits[0] if any(keywords[idx]) else ""
+            row[f"{label}-{base}:Latency差"] = _delta(row[f"{label}:Latency"], row[f"{base}:Latency"])
+        rows.append(row)
+    
+    for agent, (label, agent_id) in enumerate(zip(labels, agent_ids)):
+        answered = [results[idx][agent] for idx in range(total) if results[idx][agent]["Status"] != "Skipped"]
+        latencies = sorted(row["Latency"] for row in answered)
+        scores = [rows[idx][f"{label}:類似度"] for idx in range(total) if rows[idx][f"{label}:類似度"] != ""]
+        checked = [rows[idx][f"{label}:検索結果"].split(",") for idx in range(total) if any(keywords[idx])]
+        marks = [mark for row_marks in checked for mark in row_marks if mark != "-"]
+        stats.append({
+            "label": label,
+            "agent_id": agent_id,
+            "questions": len(answered),
+            "errors": sum(1 for row in answered if row["Status"] != "Success"),
+            "latency_sec": {
+                "p50": request_trace.percentile(latencies, 50),
+                "p95": request_trace.percentile(latencies, 95),
+                "mean": round(sum(latencies) / len(latencies), 3) if latencies else None
+            },
+            "mean_similarity": round(sum(scores) / len(scores), 4) if scores else None,
+            "keyword_hit_rate": round(marks.count("〇") / len(marks), 4) if marks else None
+        })
     
     try:
-        with open(output_file, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(
-                f,
-                fieldnames=["Question", "Answer", "Status"],
-                quoting=csv.QUOTE_ALL,
-                # doublequote=True,
-                lineterminator='\r\n', # 行終端文字
-                extrasaction='raise', # 余分なフィールドがあればエラー
-                strict=True # 不正なcsvはエラー
-            )
+        with open(output_file, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=ab_columns(labels, stream), extrasaction="ignore",
+                                    **CSV_OPTIONS)
             writer.writeheader()
-            writer.writerows(results)
-        print(f"Done! Results saved to {output_file}")
-        return True
-    except Exception as e:
+            writer.writerows(rows)
+        summary_file = f"{os.path.splitext(output_file)[0]}_ab.json"
+        with open(summary_file, "w", encoding="utf-8") as f:
+            json.dump({"wall_time_sec": round(wall_time, 3), "agents": stats}, f, indent=2, ensure_ascii=False)
+    except OSError as e:
         print(f"Error writing output file: {e}")
         return False
+    
+    print("-" * 50)
+    for stat in stats:
+        print(f"{stat['label']}: {stat['questions'] - stat['errors']}/{stat['questions']} OK, "
+              f"p50 {stat['latency_sec']['p50']}s, similarity {stat['mean_similarity']}, "
+              f"keyword hits {stat['keyword_hit_rate']}")
+    if controller and controller.throttled:
+        print(f"Throttled: {controller.throttled} responses with 429, "
+              f"concurrency lowered to {controller.lowest} at the lowest (now {controller.limit})")
+    if history:
+        print(f"Run history: recorded as runs {', '.join(run_ids)} in {history.path}")
+    print(f"Done in {wall_time:.1f}s! Comparison saved to {output_file} (statistics in {summary_file})")
+    return True
+
+
+def latest_results():
+    """
+    Returns the newest results_<timestamp>.csv in the current directory
+    (including one only left as .prev by an interrupted resume), or None.
+    """
+    pattern = "results_????????_??????.csv"
+    names = [name.removesuffix(".prev") for name in glob.glob(pattern) + glob.glob(pattern + ".prev")]
+    return max(names, default=None)
 
 
 def main():
@@ -215,14 +749,53 @@ def main():
     default_input = "questions.csv"
     default_output = "results.csv"
     
-    if len(sys.argv) >= 3:
-        input_file = sys.argv[1]
-        output_file = sys.argv[2]
-    elif len(sys.argv) == 2:
-        input_file = sys.argv[1]
-        # Generate output filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"results_{timestamp}.csv"
+    parser = argparse.ArgumentParser(description="WXO Test Automation")
+    parser.add_argument("input_file", nargs="?",
+                        help="input CSV, JSON Lines (.jsonl) or - for stdin (default: questions.csv)")
+    parser.add_argument("output_file", nargs="?", help="output CSV (default: results.csv)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="number of questions in flight at once (default: 1)")
+    parser.add_argument("--rps", type=float, default=None,
+                        help="maximum requests per second (default: unlimited)")
+    parser.add_argument("--token-cache", metavar="FILE", default=None,
+                        help="cache the IAM access token in FILE across runs")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream answers (SSE) and record time-to-first-token")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep answered rows of an existing output file and send only missing or failed questions "
+             "(without an output file, the newest results_<timestamp>.csv)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not use the response cache or deduplicate questions")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ignore cached answers but store the new ones")
+    parser.add_argument("--trace", action="store_true",
+                        help="add latency breakdown columns and write a summary to <output>_trace.json")
+    parser.add_argument("--score", action="store_true",
+                        help="score answers against 必須単語1-3 / 模範解答 and write <output>_scored.csv")
+    parser.add_argument("--agents", metavar="ID,ID,...",
+                        help="compare agents: send every question to each agent id and write one wide CSV")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="keep --concurrency fixed instead of lowering it while the agent answers 429")
+    parser.add_argument("--question-column", metavar="NAME", default=None,
+                        help="input column / JSON key holding the question (default: Question, 質問, ... or the first)")
+    parser.add_argument("--history", metavar="FILE", default=None,
+                        help="run history database (default: WXO_RUN_HISTORY or wxo_run_history.db)")
+    parser.add_argument("--no-history", action="store_true", help="do not record this run in the run history")
+    args = parser.parse_args()
+    
+    if args.token_cache:
+        os.environ["IAM_TOKEN_CACHE"] = args.token_cache
+    
+    if args.input_file and args.output_file:
+        input_file = args.input_file
+        output_file = args.output_file
+    elif args.input_file:
+        input_file = args.input_file
+        # Generate output filename with timestamp (--resume continues the newest one instead)
+        output_file = latest_results() if args.resume else None
+        if output_file is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_file = f"results_{timestamp}.csv"
     else:
         input_file = default_input
         output_file = default_output
@@ -231,7 +804,35 @@ def main():
     print("WXO Test Automation")
     print("=" * 50)
     
-    success = process_csv(input_file, output_file)
+    agent_ids = [agent_id.strip() for agent_id in (args.agents or "").split(",") if agent_id.strip()]
+    if args.agents and (len(agent_ids) < 2 or args.resume or args.trace or args.score):
+        print("Error: --agents needs at least two agent ids and cannot be combined with --resume / --trace / --score.")
+        sys.exit(1)
+    
+    cache = None if args.no_cache else open_cache()
+    history = None if args.no_history else open_history(args.history)
+    try:
+        if agent_ids:
+            success = process_ab(input_file, output_file, agent_ids, args.concurrency, args.rps, args.stream,
+                                 cache, not args.fixed_concurrency, args.question_column, history)
+        else:
+            success = process_csv(input_file, output_file, args.concurrency, args.rps, args.stream, args.resume,
+                                  cache, args.refresh, args.trace, not args.fixed_concurrency, args.question_column,
+                                  history)
+    finally:
+        if cache:
+            cache.close()
+        if history:
+            history.close()
+    
+    if success and args.score:
+        try:
+            # 模範解答 / 必須単語 are passed through to the output, so the input is not read again
+            scored_file = scoring.score_files(output_file, output_file)
+            print(f"Scored results saved to {scored_file}")
+        except (OSError, ValueError) as e:
+            print(f"Error scoring results: {e}")
+            success = False
     
     if success:
         print("=" * 50)
@@ -130,64 +130,84 @@ async function main(workbook: ExcelScript.Workbook) {
     }
 
     // ===============================================================
-    // Code Engine に送信
+    // Code Engine に送信 (非同期ジョブとして登録し、結果をポーリングで受け取る)
+    // 関数のタイムアウトを超える大量の質問でも、届いた結果から順に書き込みます。
     // ===============================================================
     try {
         const questions = questionDataList.map(qd => qd.question);
 
-        const response = await fetch(codeEngineUrl, {
+        const submitResponse = await fetch(codeEngineUrl, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ agent_id: agentId, questions: questions })
+            body: JSON.stringify({ agent_id: agentId, questions: questions, async: true, concurrency: 8 })
         });
 
-        if (!response.ok) {
-            const errorText = await response.text();
-            console.log(`エラー: ${response.status} - ${errorText}`);
+        if (!submitResponse.ok) {
+            const errorText = await submitResponse.text();
+            console.log(`エラー: ${submitResponse.status} - ${errorText}`);
             for (let i = 0; i < questionDataList.length; i++) {
-                outputSheet.getCell(i + 1, 2).setValue(`Error: ${response.status}`);
+                outputSheet.getCell(i + 1, 2).setValue(`Error: ${submitResponse.status}`);
             }
             return;
         }
 
-        // CSVレスポンスの取得
-        const csvText = await response.text();
-        const results = parseCSV(csvText);
-
-        console.log(`${results.length} 件の結果を受信しました。`);
+        const job: { job_id: string } = await submitResponse.json();
+        console.log(`ジョブを登録しました (job_id: ${job.job_id})。`);
 
         // ===============================================================
-        // 結果をExcelに書き込み
+        // 進捗のポーリングと結果の書き込み
+        // wait 秒までサーバー側で新しい結果を待つため、待機処理は不要です。
         // ===============================================================
-        for (let i = 0; i < results.length && i < questionDataList.length; i++) {
-            const result = results[i];
-            const qd = questionDataList[i];
-            const rowIdx = i + 1;
-            const wxoAnswer = result.Answer || "";
-
-            // WXO回答を書き込み (C列)
-            outputSheet.getCell(rowIdx, 2).setValue(wxoAnswer);
-
-            // 必須単語検索の実行
-            const searchResults: string[] = [];
-            const keywords = [qd.keyword1, qd.keyword2, qd.keyword3];
-
-            for (const keyword of keywords) {
-                if (!keyword) {
-                    searchResults.push("-");
-                } else if (wxoAnswer.includes(keyword)) {
-                    searchResults.push("〇");
-                } else {
-                    searchResults.push("×");
+        let since = 0;
+        let received = 0;
+        let failures = 0;
+        while (true) {
+            let progress: JobProgress;
+            try {
+                const pollResponse = await fetch(codeEngineUrl, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({ job_id: job.job_id, since: since, wait: 20 })
+                });
+                if (!pollResponse.ok) {
+                    throw new Error(`${pollResponse.status} - ${await pollResponse.text()}`);
+                }
+                progress = await pollResponse.json();
+                failures = 0;
+            } catch (error) {
+                // 一時的なエラーは続けて 5 回まで再試行する
+                failures++;
+                console.log(`ポーリングエラー (${failures}/5): ${error}`);
+                if (failures >= 5) {
+                    throw error;
+                }
+                continue;
+            }
+
+            for (const result of progress.results) {
+                if (result.index < questionDataList.length) {
+                    writeResult(outputSheet, questionDataList[result.index], result.index + 1, result.Answer || "");
+                    received++;
                 }
             }
+            since = progress.next;
+            console.log(`進捗: ${progress.completed}/${progress.total}`);
 
-            // 検索結果を書き込み (G列)
-            outputSheet.getCell(rowIdx, 6).setValue(searchResults.join(","));
+            if (progress.status === "completed") {
+                break;
+            }
+            if (progress.status === "failed") {
+                console.log(`ジョブが失敗しました: ${progress.error}`);
+                break;
+            }
         }
 
+        console.log(`${received} 件の結果を受信しました。`);
+
         // オートフィルター適用
         const outputUsedRange = outputSheet.getUsedRange();
         if (outputUsedRange) {
@@ -199,83 +219,49 @@ async function main(workbook: ExcelScript.Workbook) {
     } catch (error) {
         console.log(`通信エラー: ${error}`);
         for (let i = 0; i < questionDataList.length; i++) {
-            outputSheet.getCell(i + 1, 2).setValue(`Error: ${error}`);
+            const cell = outputSheet.getCell(i + 1, 2);
+            if (cell.getValue() === "処理中...") {
+                cell.setValue(`Error: ${error}`);
+            }
         }
     }
 }
 
+interface JobProgress {
+    status: string;
+    error: string | null;
+    total: number;
+    completed: number;
+    results: Array<{ index: number; Question: string; Answer: string; Status: string }>;
+    next: number;
+}
+
 /**
- * CSVテキストをパースして配列に変換します。
- * ダブルクォートで囲まれたフィールド内の改行に対応しています。
+ * 1件の結果を出力シートに書き込み、必須単語の検索結果を設定します。
  */
-function parseCSV(csvText: string): Array<{ Question: string; Answer: string; Status: string }> {
-    const results: Array<{ Question: string; Answer: string; Status: string }> = [];
-
-    // BOMを除去
-    if (csvText.charCodeAt(0) === 0xFEFF) {
-        csvText = csvText.substring(1);
-    }
-
-    // CSVパース（ダブルクォート内の改行に対応）
-    const rows: string[][] = [];
-    let currentRow: string[] = [];
-    let currentField = "";
-    let inQuotes = false;
-
-    for (let i = 0; i < csvText.length; i++) {
-        const char = csvText[i];
-        const nextChar = csvText[i + 1];
-
-        if (inQuotes) {
-            if (char === '"') {
-                if (nextChar === '"') {
-                    currentField += '"';
-                    i++;
-                } else {
-                    inQuotes = false;
-                }
-            } else {
-                currentField += char;
-            }
+function writeResult(
+    outputSheet: ExcelScript.Worksheet,
+    qd: { keyword1: string; keyword2: string; keyword3: string },
+    rowIdx: number,
+    wxoAnswer: string
+) {
+    // WXO回答を書き込み (C列)
+    outputSheet.getCell(rowIdx, 2).setValue(wxoAnswer);
+
+    // 必須単語検索の実行
+    const searchResults: string[] = [];
+    const keywords = [qd.keyword1, qd.keyword2, qd.keyword3];
+
+    for (const keyword of keywords) {
+        if (!keyword) {
+            searchResults.push("-");
+        } else if (wxoAnswer.includes(keyword)) {
+            searchResults.push("〇");
         } else {
-            if (char === '"') {
-                inQuotes = true;
-            } else if (char === ',') {
-                currentRow.push(currentField);
-                currentField = "";
-            } else if (char === '\r' && nextChar === '\n') {
-                currentRow.push(currentField);
-                currentField = "";
-                rows.push(currentRow);
-                currentRow = [];
-                i++;
-            } else if (char === '\n') {
-                currentRow.push(currentField);
-                currentField = "";
-                rows.push(currentRow);
-                currentRow = [];
-            } else {
-                currentField += char;
-            }
-        }
-    }
-
-    if (currentField || currentRow.length > 0) {
-        currentRow.push(currentField);
-        rows.push(currentRow);
-    }
-
-    // ヘッダー行をスキップしてデータを取得
-    for (let i = 1; i < rows.length; i++) {
-        const row = rows[i];
-        if (row.length >= 3) {
-            results.push({
-                Question: row[0] || "",
-                Answer: row[1] || "",
-                Status: row[2] || ""
-            });
+            searchResults.push("×");
         }
     }
 
-    return results;
+    // 検索結果を書き込み (G列)
+    outputSheet.getCell(rowIdx, 6).setValue(searchResults.join(","));
 }